@@ -0,0 +1,149 @@
+# activity.py
+# Отложенная запись TelegramUser.last_activity: отметки копятся в памяти
+# и сбрасываются в БД одним bulk_update раз в N секунд или по M записей
+
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityTracker:
+    """Буфер последней активности пользователей.
+
+    flush_interval — максимум секунд, которые отметка ждёт записи в БД
+    flush_size     — при стольких пользователях в буфере запись делается сразу
+    Для одного пользователя хранится только самая поздняя отметка.
+    """
+
+    def __init__(self, flush_interval: float = 10.0, flush_size: int = 500):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._pending: Dict[int, datetime] = {}    # id TelegramUser -> время активности
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.running = False
+
+        # Статистика
+        self.recorded_total = 0
+        self.flushes_total = 0
+        self.rows_written_total = 0
+        self.errors_total = 0
+
+    def start(self) -> 'ActivityTracker':
+        """Запустить фоновый поток периодической записи"""
+        if self.running:
+            return self
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name='activity-flush', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Остановить поток и записать всё, что осталось в буфере"""
+        self.running = False
+        self._wakeup.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self._thread = None
+        self.flush()
+
+    def record(self, user_id: int, when: datetime = None):
+        """Отметить активность пользователя (без обращения к БД)"""
+        when = when or timezone.now()
+        with self._lock:
+            previous = self._pending.get(user_id)
+            if previous is None or previous < when:
+                self._pending[user_id] = when
+            self.recorded_total += 1
+            full = len(self._pending) >= self.flush_size
+        if full:
+            if self.running:
+                self._wakeup.set()
+            else:
+                self.flush()
+
+    def flush(self) -> int:
+        """Записать накопленные отметки одним bulk_update; возвращает число строк"""
+        from .models import TelegramUser
+
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                pending, self._pending = self._pending, {}
+
+            users = [TelegramUser(pk=user_id, last_activity=when) for user_id, when in pending.items()]
+            try:
+                TelegramUser.objects.bulk_update(users, ['last_activity'], batch_size=500)
+            except Exception as e:
+                logger.error(f"Error flushing user activity: {e}")
+                self.errors_total += 1
+                # Возвращаем отметки в буфер, если их не перекрыли более новые
+                with self._lock:
+                    for user_id, when in pending.items():
+                        if user_id not in self._pending or self._pending[user_id] < when:
+                            self._pending[user_id] = when
+                return 0
+
+            self.flushes_total += 1
+            self.rows_written_total += len(users)
+            return len(users)
+
+    def _run(self):
+        while self.running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                # У фонового потока своё соединение с БД — не держим его открытым зря
+                close_old_connections()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'running': self.running,
+            'pending': pending,
+            'flush_interval': self.flush_interval,
+            'flush_size': self.flush_size,
+            'recorded_total': self.recorded_total,
+            'flushes_total': self.flushes_total,
+            'rows_written_total': self.rows_written_total,
+            'errors_total': self.errors_total,
+        }
+
+
+_tracker: Optional[ActivityTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_activity_tracker() -> ActivityTracker:
+    """Общий для процесса трекер (создаётся и запускается при первом обращении)"""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                from django.conf import settings
+                _tracker = ActivityTracker(
+                    flush_interval=getattr(settings, 'TELEGRAM_ACTIVITY_FLUSH_INTERVAL', 10.0),
+                    flush_size=getattr(settings, 'TELEGRAM_ACTIVITY_FLUSH_SIZE', 500),
+                ).start()
+                # Не теряем последние отметки при завершении процесса
+                atexit.register(_tracker.stop)
+    return _tracker
+
+
+def flush_activity():
+    """Записать накопленные отметки сейчас (например, при остановке бота)"""
+    if _tracker is not None:
+        _tracker.flush()
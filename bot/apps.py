@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bot'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import checks  # noqa: F401
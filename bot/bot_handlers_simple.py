@@ -4,19 +4,23 @@
 import logging
 from django.utils import timezone
 from bot.bot_manager import BotManager, BotStates, MessageContext, KeyboardBuilder
-from bot.models import TelegramUser, UserState, InfoPage
+from bot.models import TelegramUser, UserState
 from courses.models import Course
 from bot.payment_handlers import (
     setup_payment_handlers, handle_photo_receipt, handle_document_receipt,
     send_payment_result_to_user
 )
 # Kóp tillilik ushın jańa import
-from .translations import get_text
+from .translations import get_text, texts_for
+from . import keyboards
+from .callback_codec import Action, encode
 
 logger = logging.getLogger(__name__)
 
 
 from .utils import get_user_language
+from .catalog import get_catalog
+from .info_pages import get_info_page
 
 # --- TIYKARǴÍ HANDLERLAR ---
 
@@ -72,21 +76,24 @@ def handle_start_command(bot: BotManager, update: dict):
         )
         
         if not created:
-            telegram_user.username = ctx.user.get('username') or telegram_user.username
-            telegram_user.first_name = ctx.user.get('first_name', '') or telegram_user.first_name
-            telegram_user.last_name = ctx.user.get('last_name', '') or telegram_user.last_name
-            telegram_user.save()
+            profile = {
+                'username': ctx.user.get('username') or telegram_user.username,
+                'first_name': ctx.user.get('first_name', '') or telegram_user.first_name,
+                'last_name': ctx.user.get('last_name', '') or telegram_user.last_name,
+            }
+            # Profil ózgermese, bazaǵa jazbaymız
+            changed = [field for field, value in profile.items() if getattr(telegram_user, field) != value]
+            if changed:
+                for field in changed:
+                    setattr(telegram_user, field, profile[field])
+                telegram_user.save(update_fields=changed + ['updated_at'])
         
+        ctx.remember_user(telegram_user)
         telegram_user.update_activity()
         
         # 1. Dáslep tildi tekseriw
         # if not telegram_user.language:
-        buttons = [
-            [{'text': get_text('language_chosen_button', 'qr'), 'callback_data': "set_lang_qr"}],
-            [{'text': get_text('language_chosen_button', 'uz'), 'callback_data': "set_lang_uz"}]
-        ]
-        keyboard = KeyboardBuilder.inline_keyboard(buttons)
-        ctx.reply(get_text('welcome_prompt_language', 'qr'), reply_markup=keyboard)
+        ctx.reply(get_text('welcome_prompt_language', 'qr'), reply_markup=keyboards.language_picker('qr'))
         ctx.set_state(BotStates.WAITING_LANGUAGE) # BotStates-qa qosıwdı umıtpań!
         return
 
@@ -105,28 +112,25 @@ def handle_start_command(bot: BotManager, update: dict):
     
     except Exception as e:
         logger.error(f"Error in start command: {e}")
+        ctx.report_error(e)
         ctx.reply(get_text('error_start_command', 'qr')) # Baslanǵısh qátelik ushın standart til
 
 def handle_language_selection(bot: BotManager, update: dict):
     """Til tańlawdı qayta islew"""
     ctx = MessageContext(bot, update)
     try:
-        lang_code = ctx.callback_data.split('_')[2]
-        if lang_code not in ['qr', 'uz']: return
+        if ctx.callback is None: return
+        lang_code = ctx.callback.lang
 
-        user = TelegramUser.objects.get(chat_id=ctx.chat_id)
+        user = ctx.get_telegram_user()
         user.language = lang_code
-        user.save()
+        user.save(update_fields=['language', 'updated_at'])
         
         ctx.edit_message(get_text('language_selected', lang_code)) # Til tańlaw xabarın óshiriw
         
         # Nomer soraw basqıshına ótiw
         if not user.phone:
-            keyboard = KeyboardBuilder.reply_keyboard(
-                [[{'text': get_text('request_contact_button', lang_code), 'request_contact': True}]], 
-                one_time_keyboard=True
-            )
-            ctx.reply(get_text('welcome_after_lang', lang_code), reply_markup=keyboard)
+            ctx.reply(get_text('welcome_after_lang', lang_code), reply_markup=keyboards.request_contact(lang_code))
             ctx.set_state(BotStates.WAITING_CONTACT)
         else:
             show_main_menu(ctx)
@@ -134,20 +138,21 @@ def handle_language_selection(bot: BotManager, update: dict):
             
     except Exception as e:
         logger.error(f"Error handling language selection: {e}")
+        ctx.report_error(e)
 
 def handle_contact(bot: BotManager, update: dict):
     """Kontakt alıwdı qayta islew"""
     ctx = MessageContext(bot, update)
-    lang = get_user_language(ctx.chat_id)
+    lang = get_user_language(ctx)
     
     try:
         contact = ctx.message.get('contact')
         if contact and contact.get('user_id') == ctx.user.get('id'):
-            user = TelegramUser.objects.get(chat_id=ctx.chat_id)
+            user = ctx.get_telegram_user()
             user.phone = contact.get('phone_number')
             user.first_name = contact.get('first_name') or user.first_name
             user.last_name = contact.get('last_name') or user.last_name
-            user.save()
+            user.save(update_fields=['phone', 'first_name', 'last_name', 'updated_at'])
             
             logger.info(f"Contact received from user {ctx.chat_id}: {user.phone}")
             
@@ -155,14 +160,11 @@ def handle_contact(bot: BotManager, update: dict):
             show_main_menu(ctx)
             ctx.set_state(BotStates.MAIN_MENU)
         else:
-            keyboard = KeyboardBuilder.reply_keyboard(
-                [[get_text('request_contact_button', lang)]], 
-                one_time_keyboard=True
-            )
-            ctx.reply(get_text('error_not_your_contact', lang), reply_markup=keyboard)
+            ctx.reply(get_text('error_not_your_contact', lang), reply_markup=keyboards.request_contact(lang))
     
     except Exception as e:
         logger.error(f"Error handling contact: {e}")
+        ctx.report_error(e)
         ctx.reply(get_text('error_contact_save', lang))
 
 # --- MENYU TÚYME HANDLERLERI ---
@@ -174,71 +176,55 @@ def handle_courses_button(bot: BotManager, update: dict):
 
 def handle_about_button(bot: BotManager, update: dict):
     ctx = MessageContext(bot, update)
-    lang = get_user_language(ctx.chat_id)
-    try:
-        page = InfoPage.objects.get(key="about")
-        # Keleshekte InfoPage modelin de kóp tilli qılıw múmkin (mısalı, content_qr, content_uz)
-        if lang == 'qr':
-            ctx.reply(f"{page.content_qr}", parse_mode='HTML')
-        else:
-            ctx.reply(f"{page.content_uz}", parse_mode='HTML')
-    except InfoPage.DoesNotExist:
-        ctx.reply(get_text('info_not_found', lang))
+    show_info_page(ctx, 'about')
 
 def handle_support_button(bot: BotManager, update: dict):
     ctx = MessageContext(bot, update)
-    lang = get_user_language(ctx.chat_id)
-    try:
-        page = InfoPage.objects.get(key="support")
-        if lang == 'qr':
-            ctx.reply(f"{page.content_qr}", parse_mode='HTML')
-        else:
-            ctx.reply(f"{page.content_uz}", parse_mode='HTML')
-    except InfoPage.DoesNotExist:
-        ctx.reply(get_text('support_info_not_found', lang))
+    show_info_page(ctx, 'support', not_found_text='support_info_not_found')
 
 # --- KURSLAR MENEN ISLEW ---
 
 def handle_course_details(bot: BotManager, update: dict):
     """Kurs haqqında tolıq maǵlıwmattı kórsetiw"""
     ctx = MessageContext(bot, update)
-    lang = get_user_language(ctx.chat_id)
+    lang = get_user_language(ctx)
+    t = texts_for(lang)
     
     try:
-        course_id = int(ctx.callback_data.split('_')[1])
-        course = Course.objects.get(id=course_id)
+        course_id = ctx.callback.course_id
+        course = ctx.get_object(Course, course_id)
         
         # Kurs atı hám sıpatlamasın paydalanıwshı tilinde alıw (Course modelin ózgertiw kerek)
         course_name = getattr(course, f'name_{lang}', course.name_qr)
         course_description = getattr(course, f'description_{lang}', course.description_qr)
 
-        message = get_text('course_details_header', lang).format(
+        message = t.course_details_header.format(
             course_name=course_name, course_description=course_description
         )
         
         if course.discount_percentage > 0:
-            message += get_text('price_label', lang) + " "
-            message += get_text('old_price_label', lang).format(old_price=course.old_price, price=course.price)
-            message += " " + get_text('discount_label', lang).format(discount=course.discount_percentage)
+            message += t.price_label + " "
+            message += t.old_price_label.format(old_price=course.old_price, price=course.price)
+            message += " " + t.discount_label.format(discount=course.discount_percentage)
         else:
-            message += get_text('price_label', lang) + " "
-            message += get_text('current_price_label', lang).format(price=course.price)
+            message += t.price_label + " "
+            message += t.current_price_label.format(price=course.price)
         
         if course.max_students:
             current_students = course.current_students_count
-            message += get_text('taken_slots', lang).format(current=current_students, max=course.max_students)
+            message += t.taken_slots.format(current=current_students, max=course.max_students)
             if not course.is_available:
-                message += get_text('no_slots_left', lang)
+                message += t.no_slots_left
             else:
-                message += get_text('free_slots', lang).format(free=course.max_students - current_students)
+                message += t.free_slots.format(free=course.max_students - current_students)
         
         buttons = []
         if course.is_available:
-            buttons.append([{'text': get_text('buy_button', lang).format(price=course.price), 'callback_data': f"buy_{course.id}"}])
+            buttons.append([{'text': t.buy_button.format(price=course.price), 'callback_data': encode(Action.BUY, course.id)}])
         
         buttons.extend([
-            [{'text': get_text('back_to_courses_button', lang), 'callback_data': "back_to_courses"}],
-            [{'text': get_text('back_to_menu_button', lang), 'callback_data': "back_to_menu"}]
+            [{'text': t.back_to_courses_button, 'callback_data': encode(Action.BACK_TO_COURSES)}],
+            [{'text': t.back_to_menu_button, 'callback_data': encode(Action.BACK_TO_MENU)}]
         ])
         
         keyboard = KeyboardBuilder.inline_keyboard(buttons)
@@ -248,7 +234,8 @@ def handle_course_details(bot: BotManager, update: dict):
     
     except Exception as e:
         logger.error(f"Error showing course details: {e}")
-        ctx.reply(get_text('error_loading_course_details', lang))
+        ctx.report_error(e)
+        ctx.reply(t.error_loading_course_details)
 
 def handle_back_to_courses(bot: BotManager, update: dict):
     """Kurslar dizimine qaytıw"""
@@ -270,38 +257,38 @@ def handle_back_to_menu(bot: BotManager, update: dict):
 def handle_cancel_command(bot: BotManager, update: dict):
     """/cancel buyrıǵın qayta islew"""
     ctx = MessageContext(bot, update)
-    lang = get_user_language(ctx.chat_id)
+    lang = get_user_language(ctx)
     
     ctx.reply(get_text('returning_to_main_menu', lang))
     show_main_menu(ctx)
     ctx.set_state(BotStates.MAIN_MENU)
     
-    ctx.user_data.pop('buying_course_id', None)
-    ctx.user_data.pop('payment_method_id', None)
+    ctx.pop_data('buying_course_id', None)
+    ctx.pop_data('payment_method_id', None)
 
 def handle_help_command(bot: BotManager, update: dict):
     """/help buyrıǵın qayta islew"""
     ctx = MessageContext(bot, update)
-    lang = get_user_language(ctx.chat_id)
+    lang = get_user_language(ctx)
     ctx.reply(get_text('help_text', lang), parse_mode='HTML')
 
 def handle_photo(bot: BotManager, update: dict):
     """Foto qabıl etiw"""
     ctx = MessageContext(bot, update)
-    lang = get_user_language(ctx.chat_id)
+    lang = get_user_language(ctx)
     
     if ctx.user_state == BotStates.WAITING_RECEIPT:
-        handle_photo_receipt(bot, update)
+        bot.call_handler(handle_photo_receipt, update)
     else:
         ctx.reply(get_text('photo_received_outside_payment', lang))
 
 def handle_document(bot: BotManager, update: dict):
     """Hújjet qabıl etiw"""
     ctx = MessageContext(bot, update)
-    lang = get_user_language(ctx.chat_id)
+    lang = get_user_language(ctx)
     
     if ctx.user_state == BotStates.WAITING_RECEIPT:
-        handle_document_receipt(bot, update)
+        bot.call_handler(handle_document_receipt, update)
     else:
         ctx.reply(get_text('document_received_outside_payment', lang))
 
@@ -309,38 +296,32 @@ def handle_document(bot: BotManager, update: dict):
 
 def show_main_menu(ctx: MessageContext):
     """Bas menyudı kórsetiw"""
-    lang = get_user_language(ctx.chat_id)
-    keyboard = KeyboardBuilder.reply_keyboard([
-        [get_text('courses_button', lang)],
-        [get_text('about_button', lang), get_text('support_button', lang)]
-    ])
-    ctx.reply(get_text('main_menu_title', lang), reply_markup=keyboard, parse_mode='HTML')
+    lang = get_user_language(ctx)
+    ctx.reply(get_text('main_menu_title', lang), reply_markup=keyboards.main_menu(lang), parse_mode='HTML')
+
+def show_info_page(ctx: MessageContext, key: str, not_found_text: str = 'info_not_found'):
+    """InfoPage betin kórsetiw (tekst keshten alınadı, bazaǵa tek birinshi ret soraw jiberiledi)"""
+    lang = get_user_language(ctx)
+    content = get_info_page(key, lang)
+    if content is None:
+        ctx.reply(get_text(not_found_text, lang))
+        return
+    ctx.reply(content, parse_mode='HTML')
 
 def show_courses_list(ctx: MessageContext, edit_message: bool = False):
     """Kurslar dizimin kórsetiw"""
-    lang = get_user_language(ctx.chat_id)
+    lang = get_user_language(ctx)
     try:
-        courses = Course.objects.filter(is_active=True).order_by('order')
+        # Kurslar dizimi hám klaviatura katalog snapshotınan alınadı (bazaǵa soraw joq)
+        catalog = get_catalog(lang)
         
-        if not courses:
+        if not catalog.courses:
             message = get_text('no_courses_yet', lang)
             if edit_message: ctx.edit_message(message)
             else: ctx.reply(message)
             return
         
-        buttons = []
-        for course in courses:
-            # Kurs atın paydalanıwshı tilinde alıw
-            course_name = getattr(course, f'name_{lang}', course.name_qr)
-            button_text = f"📚 {course_name}"
-            if course.discount_percentage > 0:
-                button_text += f" (-{course.discount_percentage}%)"
-            
-            buttons.append([{'text': button_text, 'callback_data': f"course_{course.id}"}])
-        
-        buttons.append([{'text': get_text('back_to_menu_button', lang), 'callback_data': "back_to_menu"}])
-        
-        keyboard = KeyboardBuilder.inline_keyboard(buttons)
+        keyboard = catalog.courses_keyboard
         message = get_text('courses_list_title', lang)
         
         if edit_message:
@@ -352,6 +333,7 @@ def show_courses_list(ctx: MessageContext, edit_message: bool = False):
     
     except Exception as e:
         logger.error(f"Error showing courses: {e}")
+        ctx.report_error(e)
         ctx.reply(get_text('error_loading_courses', lang))
 
 # --- ADMIN FUNKCIYALARÍ ---
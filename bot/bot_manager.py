@@ -1,18 +1,37 @@
 # bot_manager.py
 # Простая система управления Telegram ботом без внешних библиотек
 
-import time
+import atexit
 import logging
 import json
-from typing import Dict, Callable, Any, Optional
-from .telegram_api import TelegramAPI, KeyboardBuilder
+import tempfile
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Callable, Any, Optional, Type
+from .telegram_api import TelegramAPI, KeyboardBuilder, DeadlineExceeded, update_deadline, remaining_time
+from .dispatcher import UpdateDispatcher
+from .dedupe import UpdateDeduplicator
+from .instrumentation import HandlerMetrics
+from .middleware import Middleware, MiddlewarePipeline, HandlerMetricsMiddleware, report_handled_error
+from .polling import UpdatePoller
+from .routing import CallbackRouter
+from .state_store import StateStore, create_state_store
+from .activity import flush_activity
+from . import callback_codec
 from django.conf import settings
+from django.core.files import File
+from django.db import models
 from bot.models import TelegramUser
+from bot.utils import get_user_language
 
 
 
 logger = logging.getLogger(__name__)
 
+# Типы updates, которые умеет обрабатывать _dispatch_update (остальные Telegram не присылает)
+ALLOWED_UPDATES = ['message', 'callback_query']
+
 # Состояния бота
 class BotStates:
     START = "start"
@@ -25,11 +44,59 @@ class BotStates:
     WAITING_LANGUAGE = "waiting_language"
 
 
+class UpdateScope:
+    """Данные, общие для всех MessageContext одного update (сам update не изменяется)"""
+
+    __slots__ = ('update', 'identity', 'callback')
+
+    def __init__(self, update: Dict):
+        self.update = update
+        # Модели, уже загруженные за этот update
+        self.identity: Dict = {}
+        # (callback_data, разобранный CallbackData или None)
+        self.callback: Optional[tuple] = None
+
+
+_update_scope: ContextVar[Optional[UpdateScope]] = ContextVar('bot_update_scope', default=None)
+
+
+@contextmanager
+def update_scope(update: Dict):
+    """Открыть UpdateScope на время обработки update"""
+    token = _update_scope.set(UpdateScope(update))
+    try:
+        yield
+    finally:
+        _update_scope.reset(token)
+
+
+def _scope_for(update: Dict) -> UpdateScope:
+    scope = _update_scope.get()
+    if scope is None or scope.update is not update:
+        # MessageContext вне process_update (скрипты, тесты) — отдельный scope
+        return UpdateScope(update)
+    return scope
+
+
+class DownloadedFile(File):
+    """Скачанный из Telegram файл во временном файле на диске"""
+    
+    def __init__(self, file, name: str, size: int, sha256: str):
+        super().__init__(file, name=name)
+        self.size = size
+        self.sha256 = sha256
+
+
 class BotManager:
     """Простой менеджер для Telegram бота"""
     
-    def __init__(self, token: str):
-        self.api = TelegramAPI(token)
+    def __init__(self, token: str, update_deadline: Optional[float] = None, state_store: StateStore = None):
+        self.api = TelegramAPI(token, api_url=getattr(settings, 'TELEGRAM_API_URL', None))
+        self.api.metrics.debug_sample_rate = getattr(settings, 'TELEGRAM_DEBUG_SAMPLE_RATE', 0.0)
+        # Бюджет времени на обработку одного update (секунды), None — без ограничения
+        self.update_deadline = update_deadline if update_deadline is not None else getattr(
+            settings, 'TELEGRAM_UPDATE_DEADLINE', None
+        )
         self.handlers = {
             'command': {},      # Обработчики команд /start, /help и т.д.
             'text': {},         # Обработчики текстовых сообщений
@@ -38,10 +105,20 @@ class BotManager:
             'photo': None,      # Обработчик фото
             'document': None,   # Обработчик документов
         }
-        self.user_states = {}   # Состояния пользователей {chat_id: state}
-        self.user_data = {}     # Данные пользователей {chat_id: data}
+        self.callback_router = CallbackRouter()  # Префикс callback_data -> обработчик
+        # Все обработчики вызываются через middleware; метрики обработчиков — в bot_status
+        self.handler_metrics = HandlerMetrics()
+        self.middleware = MiddlewarePipeline([HandlerMetricsMiddleware(self.handler_metrics)])
+        # Состояния и данные пользователей (бэкенд — settings.TELEGRAM_STATE_STORE)
+        self.state_store = state_store or create_state_store()
         self.last_update_id = 0
+        # Уже принятые update_id: повторные доставки Telegram не обрабатываются дважды
+        self.deduplicator = UpdateDeduplicator(getattr(settings, 'TELEGRAM_DEDUPE_WINDOW', 100000))
         self.running = False
+        self.dispatcher = None
+        self._dispatcher_lock = threading.Lock()
+        self._stop_registered = False
+        self.poller = None
     
     def add_command_handler(self, command: str, handler: Callable):
         """Добавить обработчик команды"""
@@ -52,8 +129,9 @@ class BotManager:
         self.handlers['text'][text] = handler
     
     def add_callback_handler(self, callback_data: str, handler: Callable):
-        """Добавить обработчик callback"""
+        """Добавить обработчик callback (срабатывает на самый длинный подходящий префикс)"""
         self.handlers['callback'][callback_data] = handler
+        self.callback_router.add(callback_data, handler)
     
     def set_contact_handler(self, handler: Callable):
         """Установить обработчик контактов"""
@@ -67,106 +145,123 @@ class BotManager:
         """Установить обработчик документов"""
         self.handlers['document'] = handler
     
+    def add_middleware(self, middleware: Middleware):
+        """Добавить middleware вокруг обработчиков (before/after/on_error)"""
+        self.middleware.add(middleware)
+    
+    def call_handler(self, handler: Callable, update: Dict):
+        """Вызвать обработчик через цепочку middleware"""
+        return self.middleware.run(self, handler, update)
+    
     def get_user_state(self, chat_id: int) -> str:
         """Получить состояние пользователя"""
-        return self.user_states.get(chat_id, BotStates.START)
+        return self.state_store.load(chat_id).state
     
     def set_user_state(self, chat_id: int, state: str):
         """Установить состояние пользователя"""
-        self.user_states[chat_id] = state
+        record = self.state_store.load(chat_id)
+        record.state = state
+        self.state_store.save(record)
         logger.info(f"User {chat_id} state changed to: {state}")
     
     def get_user_data(self, chat_id: int) -> Dict:
-        """Получить данные пользователя"""
-        if chat_id not in self.user_data:
-            self.user_data[chat_id] = {}
-        return self.user_data[chat_id]
+        """Получить данные пользователя (копия; изменять через set_user_data)"""
+        return dict(self.state_store.load(chat_id).data)
     
     def set_user_data(self, chat_id: int, key: str, value: Any):
         """Установить данные пользователя"""
-        if chat_id not in self.user_data:
-            self.user_data[chat_id] = {}
-        self.user_data[chat_id][key] = value
+        record = self.state_store.load(chat_id)
+        record.data[key] = value
+        self.state_store.save(record)
     
     def process_update(self, update: Dict):
         """Обработать одно обновление"""
         try:
-            # Обработка сообщений
-            if 'message' in update:
-                message = update['message']
-                chat_id = message['chat']['id']
-                user = message['from']
-                
-                logger.info(f"Message from {user.get('username', user.get('first_name', 'Unknown'))} ({chat_id})")
-
-                # Команды
-                if 'text' in message and message['text'].startswith('/'):
-                    command = message['text'][1:]  # Убираем /
-                    if command in self.handlers['command']:
-                        self.handlers['command'][command](self, update)
-                        return
-                
-                # Контакт
-                if 'contact' in message:
-                    if self.handlers['contact']:
-                        self.handlers['contact'](self, update)
-                        return
-                
-                # Фото
-                if 'photo' in message:
-                    if self.handlers['photo']:
-                        self.handlers['photo'](self, update)
-                        return
-                
-                # Документ
-                if 'document' in message:
-                    if self.handlers['document']:
-                        self.handlers['document'](self, update)
-                        return
-                
-                # Текстовые сообщения
-                if 'text' in message:
-                    text = message['text']
-                    
-                    # Проверяем конкретные обработчики текста
-                    if text in self.handlers['text']:
-                        self.handlers['text'][text](self, update)
-                        return
-                    
-                    # Если нет конкретного обработчика, используем общий
-                    if 'default_text' in self.handlers:
-                        self.handlers['default_text'](self, update)
-                        return
-                
-                # Если ничего не подошло
-                self.send_message(chat_id, "❓ Не понимаю эту команду. Используйте кнопки меню.")
-            
-            # Обработка callback запросов
-            elif 'callback_query' in update:
-                callback_query = update['callback_query']
-                chat_id = callback_query['message']['chat']['id']
-                callback_data = callback_query['data']
-                
-                logger.info(f"Callback from {chat_id}: {callback_data}")
-                
-                # Отвечаем на callback query
-                self.api.answer_callback_query(callback_query['id'])
-                
-                # Ищем обработчик
-                for pattern, handler in self.handlers['callback'].items():
-                    if callback_data.startswith(pattern):
-                        handler(self, update)
-                        return
-                
-                # Если нет обработчика
-                self.send_message(chat_id, "❓ Неизвестная команда.")
-                
+            # Состояние читается один раз и записывается не больше одного раза за update
+            with update_deadline(self.update_deadline), self.state_store.session(), update_scope(update):
+                self._dispatch_update(update)
+        except DeadlineExceeded as e:
+            logger.warning(f"Update {update.get('update_id')} aborted: {e}")
         except Exception as e:
             logger.error(f"Error processing update: {e}")
             if 'message' in update:
                 chat_id = update['message']['chat']['id']
                 self.send_message(chat_id, "Произошла ошибка. Попробуйте еще раз.")
     
+    def _dispatch_update(self, update: Dict):
+        """Найти и вызвать обработчик для update"""
+        # Обработка сообщений
+        if 'message' in update:
+            message = update['message']
+            chat_id = message['chat']['id']
+            user = message['from']
+            
+            logger.info(f"Message from {user.get('username', user.get('first_name', 'Unknown'))} ({chat_id})")
+
+            # Команды
+            if 'text' in message and message['text'].startswith('/'):
+                command = message['text'][1:]  # Убираем /
+                if command in self.handlers['command']:
+                    self.call_handler(self.handlers['command'][command], update)
+                    return
+            
+            # Контакт
+            if 'contact' in message:
+                if self.handlers['contact']:
+                    self.call_handler(self.handlers['contact'], update)
+                    return
+            
+            # Фото
+            if 'photo' in message:
+                if self.handlers['photo']:
+                    self.call_handler(self.handlers['photo'], update)
+                    return
+            
+            # Документ
+            if 'document' in message:
+                if self.handlers['document']:
+                    self.call_handler(self.handlers['document'], update)
+                    return
+            
+            # Текстовые сообщения
+            if 'text' in message:
+                text = message['text']
+                
+                # Проверяем конкретные обработчики текста
+                if text in self.handlers['text']:
+                    self.call_handler(self.handlers['text'][text], update)
+                    return
+                
+                # Если нет конкретного обработчика, используем общий
+                if 'default_text' in self.handlers:
+                    self.call_handler(self.handlers['default_text'], update)
+                    return
+            
+            # Если ничего не подошло
+            self.send_message(chat_id, "❓ Не понимаю эту команду. Используйте кнопки меню.")
+        
+        # Обработка callback запросов
+        elif 'callback_query' in update:
+            callback_query = update['callback_query']
+            chat_id = callback_query['message']['chat']['id']
+            callback_data = callback_query['data']
+            
+            logger.info(f"Callback from {chat_id}: {callback_data}")
+            
+            # Отвечаем на callback query
+            self.api.answer_callback_query(callback_query['id'])
+            
+            # callback_data разбирается один раз; обработчик получает его через ctx.callback
+            callback = callback_codec.decode(callback_data)
+            _scope_for(update).callback = (callback_data, callback)
+            match = self.callback_router.resolve(callback.route if callback else callback_data)
+            if match:
+                self.call_handler(match.handler, update)
+                return
+            
+            # Если нет обработчика
+            self.send_message(chat_id, "❓ Неизвестная команда.")
+    
     def send_message(self, chat_id: int, text: str, reply_markup: Dict = None, parse_mode: str = None):
         """Отправить сообщение"""
         try:
@@ -188,18 +283,84 @@ class BotManager:
         except Exception as e:
             logger.error(f"Error sending photo: {e}")
     
-    def download_file(self, file_id: str) -> Optional[bytes]:
-        """Скачать файл"""
+    def send_document(self, chat_id: int, document, caption: str = None):
+        """Отправить документ"""
+        try:
+            return self.api.send_document(chat_id, document, caption)
+        except Exception as e:
+            logger.error(f"Error sending document: {e}")
+    
+    def download_file(self, file_id: str, max_bytes: int = None) -> Optional[DownloadedFile]:
+        """Скачать файл потоком во временный файл (не дольше max_bytes байт).
+        
+        Вызывающий код должен закрыть возвращённый файл (временный файл удалится сам).
+        """
         try:
             file_info = self.api.get_file(file_id)
+            if max_bytes and file_info.get('file_size', 0) > max_bytes:
+                logger.warning(f"File {file_id} is too large: {file_info.get('file_size')} bytes")
+                return None
+            
             file_path = file_info['file_path']
-            return self.api.download_file(file_path)
+            tmp = tempfile.TemporaryFile()
+            try:
+                size, sha256 = self.api.download_file_to(file_path, tmp, max_bytes=max_bytes)
+            except Exception:
+                tmp.close()
+                raise
+            tmp.seek(0)
+            return DownloadedFile(tmp, name=file_path.rsplit('/', 1)[-1], size=size, sha256=sha256)
         except Exception as e:
             logger.error(f"Error downloading file: {e}")
             return None
     
-    def start_polling(self, interval: float = 1.0):
-        """Запустить polling"""
+    def start_dispatcher(self) -> UpdateDispatcher:
+        """Запустить пул обработчиков updates (если ещё не запущен).
+        
+        Безопасно вызывать из нескольких потоков одновременно: пул и atexit-хук
+        создаются один раз.
+        """
+        dispatcher = self.dispatcher
+        if dispatcher is not None and dispatcher.running:
+            return dispatcher
+        with self._dispatcher_lock:
+            if self.dispatcher is None or not self.dispatcher.running:
+                # Чаты обрабатываются параллельно, updates одного чата — по порядку
+                self.dispatcher = UpdateDispatcher(
+                    self.process_update,
+                    workers=getattr(settings, 'TELEGRAM_WORKERS', 8),
+                    queue_size=getattr(settings, 'TELEGRAM_QUEUE_SIZE', 1000)
+                ).start()
+                if not self._stop_registered:
+                    # При остановке процесса доделываем уже принятые updates
+                    atexit.register(self.stop_dispatcher)
+                    self._stop_registered = True
+            return self.dispatcher
+    
+    def stop_dispatcher(self, wait: bool = True):
+        """Остановить пул обработчиков (при wait=True — после обработки очереди)"""
+        if self.dispatcher:
+            self.dispatcher.stop(wait=wait)
+        flush_activity()
+    
+    def enqueue_update(self, update: Dict, timeout: float = None) -> bool:
+        """Передать update в фоновую обработку; False — очередь полна (ждали timeout секунд).
+        
+        Повторно доставленный update (тот же update_id) пропускается и считается принятым.
+        """
+        update_id = update.get('update_id')
+        if update_id is not None and self.deduplicator.is_duplicate(update_id):
+            logger.info(f"Duplicate update {update_id} skipped")
+            return True
+        if self.start_dispatcher().submit(update, timeout=timeout):
+            return True
+        if update_id is not None:
+            # Не приняли — повторная доставка должна обработаться
+            self.deduplicator.forget(update_id)
+        return False
+    
+    def start_polling(self, timeout: int = None, allowed_updates: list = None):
+        """Запустить polling (блокирует до stop_polling или Ctrl+C)"""
         logger.info("Starting bot polling...")
         
         try:
@@ -211,38 +372,36 @@ class BotManager:
             self.api.delete_webhook()
             
             self.running = True
+            self.start_dispatcher()
+            # Следующий getUpdates уходит, пока текущая пачка раздаётся обработчикам
+            self.poller = UpdatePoller(
+                self.api,
+                timeout=timeout if timeout is not None else getattr(settings, 'TELEGRAM_POLL_TIMEOUT', 30),
+                allowed_updates=allowed_updates if allowed_updates is not None else ALLOWED_UPDATES,
+                offset=self.last_update_id + 1 if self.last_update_id else None
+            ).start()
             
-            while self.running:
-                try:
-                    # Получаем обновления
-                    updates = self.api.get_updates(
-                        offset=self.last_update_id + 1,
-                        limit=100,
-                        timeout=10
-                    )
-                    
-                    for update in updates:
-                        self.last_update_id = update['update_id']
-                        self.process_update(update)
-                    
-                    if not updates:
-                        time.sleep(interval)
-                        
-                except KeyboardInterrupt:
-                    break
-                except Exception as e:
-                    logger.error(f"Polling error: {e}")
-                    time.sleep(5)  # Ждем перед повторной попыткой
+            for updates in self.poller:
+                for update in updates:
+                    # Если очередь полна, submit ждёт — polling притормаживает (backpressure)
+                    self.enqueue_update(update)
+                    self.last_update_id = update['update_id']
         
         except KeyboardInterrupt:
             pass
         finally:
             self.running = False
+            if self.poller:
+                self.poller.stop()
+            # Доделываем уже принятые updates
+            self.stop_dispatcher()
             logger.info("Bot polling stopped")
     
     def stop_polling(self):
         """Остановить polling"""
         self.running = False
+        if self.poller:
+            self.poller.stop()
 
 class MessageContext:
     """Контекст сообщения для удобства работы"""
@@ -262,14 +421,21 @@ class MessageContext:
             self.chat_id = self.message['chat']['id']
             self.user = self.callback_query['from']
             self.callback_data = self.callback_query['data']
+            self._callback_args = None
         
-        self.user_state = bot.get_user_state(self.chat_id)
-        self.user_data = bot.get_user_data(self.chat_id)
+        self._state = bot.state_store.load(self.chat_id)
+        # Модели, уже загруженные за этот update (общие для всех MessageContext одного update)
+        self._scope = _scope_for(update)
+        self._identity = self._scope.identity
     
     def reply(self, text: str, reply_markup: Dict = None, parse_mode: str = None):
         """Ответить на сообщение"""
         return self.bot.send_message(self.chat_id, text, reply_markup, parse_mode)
     
+    def report_error(self, error: Exception):
+        """Обработчик сам перехватил исключение: ошибка всё равно попадёт в метрики (on_error middleware)"""
+        report_handled_error(error)
+    
     def edit_message(self, text: str, reply_markup: Dict = None):
         """Редактировать сообщение (для callback)"""
         if hasattr(self, 'callback_query'):
@@ -280,12 +446,96 @@ class MessageContext:
                 reply_markup
             )
     
+    @property
+    def callback(self) -> Optional[callback_codec.CallbackData]:
+        """Разобранный callback (ctx.callback.course_id и т.п.); None — неизвестный формат"""
+        cached = self._scope.callback
+        # Кэш привязан к строке: копия update с другим data не получит чужой результат
+        if cached is None or cached[0] != self.callback_data:
+            cached = self._scope.callback = (self.callback_data, callback_codec.decode(self.callback_data))
+        return cached[1]
+    
+    @property
+    def callback_args(self) -> tuple:
+        """Аргументы после префикса обработчика: 'payment_method_3_1' -> (3, 1)"""
+        if self._callback_args is None:
+            if self.callback is not None:
+                self._callback_args = self.callback.args
+            else:
+                match = self.bot.callback_router.resolve(self.callback_data)
+                self._callback_args = match.args if match else ()
+        return self._callback_args
+    
+    @property
+    def remaining_time(self) -> Optional[float]:
+        """Сколько секунд осталось из бюджета update (None — без ограничения)"""
+        return remaining_time()
+    
+    def deadline(self, seconds: float):
+        """Сузить бюджет времени для части обработчика: with ctx.deadline(5): ..."""
+        return update_deadline(seconds)
+    
+    @property
+    def telegram_user(self) -> Optional[TelegramUser]:
+        """Пользователь из БД (загружается один раз за update); None — ещё не зарегистрирован"""
+        key = (TelegramUser, self.chat_id)
+        if key not in self._identity:
+            self._identity[key] = TelegramUser.objects.filter(chat_id=self.chat_id).first()
+        return self._identity[key]
+    
+    def get_telegram_user(self) -> TelegramUser:
+        """То же, что telegram_user, но без пользователя бросает TelegramUser.DoesNotExist"""
+        user = self.telegram_user
+        if user is None:
+            raise TelegramUser.DoesNotExist(f"TelegramUser {self.chat_id} does not exist")
+        return user
+    
+    def remember_user(self, user: TelegramUser):
+        """Положить уже загруженного пользователя в кэш update (например, после get_or_create)"""
+        self._identity[(TelegramUser, self.chat_id)] = user
+    
+    @property
+    def lang(self) -> str:
+        """Язык пользователя (из уже загруженного пользователя или из кэша языков, без запроса к БД)"""
+        user = self._identity.get((TelegramUser, self.chat_id))
+        return get_user_language(user if user is not None else self.chat_id)
+    
+    def remember(self, obj: models.Model):
+        """Положить уже загруженный объект в кэш update, чтобы get_object его не перечитывал"""
+        self._identity[(type(obj), 'pk', obj.pk)] = obj
+    
+    def get_object(self, model: Type[models.Model], pk: Any) -> models.Model:
+        """model.objects.get(pk=pk) с кэшем на время update (бросает model.DoesNotExist)"""
+        key = (model, 'pk', pk)
+        obj = self._identity.get(key)
+        if obj is None:
+            obj = model.objects.get(pk=pk)
+            self._identity[key] = obj
+        return obj
+    
+    @property
+    def user_state(self) -> str:
+        """Текущее состояние пользователя"""
+        return self._state.state
+    
+    @property
+    def user_data(self) -> Dict:
+        """Данные пользователя (только чтение; изменять через set_data/pop_data)"""
+        return dict(self._state.data)
+    
     def set_state(self, state: str):
         """Установить состояние пользователя"""
-        self.bot.set_user_state(self.chat_id, state)
-        self.user_state = state
+        self._state.state = state
+        self.bot.state_store.save(self._state)
+        logger.info(f"User {self.chat_id} state changed to: {state}")
     
     def set_data(self, key: str, value: Any):
         """Установить данные пользователя"""
-        self.bot.set_user_data(self.chat_id, key, value)
-        self.user_data[key] = value
\ No newline at end of file
+        self._state.data[key] = value
+        self.bot.state_store.save(self._state)
+    
+    def pop_data(self, key: str, default: Any = None) -> Any:
+        """Удалить и вернуть значение из данных пользователя"""
+        value = self._state.data.pop(key, default)
+        self.bot.state_store.save(self._state)
+        return value
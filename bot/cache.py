@@ -0,0 +1,113 @@
+# cache.py
+# Ограниченный по размеру LRU кэш с TTL для данных внутри процесса
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Потокобезопасный LRU кэш: не больше max_size записей, каждая живёт ttl секунд (None — вечно)"""
+
+    def __init__(self, max_size: int = 10000, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()   # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+        # Статистика
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._items.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._items[key]
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = _MISSING):
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._items[key] = (value, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._items),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'evictions': self.evictions,
+            }
+
+
+class SharedVersion:
+    """Номер версии данных, общий для всех процессов (строка CacheVersion в БД).
+
+    Процесс, изменивший данные, вызывает bump(); остальные через changed_since()
+    узнают, что их локальная копия устарела. БД опрашивается не чаще раза
+    в check_interval секунд. Версия хранится в БД, а не в Django cache: при
+    LocMemCache у каждого процесса свой кэш, и правка из админки не дошла бы до бота.
+    """
+
+    def __init__(self, key: str, check_interval: float = 5.0):
+        self.key = key
+        self.check_interval = check_interval
+        self._checked_at = 0.0
+
+    def get(self) -> int:
+        from .models import CacheVersion
+        version = CacheVersion.objects.filter(key=self.key).values_list('version', flat=True).first()
+        return version or 1
+
+    def bump(self):
+        from django.db.models import F
+        from .models import CacheVersion
+        if CacheVersion.objects.filter(key=self.key).update(version=F('version') + 1):
+            return
+        # Первое изменение: строки ещё нет (её мог одновременно создать другой процесс)
+        _, created = CacheVersion.objects.get_or_create(key=self.key, defaults={'version': 2})
+        if not created:
+            CacheVersion.objects.filter(key=self.key).update(version=F('version') + 1)
+
+    def changed_since(self, version: Optional[int]) -> bool:
+        """Отличается ли общая версия от version (между проверками всегда False)"""
+        now = time.monotonic()
+        if version is not None and now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        return self.get() != version
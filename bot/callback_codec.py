@@ -0,0 +1,186 @@
+# callback_codec.py
+# Компактный формат callback_data: '~' + base64url(версия, id действия, аргументы varint).
+# Старые строковые callback_data ('course_12', 'set_lang_qr' ...) по-прежнему разбираются,
+# поэтому кнопки в уже отправленных сообщениях продолжают работать.
+
+import base64
+from enum import IntEnum
+from typing import Any, Dict, Optional, Tuple
+
+from .routing import CallbackRouter
+
+TOKEN_PREFIX = '~'
+CODEC_VERSION = 1
+MAX_CALLBACK_DATA = 64     # лимит Telegram на callback_data (байт)
+
+
+class Action(IntEnum):
+    """Идентификаторы действий. Номера не менять — они хранятся в кнопках уже отправленных сообщений"""
+    SET_LANG = 1
+    COURSE = 2
+    BACK_TO_COURSES = 3
+    BACK_TO_MENU = 4
+    BUY = 5
+    PAYMENT_METHOD = 6
+    CANCEL_PAYMENT = 7
+    CONFIRM_PAYMENT = 8
+    SUPPORT = 9
+    ADMIN_APPROVE = 10
+    ADMIN_REJECT = 11
+
+
+class Choice:
+    """Аргумент-перечисление: в токене хранится индекс значения"""
+
+    def __init__(self, *values: str):
+        self.values = values
+
+    def pack(self, value: str) -> int:
+        return self.values.index(value)
+
+    def unpack(self, index: int) -> str:
+        return self.values[index]
+
+    def parse(self, value) -> str:
+        if value not in self.values:
+            raise ValueError(f"Unexpected value {value!r}")
+        return value
+
+
+LANGUAGE = Choice('qr', 'uz')
+
+# Действие -> (строковый префикс, по которому зарегистрирован обработчик; поля аргументов)
+ACTIONS: Dict[Action, Tuple[str, Tuple[Tuple[str, Any], ...]]] = {
+    Action.SET_LANG: ('set_lang_', (('lang', LANGUAGE),)),
+    Action.COURSE: ('course_', (('course_id', int),)),
+    Action.BACK_TO_COURSES: ('back_to_courses', ()),
+    Action.BACK_TO_MENU: ('back_to_menu', ()),
+    Action.BUY: ('buy_', (('course_id', int),)),
+    Action.PAYMENT_METHOD: ('payment_method_', (('course_id', int), ('method_id', int))),
+    Action.CANCEL_PAYMENT: ('cancel_payment', ()),
+    Action.CONFIRM_PAYMENT: ('confirm_payment_', (('payment_id', int),)),
+    Action.SUPPORT: ('support', ()),
+    Action.ADMIN_APPROVE: ('admin_approve_', (('payment_id', int),)),
+    Action.ADMIN_REJECT: ('admin_reject_', (('payment_id', int),)),
+}
+
+# Разбор старых строковых callback_data по тем же префиксам
+_legacy_router = CallbackRouter()
+for _action, (_prefix, _fields) in ACTIONS.items():
+    _legacy_router.add(_prefix, _action)
+
+
+class CallbackData:
+    """Разобранный callback: действие и именованные аргументы (ctx.callback.course_id и т.п.)"""
+
+    __slots__ = ('action', 'args', '_fields')
+
+    def __init__(self, action: Action, args: Tuple):
+        self.action = action
+        self.args = args
+        self._fields = ACTIONS[action][1]
+
+    @property
+    def route(self) -> str:
+        """Префикс, по которому ищется обработчик в CallbackRouter"""
+        return ACTIONS[self.action][0]
+
+    def __getattr__(self, name: str):
+        for index, (field, _) in enumerate(self._fields):
+            if field == name:
+                return self.args[index]
+        raise AttributeError(f"{self.action.name} callback has no field {name!r}")
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {field: value for (field, _), value in zip(self._fields, self.args)}
+
+    def __eq__(self, other):
+        return isinstance(other, CallbackData) and (self.action, self.args) == (other.action, other.args)
+
+    def __repr__(self):
+        fields = ', '.join(f"{key}={value!r}" for key, value in self.as_dict().items())
+        return f"CallbackData({self.action.name}{', ' + fields if fields else ''})"
+
+
+def _write_varint(value: int, out: bytearray):
+    if value < 0:
+        raise ValueError("Callback arguments must be non-negative")
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, position
+        shift += 7
+
+
+def encode(action: Action, *args) -> str:
+    """Упаковать действие и аргументы в короткую строку для callback_data"""
+    fields = ACTIONS[action][1]
+    if len(args) != len(fields):
+        raise ValueError(f"{action.name} expects {len(fields)} arguments, got {len(args)}")
+
+    out = bytearray((CODEC_VERSION, action))
+    for (name, kind), value in zip(fields, args):
+        _write_varint(kind.pack(value) if isinstance(kind, Choice) else int(value), out)
+
+    token = TOKEN_PREFIX + base64.urlsafe_b64encode(bytes(out)).rstrip(b'=').decode()
+    if len(token) > MAX_CALLBACK_DATA:
+        raise ValueError(f"Callback data for {action.name} is longer than {MAX_CALLBACK_DATA} bytes")
+    return token
+
+
+def _decode_token(token: str) -> Optional[CallbackData]:
+    data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    if len(data) < 2 or data[0] != CODEC_VERSION:
+        return None
+    action = Action(data[1])
+    position = 2
+    values = []
+    for name, kind in ACTIONS[action][1]:
+        raw, position = _read_varint(data, position)
+        values.append(kind.unpack(raw) if isinstance(kind, Choice) else raw)
+    if position != len(data):
+        return None
+    return CallbackData(action, tuple(values))
+
+
+def _decode_legacy(data: str) -> Optional[CallbackData]:
+    match = _legacy_router.resolve(data)
+    if match is None:
+        return None
+    fields = ACTIONS[match.handler][1]
+    if len(match.args) != len(fields):
+        return None
+    values = []
+    for (name, kind), value in zip(fields, match.args):
+        if kind is int and not isinstance(value, int):
+            return None
+        values.append(kind.parse(value) if isinstance(kind, Choice) else value)
+    return CallbackData(match.handler, tuple(values))
+
+
+def decode(data: str) -> Optional[CallbackData]:
+    """Разобрать callback_data (новый токен или старую строку); None — если формат неизвестен"""
+    if not data:
+        return None
+    try:
+        if data.startswith(TOKEN_PREFIX):
+            return _decode_token(data[len(TOKEN_PREFIX):])
+        return _decode_legacy(data)
+    except (ValueError, IndexError):
+        return None
+
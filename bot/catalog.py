@@ -0,0 +1,193 @@
+# catalog.py
+# Неизменяемый снимок каталога (курсы и способы оплаты) для каждого языка:
+# тексты, цены, скидки и готовая клавиатура списка курсов.
+# Снимок пересобирается целиком после изменения Course/PaymentMethod (см. signals.py)
+# и подменяется одной операцией, поэтому обработчики всегда видят согласованные данные.
+
+import json
+import time
+import logging
+import threading
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Dict, Mapping, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+
+from .cache import SharedVersion
+from .callback_codec import LANGUAGE, Action, encode
+from .telegram_api import KeyboardBuilder
+from .translations import get_text
+
+logger = logging.getLogger(__name__)
+
+# Версия каталога (CacheVersion): по ней другие процессы узнают, что снимок устарел
+VERSION_CACHE_KEY = 'bot:catalog:version'
+
+
+class CourseEntry(NamedTuple):
+    id: int
+    name: str
+    description: str
+    price: Decimal
+    old_price: Optional[Decimal]
+    discount_percentage: int
+    max_students: Optional[int]
+    group_link: str
+    is_active: bool
+
+
+class PaymentMethodEntry(NamedTuple):
+    id: int
+    name: str
+    card_number: str
+    cardholder_name: str
+    bank_name: str
+    instructions: str
+    is_active: bool
+
+
+class LanguageCatalog(NamedTuple):
+    """Каталог на одном языке. courses/payment_methods — только активные, по порядку сортировки;
+    *_by_id — все записи (курс мог стать неактивным, пока пользователь его покупает)"""
+    lang: str
+    courses: Tuple[CourseEntry, ...]
+    courses_by_id: Mapping[int, CourseEntry]
+    payment_methods: Tuple[PaymentMethodEntry, ...]
+    payment_methods_by_id: Mapping[int, PaymentMethodEntry]
+    courses_keyboard: str       # готовый JSON inline клавиатуры списка курсов
+
+
+class CatalogSnapshot(NamedTuple):
+    version: int
+    built_at: float
+    languages: Mapping[str, LanguageCatalog]
+
+
+def _courses_keyboard(lang: str, courses: Tuple[CourseEntry, ...]) -> str:
+    buttons = []
+    for course in courses:
+        button_text = f"📚 {course.name}"
+        if course.discount_percentage > 0:
+            button_text += f" (-{course.discount_percentage}%)"
+        buttons.append([{'text': button_text, 'callback_data': encode(Action.COURSE, course.id)}])
+    buttons.append([{'text': get_text('back_to_menu_button', lang), 'callback_data': encode(Action.BACK_TO_MENU)}])
+    return json.dumps(KeyboardBuilder.inline_keyboard(buttons), ensure_ascii=False, separators=(',', ':'))
+
+
+def build_snapshot(version: int = 0) -> CatalogSnapshot:
+    """Прочитать каталог из БД (два запроса) и собрать снимок для всех языков"""
+    from courses.models import Course, PaymentMethod
+
+    courses = list(Course.objects.order_by('order', 'name_qr'))
+    methods = list(PaymentMethod.objects.order_by('order', 'name_qr'))
+
+    languages = {}
+    for lang in LANGUAGE.values:
+        course_entries = tuple(
+            CourseEntry(
+                id=course.id,
+                name=course.get_name(lang),
+                description=course.get_description(lang),
+                price=course.price,
+                old_price=course.old_price,
+                discount_percentage=course.discount_percentage,
+                max_students=course.max_students,
+                group_link=course.group_link,
+                is_active=course.is_active,
+            )
+            for course in courses
+        )
+        method_entries = tuple(
+            PaymentMethodEntry(
+                id=method.id,
+                name=method.get_name(lang),
+                card_number=method.card_number,
+                cardholder_name=method.cardholder_name,
+                bank_name=method.bank_name,
+                instructions=method.get_instructions(lang),
+                is_active=method.is_active,
+            )
+            for method in methods
+        )
+        active_courses = tuple(course for course in course_entries if course.is_active)
+        languages[lang] = LanguageCatalog(
+            lang=lang,
+            courses=active_courses,
+            courses_by_id=MappingProxyType({course.id: course for course in course_entries}),
+            payment_methods=tuple(method for method in method_entries if method.is_active),
+            payment_methods_by_id=MappingProxyType({method.id: method for method in method_entries}),
+            courses_keyboard=_courses_keyboard(lang, active_courses),
+        )
+    return CatalogSnapshot(version=version, built_at=time.time(), languages=MappingProxyType(languages))
+
+
+class Catalog:
+    """Держатель текущего снимка.
+
+    Снимок собирается лениво при первом обращении после invalidate(). Изменения
+    в другом процессе замечаются по версии в БД (SharedVersion), которая проверяется
+    не чаще раза в check_interval секунд; кроме того, снимок старше max_age секунд
+    пересобирается в любом случае.
+    """
+
+    def __init__(self, check_interval: float = 5.0, max_age: Optional[float] = 300.0):
+        self.version = SharedVersion(VERSION_CACHE_KEY, check_interval)
+        self.max_age = max_age
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._stale = True
+        self._lock = threading.Lock()
+
+        # Статистика
+        self.builds_total = 0
+
+    def snapshot(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if (snapshot is not None and not self._stale and not self._expired(snapshot)
+                and not self.version.changed_since(snapshot.version)):
+            return snapshot
+        with self._lock:
+            if self._snapshot is snapshot or self._stale:
+                self._stale = False
+                version = self.version.get()
+                self._snapshot = build_snapshot(version)
+                self.builds_total += 1
+                logger.info(f"Catalog snapshot v{version} built")
+            return self._snapshot
+
+    def _expired(self, snapshot: CatalogSnapshot) -> bool:
+        # Страховка от правок мимо сигналов (SQL вручную и т.п.): снимок не старше max_age
+        return self.max_age is not None and time.time() - snapshot.built_at > self.max_age
+
+    def get(self, lang: str) -> LanguageCatalog:
+        """Каталог на языке пользователя"""
+        languages = self.snapshot().languages
+        return languages.get(lang) or languages[LANGUAGE.values[0]]
+
+    def invalidate(self):
+        """Каталог изменился: пересобрать снимок здесь и сообщить другим процессам"""
+        self._stale = True
+        self.version.bump()
+
+    def get_stats(self) -> Dict:
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version if snapshot else None,
+            'built_at': snapshot.built_at if snapshot else None,
+            'builds_total': self.builds_total,
+            'courses': len(next(iter(snapshot.languages.values())).courses) if snapshot else None,
+        }
+
+
+catalog = Catalog(
+    check_interval=getattr(settings, 'TELEGRAM_CATALOG_CHECK_INTERVAL', 5.0),
+    max_age=getattr(settings, 'TELEGRAM_CATALOG_MAX_AGE', 300.0),
+)
+
+
+def get_catalog(lang: str) -> LanguageCatalog:
+    return catalog.get(lang)
+
+
+def invalidate_catalog():
+    catalog.invalidate()
@@ -0,0 +1,116 @@
+# bot/checks.py
+# Проверки при запуске (manage.py check / runserver / migrate):
+# все ключи переводов, используемые в коде, существуют, а .format() получает все плейсхолдеры шаблона;
+# Django cache, через который процессы бота и админки делят данные, действительно общий.
+
+import ast
+import os
+from typing import Iterator, List, Set, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+from .translations import FIELDS
+
+CHECKED_APPS = ('bot', 'courses', 'payments')
+
+# Бэкенды Django cache, которые живут внутри одного процесса
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _source_files() -> Iterator[str]:
+    for label in CHECKED_APPS:
+        root = apps.get_app_config(label).path
+        for directory, dirnames, filenames in os.walk(root):
+            dirnames[:] = [name for name in dirnames if name not in ('migrations', '__pycache__')]
+            for filename in filenames:
+                if filename.endswith('.py'):
+                    yield os.path.join(directory, filename)
+
+
+def _literal_key(node: ast.AST, text_namespaces: Set[str]):
+    """Ключ перевода, если node — get_text('ключ', ...) или texts.ключ; иначе None"""
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'get_text'
+            and node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+        return node.args[0].value
+    if (isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name)
+            and node.value.id in text_namespaces):
+        return node.attr
+    return None
+
+
+def _namespaces(tree: ast.AST) -> Set[str]:
+    """Имена переменных, которым присвоено texts_for(...)"""
+    names = set()
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Assign) and isinstance(node.value, ast.Call)
+                and isinstance(node.value.func, ast.Name) and node.value.func.id == 'texts_for'):
+            names.update(target.id for target in node.targets if isinstance(target, ast.Name))
+    return names
+
+
+def find_translation_errors(source: str) -> List[Tuple[int, str]]:
+    """Ошибки использования переводов в исходном коде: [(строка, описание)]"""
+    tree = ast.parse(source)
+    text_namespaces = _namespaces(tree)
+    problems = []
+    for node in ast.walk(tree):
+        key = _literal_key(node, text_namespaces)
+        if key is not None and key not in FIELDS:
+            problems.append((node.lineno, f"unknown translation key '{key}'"))
+            continue
+
+        # get_text('ключ', lang).format(...) / texts.ключ.format(...)
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr == 'format'):
+            continue
+        key = _literal_key(node.func.value, text_namespaces)
+        if key is None or key not in FIELDS:
+            continue
+        if node.args or any(keyword.arg is None for keyword in node.keywords):
+            continue    # позиционные аргументы или **kwargs — статически не проверить
+        missing = FIELDS[key] - {keyword.arg for keyword in node.keywords}
+        if missing:
+            problems.append((node.lineno, f"'{key}'.format() is missing {', '.join(sorted(missing))}"))
+    return problems
+
+
+@register(Tags.translation)
+def check_translation_usage(app_configs, **kwargs):
+    errors = []
+    for path in _source_files():
+        with open(path, encoding='utf-8') as source:
+            problems = find_translation_errors(source.read())
+        for lineno, message in problems:
+            errors.append(Error(
+                message,
+                obj=f"{os.path.relpath(path)}:{lineno}",
+                id='bot.E001',
+            ))
+    return errors
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Бот (polling) и админка (uvicorn) — разные процессы: кэш языков и состояние
+    диалогов в TELEGRAM_STATE_STORE='cache' видны им обоим только через общий кэш"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    errors = [Warning(
+        f"CACHES['default'] is {backend.rsplit('.', 1)[-1]}, which is not shared between processes",
+        hint="Set REDIS_CACHE_URL: until then a language changed in the admin reaches the bot process "
+             "only after TELEGRAM_LANGUAGE_CACHE_TTL / TELEGRAM_LANGUAGE_SHARED_CACHE_TTL.",
+        id='bot.W001',
+    )]
+    if getattr(settings, 'TELEGRAM_STATE_STORE', 'db') == 'cache':
+        errors.append(Error(
+            "TELEGRAM_STATE_STORE='cache' needs a cache shared between processes",
+            hint="Set REDIS_CACHE_URL or use TELEGRAM_STATE_STORE='db'.",
+            id='bot.E002',
+        ))
+    return errors
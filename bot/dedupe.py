@@ -0,0 +1,77 @@
+# dedupe.py
+# Отсев повторно доставленных updates по update_id (скользящее окно-битмап)
+
+import threading
+from typing import Dict
+
+
+class UpdateDeduplicator:
+    """Помнит последние window значений update_id: 1 бит на каждое, память — window / 8 байт.
+
+    Telegram выдаёт update_id по возрастанию, поэтому окно сдвигается вслед за
+    максимальным увиденным id. id ниже окна считается началом новой
+    последовательности (после недели без updates Telegram может выбрать id случайно):
+    окно сбрасывается, update принимается.
+    """
+
+    def __init__(self, window: int = 100000):
+        self.window = window
+        self._bits = bytearray((window + 7) // 8)
+        self._high = None       # максимальный увиденный update_id
+        self._lock = threading.Lock()
+
+        # Статистика
+        self.accepted_total = 0
+        self.duplicates_total = 0
+        self.resets_total = 0
+
+    def _clear(self, update_id: int):
+        index = update_id % self.window
+        self._bits[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+    def _advance(self, update_id: int):
+        """Сдвинуть окно так, чтобы update_id оказался его верхней границей"""
+        if update_id - self._high >= self.window:
+            self._bits[:] = bytes(len(self._bits))
+        else:
+            for old_id in range(self._high + 1, update_id + 1):
+                self._clear(old_id)
+        self._high = update_id
+
+    def is_duplicate(self, update_id: int) -> bool:
+        """Проверить update_id и запомнить его; True — такой update уже был"""
+        with self._lock:
+            if self._high is None:
+                self._high = update_id
+            elif update_id > self._high:
+                self._advance(update_id)
+            elif update_id <= self._high - self.window:
+                self._bits[:] = bytes(len(self._bits))
+                self._high = update_id
+                self.resets_total += 1
+
+            index = update_id % self.window
+            mask = 1 << (index & 7)
+            if self._bits[index >> 3] & mask:
+                self.duplicates_total += 1
+                return True
+            self._bits[index >> 3] |= mask
+            self.accepted_total += 1
+            return False
+
+    def forget(self, update_id: int):
+        """Забыть update_id (update не был принят — его повторная доставка не дубликат)"""
+        with self._lock:
+            if self._high is not None and self._high - self.window < update_id <= self._high:
+                self._clear(update_id)
+                self.accepted_total -= 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'window': self.window,
+                'last_update_id': self._high,
+                'accepted_total': self.accepted_total,
+                'duplicates_total': self.duplicates_total,
+                'resets_total': self.resets_total,
+            }
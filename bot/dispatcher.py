@@ -0,0 +1,172 @@
+# dispatcher.py
+# Параллельная обработка updates: разные чаты обрабатываются одновременно,
+# а updates одного чата — строго по очереди
+
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_id(update: Dict) -> Optional[int]:
+    """chat_id, к которому относится update (None, если его нет)"""
+    for key in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if key in update:
+            return update[key].get('chat', {}).get('id')
+    callback = update.get('callback_query')
+    if callback:
+        message = callback.get('message')
+        if message:
+            return message['chat']['id']
+        return callback.get('from', {}).get('id')
+    for key in ('inline_query', 'chosen_inline_result', 'pre_checkout_query', 'shipping_query',
+                'my_chat_member', 'chat_member', 'chat_join_request'):
+        if key in update:
+            item = update[key]
+            return item.get('chat', {}).get('id') or item.get('from', {}).get('id')
+    return None
+
+
+class UpdateDispatcher:
+    """Пул потоков-обработчиков с очередью на каждый чат.
+
+    handler   — функция, обрабатывающая один update (обычно BotManager.process_update)
+    workers   — сколько updates обрабатывается одновременно
+    queue_size — максимум принятых, но ещё не обработанных updates; submit() ждёт
+                 освобождения места (backpressure) или возвращает False по таймауту
+    """
+
+    def __init__(self, handler: Callable[[Dict], Any], workers: int = 8, queue_size: int = 1000):
+        self.handler = handler
+        self.workers = workers
+        self.queue_size = queue_size
+        self._slots = threading.Semaphore(queue_size)
+        self._lanes: Dict[Any, deque] = {}     # чат -> его необработанные updates
+        self._ready = queue.Queue()            # чаты, у которых есть работа и никто её не делает
+        self._lock = threading.Lock()
+        self._threads = []
+        self.running = False
+
+        # Статистика
+        self.queued = 0
+        self.max_queued = 0
+        self.busy_workers = 0
+        self.processed_total = 0
+        self.failed_total = 0
+        self.rejected_total = 0
+
+    def start(self) -> 'UpdateDispatcher':
+        """Запустить потоки-обработчики"""
+        if self.running:
+            return self
+        self.running = True
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'update-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Update dispatcher started with {self.workers} workers")
+        return self
+
+    def submit(self, update: Dict, timeout: float = None) -> bool:
+        """Поставить update в очередь его чата.
+
+        Если очередь заполнена — ждёт до timeout секунд (None — сколько потребуется)
+        и возвращает False, если место так и не освободилось.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self.rejected_total += 1
+            return False
+
+        chat_id = update_chat_id(update)
+        # update без чата не связан с другими — отдельная очередь на каждый
+        key = chat_id if chat_id is not None else ('update', update.get('update_id'))
+        with self._lock:
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            lane = self._lanes.get(key)
+            if lane is not None:
+                # Чат уже в работе или ждёт обработчика — просто добавляем в его очередь
+                lane.append(update)
+                return True
+            self._lanes[key] = deque([update])
+        self._ready.put(key)
+        return True
+
+    def _work(self):
+        while True:
+            key = self._ready.get()
+            if key is None:
+                return
+
+            with self._lock:
+                update = self._lanes[key].popleft()
+                self.busy_workers += 1
+
+            close_old_connections()
+            failed = False
+            try:
+                self.handler(update)
+            except Exception as e:
+                failed = True
+                logger.error(f"Unhandled error in update {update.get('update_id')}: {e}")
+            finally:
+                close_old_connections()
+
+            with self._lock:
+                self.busy_workers -= 1
+                self.queued -= 1
+                self.processed_total += 1
+                self.failed_total += 1 if failed else 0
+                has_more = bool(self._lanes[key])
+                if not has_more:
+                    del self._lanes[key]
+            self._slots.release()
+
+            # Следующий update этого чата — в конец общей очереди, чтобы
+            # активный чат не занимал обработчик в ущерб остальным
+            if has_more:
+                self._ready.put(key)
+
+    def stop(self, wait: bool = True):
+        """Остановить обработчики; при wait=True сначала дождаться обработки очереди"""
+        if not self.running:
+            return
+        if wait:
+            self.join()
+        self.running = False
+        for _ in self._threads:
+            self._ready.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+        logger.info("Update dispatcher stopped")
+
+    def join(self, poll_interval: float = 0.05):
+        """Дождаться, пока все принятые updates будут обработаны"""
+        while True:
+            with self._lock:
+                if not self.queued:
+                    return
+            time.sleep(poll_interval)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'busy_workers': self.busy_workers,
+                'queue_size': self.queue_size,
+                'queued': self.queued,
+                'max_queued': self.max_queued,
+                'active_chats': len(self._lanes),
+                'processed_total': self.processed_total,
+                'failed_total': self.failed_total,
+                'rejected_total': self.rejected_total,
+            }
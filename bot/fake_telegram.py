@@ -0,0 +1,495 @@
+# fake_telegram.py
+# Локальная замена Telegram Bot API для нагрузочных и офлайн тестов.
+#
+# Использование:
+#     server = FakeTelegramServer(latency=0.02, fail_rate_429=0.01).start()
+#     api = TelegramAPI('test-token', api_url=server.url)
+#     ...
+#     server.calls('sendMessage')   # журнал вызовов
+#     server.stop()
+#
+# Или как отдельный процесс: python manage.py run_fake_telegram --port 8081
+# и TELEGRAM_API_URL=http://127.0.0.1:8081 в .env
+
+import json
+import sys
+import time
+import random
+import logging
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+logger = logging.getLogger(__name__)
+
+BOT_INFO = {
+    'id': 100000001,
+    'is_bot': True,
+    'first_name': 'Fake Bot',
+    'username': 'fake_course_bot',
+}
+
+
+class FakeCall:
+    """Одна запись журнала вызовов"""
+
+    __slots__ = ('method', 'params', 'files', 'status', 'error_code', 'started_at', 'duration')
+
+    def __init__(self, method: str, params: Dict, files: Dict[str, int], started_at: float):
+        self.method = method
+        self.params = params
+        self.files = files              # имя поля -> размер файла в байтах
+        self.status = 200
+        self.error_code = None
+        self.started_at = started_at
+        self.duration = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error_code is None
+
+    def __repr__(self):
+        return f"FakeCall({self.method}, chat_id={self.params.get('chat_id')}, status={self.status})"
+
+
+class FakeTelegramServer(ThreadingHTTPServer):
+    """HTTP сервер, отвечающий как Bot API.
+
+    Поддерживает sendMessage, sendPhoto, sendDocument, editMessageText, deleteMessage,
+    answerCallbackQuery, getUpdates, getFile, getMe, set/deleteWebhook и скачивание файлов.
+
+    latency        — задержка ответа (сек), latency_jitter — случайная добавка к ней,
+                     method_latency — задержка для отдельных методов
+    fail_rate_429  — доля запросов, на которые отвечаем 429 с retry_after
+    fail_rate_403  — доля запросов с chat_id, на которые отвечаем 403
+    blocked_chats  — chat_id, которые всегда получают 403 (бот заблокирован)
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 latency_jitter: float = 0.0, method_latency: Dict[str, float] = None,
+                 fail_rate_429: float = 0.0, retry_after: float = 1.0, fail_rate_403: float = 0.0,
+                 blocked_chats=None, seed: int = None):
+        super().__init__((host, port), _FakeTelegramHandler)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.method_latency = dict(method_latency or {})
+        self.fail_rate_429 = fail_rate_429
+        self.retry_after = retry_after
+        self.fail_rate_403 = fail_rate_403
+        self.blocked_chats = {str(chat_id) for chat_id in blocked_chats or []}
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._updates_cond = threading.Condition(self._lock)
+        self._calls: List[FakeCall] = []
+        self._faults: Dict[str, List] = {}          # метод -> очередь (error_code, retry_after)
+        self._updates: List[Dict] = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._next_file_id = 1
+        self._files: Dict[str, Dict] = {}           # file_id -> {'data', 'file_path', 'name'}
+        self._files_by_path: Dict[str, str] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    # --- Управление сервером ---
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeTelegramServer':
+        """Запустить сервер в фоновом потоке"""
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-telegram', daemon=True)
+        self._thread.start()
+        logger.info(f"Fake Telegram Bot API listening on {self.url}")
+        return self
+
+    def stop(self):
+        """Остановить сервер"""
+        with self._updates_cond:
+            self._updates_cond.notify_all()
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def handle_error(self, request, client_address):
+        # Клиент не дождался медленного ответа (таймаут, дедлайн update) — это ожидаемо
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- Настройка сценария ---
+
+    def inject(self, method: str, error_code: int, count: int = 1, retry_after: float = None):
+        """Ответить ошибкой error_code на следующие count вызовов method ('*' — любой метод)"""
+        with self._lock:
+            self._faults.setdefault(method, []).extend([(error_code, retry_after)] * count)
+
+    def push_update(self, update: Dict) -> Dict:
+        """Добавить входящий update для getUpdates (update_id проставляется автоматически)"""
+        with self._updates_cond:
+            update = dict(update, update_id=self._next_update_id)
+            self._next_update_id += 1
+            self._updates.append(update)
+            self._updates_cond.notify_all()
+        return update
+
+    def push_message(self, chat_id: int, text: str, **extra) -> Dict:
+        """Добавить входящее текстовое сообщение от пользователя"""
+        with self._lock:
+            message_id = self._new_message_id()
+        return self.push_update({'message': {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User', 'language_code': 'uz'},
+            'text': text,
+            **extra,
+        }})
+
+    def push_callback(self, chat_id: int, data: str, message_id: int = 1) -> Dict:
+        """Добавить нажатие inline кнопки"""
+        return self.push_update({'callback_query': {
+            'id': str(self._random.getrandbits(63)),
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'User', 'language_code': 'uz'},
+            'message': {'message_id': message_id, 'chat': {'id': chat_id, 'type': 'private'}},
+            'chat_instance': str(chat_id),
+            'data': data,
+        }})
+
+    def block_chat(self, chat_id):
+        """Считать, что пользователь заблокировал бота (все запросы в его чат получают 403)"""
+        with self._lock:
+            self.blocked_chats.add(str(chat_id))
+
+    def add_file(self, data: bytes, name: str = 'file.bin') -> str:
+        """Положить файл на "сервер Telegram" и вернуть его file_id"""
+        with self._lock:
+            return self._store_file(data, name)
+
+    # --- Журнал вызовов ---
+
+    def calls(self, method: str = None) -> List[FakeCall]:
+        """Журнал вызовов (все или только указанного метода)"""
+        with self._lock:
+            return [call for call in self._calls if method is None or call.method == method]
+
+    def sent_messages(self, chat_id: int = None) -> List[Dict]:
+        """Параметры успешных send*/edit* вызовов, по порядку"""
+        return [call.params for call in self.calls()
+                if call.ok and call.method.startswith(('send', 'edit'))
+                and (chat_id is None or str(call.params.get('chat_id')) == str(chat_id))]
+
+    def reset(self):
+        """Очистить журнал, ошибки и очередь updates"""
+        with self._lock:
+            self._calls = []
+            self._faults = {}
+            self._updates = []
+
+    def get_stats(self) -> Dict:
+        """Сводка по журналу: число вызовов и ошибок по методам"""
+        stats = {}
+        for call in self.calls():
+            entry = stats.setdefault(call.method, {'calls': 0, 'errors': 0, 'duration_total': 0.0})
+            entry['calls'] += 1
+            entry['errors'] += 0 if call.ok else 1
+            entry['duration_total'] += call.duration
+        return stats
+
+    # --- Внутреннее ---
+
+    def _new_message_id(self) -> int:
+        message_id = self._next_message_id
+        self._next_message_id += 1
+        return message_id
+
+    def _store_file(self, data: bytes, name: str) -> str:
+        file_id = f"FAKE{self._next_file_id:08d}"
+        file_path = f"files/{self._next_file_id}_{name}"
+        self._next_file_id += 1
+        self._files[file_id] = {'data': data, 'file_path': file_path, 'name': name}
+        self._files_by_path[file_path] = file_id
+        return file_id
+
+    def _record(self, call: FakeCall):
+        with self._lock:
+            self._calls.append(call)
+
+    def _pick_fault(self, method: str, chat_id) -> Optional[tuple]:
+        """Решить, нужно ли ответить ошибкой: (error_code, retry_after) или None"""
+        with self._lock:
+            for key in (method, '*'):
+                queued = self._faults.get(key)
+                if queued:
+                    return queued.pop(0)
+            if chat_id is not None and str(chat_id) in self.blocked_chats:
+                return (403, None)
+            if self.fail_rate_429 and self._random.random() < self.fail_rate_429:
+                return (429, self.retry_after)
+            if chat_id is not None and self.fail_rate_403 and self._random.random() < self.fail_rate_403:
+                return (403, None)
+        return None
+
+    def _delay(self, method: str) -> float:
+        delay = self.method_latency.get(method, self.latency)
+        if self.latency_jitter:
+            with self._lock:
+                delay += self._random.random() * self.latency_jitter
+        return delay
+
+    def _message(self, params: Dict, **fields) -> Dict:
+        with self._lock:
+            message_id = self._new_message_id()
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': _as_int(params.get('chat_id')), 'type': 'private'},
+            'from': dict(BOT_INFO),
+            **fields,
+        }
+
+    def _photo_sizes(self, file_id: str, size: int) -> List[Dict]:
+        return [
+            {'file_id': f"{file_id}_s", 'file_unique_id': f"{file_id}_s", 'width': 90, 'height': 90, 'file_size': min(size, 2048)},
+            {'file_id': file_id, 'file_unique_id': file_id, 'width': 1280, 'height': 1280, 'file_size': size},
+        ]
+
+    def _resolve_upload(self, value, files: Dict, field: str) -> Optional[tuple]:
+        """Вернуть (file_id, размер) для загруженного файла или существующего file_id"""
+        if field in files:
+            name, data = files[field]
+            with self._lock:
+                return self._store_file(data, name), len(data)
+        if isinstance(value, str):
+            base_id = value[:-2] if value.endswith('_s') else value
+            with self._lock:
+                stored = self._files.get(base_id)
+            if stored:
+                return base_id, len(stored['data'])
+        return None
+
+    def handle_method(self, method: str, params: Dict, files: Dict) -> tuple:
+        """Выполнить метод Bot API: (http статус, тело ответа)"""
+        if method == 'getMe':
+            return 200, _ok(dict(BOT_INFO))
+
+        if method in ('setWebhook', 'deleteWebhook', 'answerCallbackQuery', 'deleteMessage'):
+            return 200, _ok(True)
+
+        if method == 'sendMessage':
+            if not params.get('text'):
+                return 400, _error(400, 'Bad Request: message text is empty')
+            return 200, _ok(self._message(params, text=params['text']))
+
+        if method == 'editMessageText':
+            message = self._message(params, text=params.get('text', ''), edit_date=int(time.time()))
+            message['message_id'] = _as_int(params.get('message_id'))
+            return 200, _ok(message)
+
+        if method == 'sendPhoto':
+            resolved = self._resolve_upload(params.get('photo'), files, 'photo')
+            if resolved is None:
+                return 400, _error(400, 'Bad Request: wrong file identifier/HTTP URL specified')
+            file_id, size = resolved
+            return 200, _ok(self._message(params, photo=self._photo_sizes(file_id, size),
+                                          caption=params.get('caption')))
+
+        if method == 'sendDocument':
+            resolved = self._resolve_upload(params.get('document'), files, 'document')
+            if resolved is None:
+                return 400, _error(400, 'Bad Request: wrong file identifier/HTTP URL specified')
+            file_id, size = resolved
+            with self._lock:
+                name = self._files[file_id]['name']
+            return 200, _ok(self._message(params, caption=params.get('caption'), document={
+                'file_id': file_id, 'file_unique_id': file_id, 'file_name': name, 'file_size': size,
+            }))
+
+        if method == 'getFile':
+            file_id = params.get('file_id', '')
+            file_id = file_id[:-2] if file_id.endswith('_s') else file_id
+            with self._lock:
+                stored = self._files.get(file_id)
+            if not stored:
+                return 400, _error(400, 'Bad Request: invalid file_id')
+            return 200, _ok({'file_id': file_id, 'file_unique_id': file_id,
+                             'file_size': len(stored['data']), 'file_path': stored['file_path']})
+
+        if method == 'getUpdates':
+            return 200, _ok(self._get_updates(params))
+
+        return 404, _error(404, 'Not Found')
+
+    def _get_updates(self, params: Dict) -> List[Dict]:
+        offset = _as_int(params.get('offset')) or 0
+        limit = _as_int(params.get('limit')) or 100
+        timeout = float(params.get('timeout') or 0)
+        deadline = time.monotonic() + timeout
+
+        with self._updates_cond:
+            # offset подтверждает все update с меньшим id, как в настоящем API
+            if offset:
+                self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._updates_cond.wait(remaining)
+            return self._updates[:limit]
+
+    def read_file(self, file_path: str) -> Optional[bytes]:
+        with self._lock:
+            file_id = self._files_by_path.get(file_path)
+            return self._files[file_id]['data'] if file_id else None
+
+
+class _FakeTelegramHandler(BaseHTTPRequestHandler):
+    """Разбор HTTP запросов в стиле Bot API: /bot<token>/<method> и /file/bot<token>/<path>"""
+
+    server: FakeTelegramServer
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # заголовки и тело пишутся отдельно — без этого +40мс на ответ
+
+    def log_message(self, format, *args):
+        logger.debug("fake telegram: " + format % args)
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        parts = urlsplit(self.path)
+        segments = parts.path.lstrip('/').split('/')
+
+        if len(segments) >= 3 and segments[0] == 'file' and segments[1].startswith('bot'):
+            self._send_file('/'.join(segments[2:]))
+            return
+
+        if len(segments) != 2 or not segments[0].startswith('bot'):
+            self._send_json(404, _error(404, 'Not Found'))
+            return
+
+        method = segments[1]
+        started_at = time.time()
+        try:
+            params, files = self._read_params(parts.query)
+        except Exception as e:
+            self._send_json(400, _error(400, f'Bad Request: {e}'))
+            return
+
+        call = FakeCall(method, params, {name: len(data) for name, (_, data) in files.items()}, started_at)
+        delay = self.server._delay(method)
+        if delay:
+            time.sleep(delay)
+
+        fault = self.server._pick_fault(method, params.get('chat_id')) if method != 'getUpdates' else None
+        if fault:
+            error_code, retry_after = fault
+            status, body = error_code, _fault_body(error_code, retry_after or self.server.retry_after)
+        else:
+            status, body = self.server.handle_method(method, params, files)
+
+        call.status = status
+        call.error_code = None if body.get('ok') else body.get('error_code')
+        call.duration = time.time() - started_at
+        self.server._record(call)
+        self._send_json(status, body)
+
+    def _read_params(self, query: str) -> tuple:
+        """Параметры из query string, JSON, form-urlencoded или multipart тела"""
+        params = dict(parse_qsl(query))
+        files = {}
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        content_type = self.headers.get('Content-Type', '')
+
+        if not body:
+            return params, files
+
+        if content_type.startswith('application/json'):
+            params.update(json.loads(body))
+        elif content_type.startswith('multipart/form-data'):
+            message = BytesParser(policy=HTTP).parsebytes(
+                f'Content-Type: {content_type}\r\n\r\n'.encode() + body
+            )
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                filename = part.get_filename()
+                payload = part.get_payload(decode=True) or b''
+                if filename is not None:
+                    files[name] = (filename, payload)
+                else:
+                    params[name] = payload.decode()
+        else:
+            params.update(parse_qsl(body.decode()))
+
+        if isinstance(params.get('reply_markup'), str):
+            try:
+                params['reply_markup'] = json.loads(params['reply_markup'])
+            except ValueError:
+                pass
+        return params, files
+
+    def _send_file(self, file_path: str):
+        data = self.server.read_file(file_path)
+        if data is None:
+            self._send_json(404, _error(404, 'Not Found'))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, status: int, body: Dict):
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _ok(result) -> Dict:
+    return {'ok': True, 'result': result}
+
+
+def _error(error_code: int, description: str, **extra) -> Dict:
+    return {'ok': False, 'error_code': error_code, 'description': description, **extra}
+
+
+def _fault_body(error_code: int, retry_after: float) -> Dict:
+    if error_code == 429:
+        return _error(429, f'Too Many Requests: retry after {retry_after}',
+                      parameters={'retry_after': retry_after})
+    if error_code == 403:
+        return _error(403, 'Forbidden: bot was blocked by the user')
+    if error_code == 400:
+        return _error(400, 'Bad Request: injected error')
+    return _error(error_code, 'Internal Server Error')
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
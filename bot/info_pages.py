@@ -0,0 +1,103 @@
+# info_pages.py
+# Кэш текстов InfoPage (О нас, Поддержка и т.д.) по (ключ, язык).
+# Страница читается из БД один раз; после сохранения/удаления страницы кэш сбрасывается
+# сигналом (см. signals.py), другие процессы замечают это по версии в БД (SharedVersion);
+# кроме того, страница старше max_age секунд перечитывается в любом случае.
+
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+
+from .cache import SharedVersion
+from .callback_codec import LANGUAGE
+
+logger = logging.getLogger(__name__)
+
+VERSION_CACHE_KEY = 'bot:info_pages:version'
+
+_MISSING = object()
+
+
+class InfoPageCache:
+    """Готовые тексты страниц: {ключ: {язык: текст}}; None — страницы с таким ключом нет"""
+
+    def __init__(self, check_interval: float = 5.0, max_age: Optional[float] = 300.0):
+        self.version = SharedVersion(VERSION_CACHE_KEY, check_interval)
+        self.max_age = max_age
+        # {ключ: (время загрузки, тексты)}
+        self._pages: Dict[str, Tuple[float, Optional[Dict[str, str]]]] = {}
+        self._seen_version: Optional[int] = None
+        # Растёт при каждом сбросе: страница, прочитанная до сброса, в кэш не попадает
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        # Статистика
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, key: str) -> Optional[Dict[str, str]]:
+        from .models import InfoPage
+        page = InfoPage.objects.filter(key=key).first()
+        if page is None:
+            return None
+        return {lang: page.get_content(lang) for lang in LANGUAGE.values}
+
+    def get(self, key: str, lang: str) -> Optional[str]:
+        """Текст страницы на языке пользователя; None — страницы нет"""
+        if self.version.changed_since(self._seen_version):
+            with self._lock:
+                self._pages = {}
+                self._generation += 1
+                self._seen_version = self.version.get()
+
+        entry = self._pages.get(key)
+        if entry is not None and not self._expired(entry):
+            self.hits += 1
+            page = entry[1]
+        else:
+            self.misses += 1
+            generation = self._generation
+            page = self._load(key)
+            with self._lock:
+                if generation == self._generation:
+                    self._pages[key] = (time.time(), page)
+
+        if page is None:
+            return None
+        return page.get(lang) or page[LANGUAGE.values[0]]
+
+    def _expired(self, entry: Tuple[float, Optional[Dict[str, str]]]) -> bool:
+        # Страховка от правок мимо сигналов (SQL вручную и т.п.), как и у каталога
+        return self.max_age is not None and time.time() - entry[0] > self.max_age
+
+    def invalidate(self, key: str = None):
+        """Страница изменилась: сбросить её здесь и сообщить другим процессам"""
+        with self._lock:
+            if key is None:
+                self._pages = {}
+            else:
+                self._pages.pop(key, None)
+            self._generation += 1
+        self.version.bump()
+
+    def get_stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'pages': len(self._pages),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+info_pages = InfoPageCache(
+    check_interval=getattr(settings, 'TELEGRAM_CATALOG_CHECK_INTERVAL', 5.0),
+    max_age=getattr(settings, 'TELEGRAM_CATALOG_MAX_AGE', 300.0),
+)
+
+
+def get_info_page(key: str, lang: str) -> Optional[str]:
+    return info_pages.get(key, lang)
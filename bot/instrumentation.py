@@ -0,0 +1,246 @@
+# instrumentation.py
+# Метрики запросов к Telegram API: счётчики и гистограммы задержек по методам,
+# объём данных, HTTP статусы и коды ошибок Telegram. Плюс выборочное debug-логирование запросов.
+# Метрики обработчиков updates: время, ошибки, число запросов к БД.
+
+import json
+import random
+import logging
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы задержек (секунды)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Границы корзин для времени работы обработчиков updates (секунды)
+HANDLER_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Сколько символов текста показывать в debug-логе
+DEBUG_TEXT_LIMIT = 200
+
+
+def histogram_percentile(bounds, buckets, count: int, maximum: float, fraction: float) -> Optional[float]:
+    """Оценка перцентиля по гистограмме: верхняя граница корзины (для последней — максимум)"""
+    if not count:
+        return None
+    target = fraction * count
+    seen = 0
+    for index, bucket in enumerate(buckets):
+        seen += bucket
+        if seen >= target:
+            return bounds[index] if index < len(bounds) else round(maximum, 3)
+    return round(maximum, 3)
+
+
+def histogram_add(bounds, buckets, value: float):
+    for index, bound in enumerate(bounds):
+        if value <= bound:
+            buckets[index] += 1
+            return
+    buckets[-1] += 1
+
+
+class MethodStats:
+    """Счётчики одного метода Bot API"""
+
+    __slots__ = ('calls', 'errors', 'latency_total', 'latency_max', 'buckets',
+                 'request_bytes', 'response_bytes', 'http_statuses', 'error_codes',
+                 'uploads', 'upload_bytes', 'upload_seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)     # последняя корзина — "больше 30с"
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.http_statuses: Dict[int, int] = {}
+        self.error_codes: Dict[int, int] = {}
+        # multipart загрузки файлов (sendPhoto/sendDocument с файлом)
+        self.uploads = 0
+        self.upload_bytes = 0
+        self.upload_seconds = 0.0
+
+    def add(self, duration: float, request_bytes: int, response_bytes: int,
+            http_status: Optional[int], error_code: Optional[int], upload: bool = False):
+        self.calls += 1
+        self.latency_total += duration
+        self.latency_max = max(self.latency_max, duration)
+        histogram_add(LATENCY_BUCKETS, self.buckets, duration)
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+        status = http_status or 0       # 0 — ответа не было (сетевая ошибка, таймаут)
+        self.http_statuses[status] = self.http_statuses.get(status, 0) + 1
+        if error_code is not None or status == 0:
+            self.errors += 1
+        if error_code is not None:
+            self.error_codes[error_code] = self.error_codes.get(error_code, 0) + 1
+        if upload:
+            self.uploads += 1
+            self.upload_bytes += request_bytes
+            self.upload_seconds += duration
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Оценка перцентиля по гистограмме (верхняя граница корзины)"""
+        return histogram_percentile(LATENCY_BUCKETS, self.buckets, self.calls, self.latency_max, fraction)
+
+    def as_dict(self) -> Dict:
+        histogram = {f"le_{bound:g}": count for bound, count in zip(LATENCY_BUCKETS, self.buckets)}
+        histogram['gt_max'] = self.buckets[-1]
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'latency_avg': round(self.latency_total / self.calls, 4) if self.calls else 0.0,
+            'latency_max': round(self.latency_max, 4),
+            'latency_p50': self.percentile(0.5),
+            'latency_p95': self.percentile(0.95),
+            'latency_histogram': histogram,
+            'request_bytes': self.request_bytes,
+            'response_bytes': self.response_bytes,
+            'http_statuses': dict(self.http_statuses),
+            'error_codes': dict(self.error_codes),
+            'uploads': self.uploads,
+            'upload_bytes': self.upload_bytes,
+            'upload_seconds': round(self.upload_seconds, 3),
+        }
+
+
+class RequestMetrics:
+    """Метрики всех запросов одного бота (потокобезопасно).
+
+    debug_sample_rate — доля запросов, параметры которых пишутся в debug-лог
+    (0 — никогда; логирование срабатывает, только если включён уровень DEBUG).
+    """
+
+    def __init__(self, debug_sample_rate: float = 0.0):
+        self.debug_sample_rate = debug_sample_rate
+        self.methods: Dict[str, MethodStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: str, duration: float, request_bytes: int = 0, response_bytes: int = 0,
+               http_status: Optional[int] = None, error_code: Optional[int] = None, upload: bool = False):
+        """Записать один HTTP запрос (upload — тело было multipart с файлами)"""
+        with self._lock:
+            stats = self.methods.get(method)
+            if stats is None:
+                stats = self.methods[method] = MethodStats()
+            stats.add(duration, request_bytes, response_bytes, http_status, error_code, upload)
+
+    def should_log(self) -> bool:
+        """Нужно ли записать этот запрос в debug-лог"""
+        return (self.debug_sample_rate > 0 and logger.isEnabledFor(logging.DEBUG)
+                and random.random() < self.debug_sample_rate)
+
+    def log_request(self, method: str, params: Optional[Dict], files: Optional[Dict],
+                    duration: float, http_status: Optional[int], error_code: Optional[int]):
+        """Записать параметры запроса в debug-лог (тексты обрезаются, файлы — только имена полей)"""
+        payload = {}
+        for key, value in (params or {}).items():
+            if isinstance(value, str) and len(value) > DEBUG_TEXT_LIMIT:
+                value = value[:DEBUG_TEXT_LIMIT] + '…'
+            elif not isinstance(value, (str, int, float, bool, type(None))):
+                value = f"<{type(value).__name__}>"
+            payload[key] = value
+        logger.debug(
+            f"Telegram API {method}: status={http_status} error_code={error_code} "
+            f"duration={duration:.3f}s params={json.dumps(payload, ensure_ascii=False)} "
+            f"files={sorted(files) if files else []}"
+        )
+
+    def get_stats(self) -> Dict:
+        """Сводка по методам и итог"""
+        with self._lock:
+            methods = {method: stats.as_dict() for method, stats in self.methods.items()}
+        return {
+            'total_calls': sum(stats['calls'] for stats in methods.values()),
+            'total_errors': sum(stats['errors'] for stats in methods.values()),
+            'methods': methods,
+        }
+
+    def reset(self):
+        with self._lock:
+            self.methods = {}
+
+
+class HandlerStats:
+    """Счётчики одного обработчика updates"""
+
+    __slots__ = ('calls', 'errors', 'latency_total', 'latency_max', 'buckets',
+                 'queries_total', 'queries_max')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * (len(HANDLER_LATENCY_BUCKETS) + 1)
+        self.queries_total = 0
+        self.queries_max = 0
+
+    def add(self, duration: float, queries: int, failed: bool):
+        self.calls += 1
+        self.errors += 1 if failed else 0
+        self.latency_total += duration
+        self.latency_max = max(self.latency_max, duration)
+        histogram_add(HANDLER_LATENCY_BUCKETS, self.buckets, duration)
+        self.queries_total += queries
+        self.queries_max = max(self.queries_max, queries)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        return histogram_percentile(HANDLER_LATENCY_BUCKETS, self.buckets, self.calls, self.latency_max, fraction)
+
+    def as_dict(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'latency_avg': round(self.latency_total / self.calls, 4) if self.calls else 0.0,
+            'latency_max': round(self.latency_max, 4),
+            'latency_p50': self.percentile(0.5),
+            'latency_p95': self.percentile(0.95),
+            'latency_p99': self.percentile(0.99),
+            'queries_avg': round(self.queries_total / self.calls, 2) if self.calls else 0.0,
+            'queries_max': self.queries_max,
+        }
+
+
+class HandlerMetrics:
+    """Метрики обработчиков updates по имени обработчика (потокобезопасно)"""
+
+    def __init__(self):
+        self.handlers: Dict[str, HandlerStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, duration: float, queries: int = 0, failed: bool = False):
+        with self._lock:
+            stats = self.handlers.get(name)
+            if stats is None:
+                stats = self.handlers[name] = HandlerStats()
+            stats.add(duration, queries, failed)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            handlers = {name: stats.as_dict() for name, stats in self.handlers.items()}
+        return {
+            'total_calls': sum(stats['calls'] for stats in handlers.values()),
+            'total_errors': sum(stats['errors'] for stats in handlers.values()),
+            'handlers': handlers,
+        }
+
+    def reset(self):
+        with self._lock:
+            self.handlers = {}
+
+
+# Как и rate limiter, метрики общие для всех клиентов одного токена в процессе
+_metrics: Dict[str, RequestMetrics] = {}
+_metrics_lock = threading.Lock()
+
+def get_request_metrics(token: str) -> RequestMetrics:
+    """Получить общий объект метрик для токена бота"""
+    with _metrics_lock:
+        if token not in _metrics:
+            _metrics[token] = RequestMetrics()
+        return _metrics[token]
@@ -0,0 +1,122 @@
+# keyboards.py
+# Реестр готовых клавиатур: каждая строится и сериализуется в JSON один раз
+# на (экран, язык, аргументы), дальше TelegramAPI отправляет готовую строку
+
+import json
+from functools import wraps
+from typing import Callable, Dict
+
+from .cache import LRUCache
+from .telegram_api import KeyboardBuilder
+from .translations import get_text
+from .callback_codec import Action, encode
+
+MAX_CACHED_KEYBOARDS = 2048
+
+# Клавиатуры с id курсов бесконечно разнообразны: вытесняются самые давно не использованные,
+# а не весь реестр сразу (иначе главное меню и т.п. пересобирались бы после каждого переполнения)
+_registry = LRUCache(max_size=MAX_CACHED_KEYBOARDS)
+
+
+def cached_keyboard(screen: str):
+    """Декоратор: функция (lang, *args) -> dict превращается в функцию -> JSON строка из кэша"""
+    def decorator(builder: Callable[..., Dict]):
+        @wraps(builder)
+        def wrapper(lang: str, *args) -> str:
+            key = (screen, lang, args)
+            markup = _registry.get(key)
+            if markup is None:
+                markup = json.dumps(builder(lang, *args), ensure_ascii=False, separators=(',', ':'))
+                _registry.set(key, markup)
+            return markup
+        return wrapper
+    return decorator
+
+
+def clear_keyboard_cache():
+    """Сбросить реестр (например, после изменения текстов)"""
+    _registry.clear()
+
+
+def get_keyboard_cache_stats() -> Dict:
+    return _registry.get_stats()
+
+
+# --- Reply клавиатуры ---
+
+@cached_keyboard('main_menu')
+def main_menu(lang: str) -> Dict:
+    return KeyboardBuilder.reply_keyboard([
+        [get_text('courses_button', lang)],
+        [get_text('about_button', lang), get_text('support_button', lang)]
+    ])
+
+
+@cached_keyboard('request_contact')
+def request_contact(lang: str) -> Dict:
+    return KeyboardBuilder.reply_keyboard(
+        [[{'text': get_text('request_contact_button', lang), 'request_contact': True}]],
+        one_time_keyboard=True
+    )
+
+
+# --- Inline клавиатуры ---
+
+@cached_keyboard('language_picker')
+def language_picker(lang: str) -> Dict:
+    return KeyboardBuilder.inline_keyboard([
+        [{'text': get_text('language_chosen_button', 'qr'), 'callback_data': encode(Action.SET_LANG, 'qr')}],
+        [{'text': get_text('language_chosen_button', 'uz'), 'callback_data': encode(Action.SET_LANG, 'uz')}]
+    ])
+
+
+@cached_keyboard('back_to_menu')
+def back_to_menu(lang: str) -> Dict:
+    return KeyboardBuilder.inline_keyboard([
+        [{'text': get_text('back_to_menu_button', lang), 'callback_data': encode(Action.BACK_TO_MENU)}]
+    ])
+
+
+@cached_keyboard('back_to_courses')
+def back_to_courses(lang: str) -> Dict:
+    return KeyboardBuilder.inline_keyboard([
+        [{'text': get_text('back_to_courses_button', lang), 'callback_data': encode(Action.BACK_TO_COURSES)}]
+    ])
+
+
+@cached_keyboard('courses_and_menu')
+def courses_and_menu(lang: str) -> Dict:
+    return KeyboardBuilder.inline_keyboard([
+        [{'text': get_text('back_to_courses_button', lang), 'callback_data': encode(Action.BACK_TO_COURSES)}],
+        [{'text': get_text('back_to_menu_button', lang), 'callback_data': encode(Action.BACK_TO_MENU)}]
+    ])
+
+
+@cached_keyboard('back_to_course')
+def back_to_course(lang: str, course_id: int) -> Dict:
+    return KeyboardBuilder.inline_keyboard([
+        [{'text': get_text('back_button', lang), 'callback_data': encode(Action.COURSE, course_id)}]
+    ])
+
+
+@cached_keyboard('payment_details')
+def payment_details(lang: str, course_id: int) -> Dict:
+    return KeyboardBuilder.inline_keyboard([
+        [{'text': get_text('cancel_purchase_button', lang), 'callback_data': encode(Action.CANCEL_PAYMENT)}],
+        [{'text': get_text('back_button', lang), 'callback_data': encode(Action.COURSE, course_id)}]
+    ])
+
+
+@cached_keyboard('other_courses')
+def other_courses(lang: str) -> Dict:
+    return KeyboardBuilder.inline_keyboard([
+        [{'text': get_text('other_courses_button', lang), 'callback_data': encode(Action.BACK_TO_COURSES)}]
+    ])
+
+
+@cached_keyboard('payment_rejected')
+def payment_rejected(lang: str, course_id: int) -> Dict:
+    return KeyboardBuilder.inline_keyboard([
+        [{'text': get_text('retry_payment_button', lang), 'callback_data': encode(Action.BUY, course_id)}],
+        [{'text': get_text('support_button', lang), 'callback_data': encode(Action.SUPPORT)}]
+    ])
@@ -10,7 +10,7 @@ python manage.py broadcast_message "Ваше сообщение" --active-only
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from bot.models import TelegramUser
-from bot_manager import BotManager
+from bot.bot_manager import BotManager
 import time
 
 class Command(BaseCommand):
@@ -31,8 +31,9 @@ class Command(BaseCommand):
         parser.add_argument(
             '--delay',
             type=float,
-            default=0.1,
-            help='Delay between messages in seconds (default: 0.1)'
+            default=0.0,
+            help='Extra delay between messages in seconds (default: 0, '
+                 'throughput is governed by the built-in rate limiter)'
         )
         parser.add_argument(
             '--dry-run',
@@ -85,22 +86,29 @@ class Command(BaseCommand):
             
             sent_count = 0
             error_count = 0
+            status_counts = {}
             
-            for user in users:
-                try:
-                    bot.send_message(user.chat_id, message)
+            # Генератор читается в отдельном потоке, поэтому chat_id загружаем заранее
+            chat_ids = list(users.values_list('chat_id', flat=True))
+            
+            def messages():
+                for chat_id in chat_ids:
+                    yield {'chat_id': chat_id, 'text': message}
+                    if options['delay']:
+                        time.sleep(options['delay'])
+            
+            # Разные чаты отправляются параллельно, темп задаёт общий rate limiter
+            for result in bot.api.send_many(messages()):
+                status_counts[result.status] = status_counts.get(result.status, 0) + 1
+                if result.ok:
                     sent_count += 1
-                    
                     if sent_count % 10 == 0:
                         self.stdout.write(f"Sent {sent_count}/{user_count}")
-                    
-                    time.sleep(options['delay'])
-                
-                except Exception as e:
+                else:
                     error_count += 1
                     if error_count <= 5:  # Показываем только первые 5 ошибок
                         self.stdout.write(
-                            self.style.WARNING(f"Failed to send to {user.chat_id}: {e}")
+                            self.style.WARNING(f"Failed to send to {result.chat_id}: {result.error}")
                         )
             
             self.stdout.write(
@@ -108,6 +116,20 @@ class Command(BaseCommand):
                     f"Broadcast completed: {sent_count} sent, {error_count} failed"
                 )
             )
+            if error_count:
+                self.stdout.write(
+                    "Failures by status: " + ", ".join(
+                        f"{status}={count}" for status, count in status_counts.items()
+                        if status != 'ok'
+                    )
+                )
+            
+            stats = bot.api.rate_limiter.get_stats()
+            self.stdout.write(
+                f"Rate limiter: {stats['delayed_total']} delayed, "
+                f"avg wait {stats['wait_time_avg']}s, max wait {stats['wait_time_max']}s, "
+                f"{stats['retry_after_total']} retry_after"
+            )
             
         except Exception as e:
             self.stdout.write(
@@ -0,0 +1,91 @@
+# bot/management/commands/run_fake_telegram.py
+"""
+Django management команда: локальный fake Telegram Bot API для нагрузочных тестов
+
+Использование:
+python manage.py run_fake_telegram --port 8081 --latency 0.05 --fail-rate-429 0.01
+(и TELEGRAM_API_URL=http://127.0.0.1:8081 для бота / рассылки)
+"""
+
+import time
+from django.core.management.base import BaseCommand
+from bot.fake_telegram import FakeTelegramServer
+
+class Command(BaseCommand):
+    help = 'Run a local fake Telegram Bot API server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='127.0.0.1', help='Bind address')
+        parser.add_argument('--port', type=int, default=8081, help='Port (default: 8081)')
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.0,
+            help='Response latency in seconds'
+        )
+        parser.add_argument(
+            '--jitter',
+            type=float,
+            default=0.0,
+            help='Random extra latency in seconds'
+        )
+        parser.add_argument(
+            '--fail-rate-429',
+            type=float,
+            default=0.0,
+            help='Share of requests answered with 429 Too Many Requests'
+        )
+        parser.add_argument(
+            '--retry-after',
+            type=float,
+            default=1.0,
+            help='retry_after value for injected 429 responses'
+        )
+        parser.add_argument(
+            '--fail-rate-403',
+            type=float,
+            default=0.0,
+            help='Share of chat requests answered with 403 (bot blocked)'
+        )
+        parser.add_argument(
+            '--blocked-chats',
+            type=str,
+            default='',
+            help='Comma separated chat ids that always get 403'
+        )
+        parser.add_argument(
+            '--stats-interval',
+            type=float,
+            default=10.0,
+            help='Print call statistics every N seconds (0 to disable)'
+        )
+
+    def handle(self, *args, **options):
+        blocked = [chat_id.strip() for chat_id in options['blocked_chats'].split(',') if chat_id.strip()]
+        server = FakeTelegramServer(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency'],
+            latency_jitter=options['jitter'],
+            fail_rate_429=options['fail_rate_429'],
+            retry_after=options['retry_after'],
+            fail_rate_403=options['fail_rate_403'],
+            blocked_chats=blocked,
+        ).start()
+
+        self.stdout.write(self.style.SUCCESS(f"Fake Telegram Bot API listening on {server.url}"))
+        self.stdout.write(f"Set TELEGRAM_API_URL={server.url} to use it")
+
+        try:
+            while True:
+                time.sleep(options['stats_interval'] or 3600)
+                if options['stats_interval']:
+                    for method, entry in sorted(server.get_stats().items()):
+                        avg = entry['duration_total'] / entry['calls'] if entry['calls'] else 0
+                        self.stdout.write(
+                            f"{method}: {entry['calls']} calls, {entry['errors']} errors, avg {avg * 1000:.1f} ms"
+                        )
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping...")
+        finally:
+            server.stop()
@@ -0,0 +1,127 @@
+# media_cache.py
+# Кэш Telegram file_id для изображений моделей: файл загружается в Telegram один раз,
+# дальше отправляется по file_id
+
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional
+
+from .models import TelegramFileCache
+from .telegram_api import TelegramAPI, TelegramAPIError
+
+logger = logging.getLogger(__name__)
+
+# Поля моделей, для которых ведётся кэш (используется сигналами для инвалидации)
+CACHED_MEDIA_FIELDS = {
+    'courses.Course': ['preview_image'],
+    'payments.Advertisement': ['image'],
+}
+
+
+def file_sha256(field_file) -> str:
+    """SHA-256 файла из storage, читая его кусками"""
+    digest = hashlib.sha256()
+    field_file.open('rb')
+    try:
+        for chunk in field_file.chunks():
+            digest.update(chunk)
+    finally:
+        field_file.close()
+    return digest.hexdigest()
+
+
+class CachedMedia:
+    """Медиафайл из поля модели, отправляемый через кэш file_id.
+
+    Хэш файла считается один раз на объект CachedMedia, поэтому для рассылки
+    достаточно создать его один раз и вызывать send_photo для каждого получателя.
+    """
+
+    def __init__(self, instance, field_name: str):
+        self.instance = instance
+        self.field_name = field_name
+        self.field_file = getattr(instance, field_name)
+        self.model_label = instance._meta.label
+        self._file_hash = None
+        self._file_id = None
+        self._lookup_done = False
+        self._lock = threading.Lock()
+
+    @property
+    def file_hash(self) -> str:
+        if self._file_hash is None:
+            self._file_hash = file_sha256(self.field_file)
+        return self._file_hash
+
+    def _cached_file_id(self) -> Optional[str]:
+        if not self._lookup_done:
+            self._file_id = TelegramFileCache.objects.filter(
+                model_label=self.model_label,
+                field_name=self.field_name,
+                file_hash=self.file_hash,
+            ).values_list('file_id', flat=True).first()
+            self._lookup_done = True
+        return self._file_id
+
+    def _remember(self, file_id: str):
+        TelegramFileCache.objects.update_or_create(
+            model_label=self.model_label,
+            field_name=self.field_name,
+            file_hash=self.file_hash,
+            defaults={
+                'object_id': str(self.instance.pk),
+                'file_name': self.field_file.name,
+                'file_id': file_id,
+            }
+        )
+        self._file_id = file_id
+
+    def _forget(self):
+        TelegramFileCache.objects.filter(
+            model_label=self.model_label,
+            field_name=self.field_name,
+            file_hash=self.file_hash,
+        ).delete()
+        self._file_id = None
+
+    def send_photo(self, api: TelegramAPI, chat_id: int, caption: str = None,
+                   reply_markup: Dict = None) -> Dict:
+        """Отправить фото: по file_id, если он есть, иначе загрузить файл и запомнить file_id"""
+        file_id = self._cached_file_id()
+        if file_id:
+            try:
+                return api.send_photo(chat_id, file_id, caption, reply_markup)
+            except TelegramAPIError as e:
+                if e.error_code != 400:
+                    raise
+                # file_id больше не действителен — загрузим файл заново
+                logger.warning(f"Cached file_id for {self.model_label}.{self.field_name} rejected: {e}")
+                with self._lock:
+                    if self._file_id == file_id:
+                        self._forget()
+
+        # Загружаем только один раз, даже если рассылка идёт из нескольких потоков
+        with self._lock:
+            if self._file_id:
+                return api.send_photo(chat_id, self._file_id, caption, reply_markup)
+
+            message = api.send_photo(chat_id, self.field_file, caption, reply_markup)
+            photo_sizes = (message or {}).get('photo') or []
+            if photo_sizes:
+                self._remember(photo_sizes[-1]['file_id'])
+                logger.info(f"Cached file_id for {self.model_label}.{self.field_name} #{self.instance.pk}")
+            return message
+
+
+def invalidate_media_cache(instance, keep_current: bool = True):
+    """Удалить записи кэша для объекта, чьи файлы изменились (или все, если keep_current=False)"""
+    label = instance._meta.label
+    for field_name in CACHED_MEDIA_FIELDS.get(label, []):
+        stale = TelegramFileCache.objects.filter(
+            model_label=label, object_id=str(instance.pk), field_name=field_name
+        )
+        current = getattr(instance, field_name, None)
+        if keep_current and current:
+            stale = stale.exclude(file_name=current.name)
+        stale.delete()
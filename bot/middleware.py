@@ -0,0 +1,135 @@
+# middleware.py
+# Цепочка middleware вокруг вызова обработчиков updates:
+# before -> обработчик -> after (или on_error, если обработчик бросил исключение)
+
+import time
+import logging
+from contextlib import ExitStack
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from django.db import connections
+
+from .instrumentation import HandlerMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class HandlerCall:
+    """Один вызов обработчика; middleware могут хранить своё в extra"""
+
+    __slots__ = ('bot', 'update', 'handler', 'name', 'extra', 'handled_error')
+
+    def __init__(self, bot, update: Dict, handler: Callable):
+        self.bot = bot
+        self.update = update
+        self.handler = handler
+        self.name = getattr(handler, '__name__', repr(handler))
+        self.extra: Dict[str, Any] = {}
+        # Исключение, которое обработчик перехватил сам (report_handled_error)
+        self.handled_error: Optional[Exception] = None
+
+
+# Вызов обработчика, который сейчас выполняется (у вложенного вызова — свой)
+_current_call: ContextVar[Optional[HandlerCall]] = ContextVar('handler_call', default=None)
+
+
+def report_handled_error(error: Exception):
+    """Обработчик сам перехватил исключение: засчитать его текущему вызову (MessageContext.report_error)"""
+    call = _current_call.get()
+    if call is not None:
+        call.handled_error = error
+
+
+class Middleware:
+    """Базовый класс: переопределяются нужные хуки"""
+
+    def before(self, call: HandlerCall):
+        """Перед обработчиком"""
+
+    def after(self, call: HandlerCall):
+        """После успешного обработчика"""
+
+    def on_error(self, call: HandlerCall, error: Exception):
+        """Обработчик бросил исключение (оно пробрасывается дальше)
+        или перехватил его сам и сообщил через ctx.report_error"""
+
+
+class MiddlewarePipeline:
+    """before вызываются в порядке добавления, after/on_error — в обратном.
+
+    Ошибка в самом middleware логируется и не мешает обработчику.
+    """
+
+    def __init__(self, middlewares: List[Middleware] = None):
+        self.middlewares: List[Middleware] = list(middlewares or [])
+
+    def add(self, middleware: Middleware):
+        self.middlewares.append(middleware)
+
+    def _hook(self, middleware: Middleware, hook: str, *args):
+        try:
+            getattr(middleware, hook)(*args)
+        except Exception as e:
+            logger.error(f"Error in {type(middleware).__name__}.{hook}: {e}")
+
+    def run(self, bot, handler: Callable, update: Dict):
+        """Вызвать handler(bot, update) через цепочку middleware"""
+        call = HandlerCall(bot, update, handler)
+        entered = []
+        for middleware in self.middlewares:
+            self._hook(middleware, 'before', call)
+            entered.append(middleware)
+        # Ошибка внешнего обработчика не должна засчитываться вложенному (и наоборот)
+        token = _current_call.set(call)
+        try:
+            result = handler(bot, update)
+        except Exception as e:
+            for middleware in reversed(entered):
+                self._hook(middleware, 'on_error', call, e)
+            raise
+        finally:
+            _current_call.reset(token)
+        if call.handled_error is not None:
+            for middleware in reversed(entered):
+                self._hook(middleware, 'on_error', call, call.handled_error)
+        else:
+            for middleware in reversed(entered):
+                self._hook(middleware, 'after', call)
+        return result
+
+
+class _QueryCounter:
+    """execute_wrapper, считающий запросы к БД"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class HandlerMetricsMiddleware(Middleware):
+    """Время, ошибки и число запросов к БД по каждому обработчику"""
+
+    def __init__(self, metrics: HandlerMetrics):
+        self.metrics = metrics
+
+    def before(self, call: HandlerCall):
+        counter = _QueryCounter()
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        call.extra['metrics'] = (time.perf_counter(), counter, stack)
+
+    def _finish(self, call: HandlerCall, failed: bool):
+        started, counter, stack = call.extra.pop('metrics')
+        stack.close()
+        self.metrics.record(call.name, time.perf_counter() - started, counter.count, failed)
+
+    def after(self, call: HandlerCall):
+        self._finish(call, failed=False)
+
+    def on_error(self, call: HandlerCall, error: Exception):
+        self._finish(call, failed=True)
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0007_alter_infopage_options_alter_telegramuser_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramFileCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_label', models.CharField(max_length=100, verbose_name='Модель')),
+                ('object_id', models.CharField(max_length=64, verbose_name='ID объекта')),
+                ('field_name', models.CharField(max_length=50, verbose_name='Поле')),
+                ('file_name', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('file_hash', models.CharField(max_length=64, verbose_name='SHA-256 файла')),
+                ('file_id', models.CharField(max_length=255, verbose_name='Telegram file_id')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Кэш файлов Telegram',
+                'verbose_name_plural': 'Кэш файлов Telegram',
+                'indexes': [models.Index(fields=['model_label', 'object_id', 'field_name'], name='bot_telegra_model_l_a4cd1a_idx')],
+                'unique_together': {('model_label', 'field_name', 'file_hash')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0008_telegramfilecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='Ключ')),
+                ('version', models.PositiveBigIntegerField(default=1, verbose_name='Версия')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Версия кэша',
+                'verbose_name_plural': 'Версии кэша',
+            },
+        ),
+    ]
@@ -36,9 +36,14 @@ class TelegramUser(models.Model):
         parts = [self.first_name, self.last_name]
         return " ".join(filter(None, parts)) or "Не указано"
 
-    def update_activity(self):
+    def update_activity(self, immediate: bool = False):
+        """Отметить активность. По умолчанию запись в БД отложенная (см. bot.activity)"""
         self.last_activity = timezone.now()
-        self.save(update_fields=['last_activity'])
+        if immediate:
+            self.save(update_fields=['last_activity'])
+            return
+        from .activity import get_activity_tracker
+        get_activity_tracker().record(self.pk, self.last_activity)
 
 
 class UserState(models.Model):
@@ -84,4 +89,43 @@ class InfoPage(models.Model):
         verbose_name_plural = "Информационные страницы"
 
     def get_content(self, lang_code: str):
-        return getattr(self, f'content_{lang_code}', self.content_qr)
\ No newline at end of file
+        return getattr(self, f'content_{lang_code}', self.content_qr)
+
+class TelegramFileCache(models.Model):
+    """file_id Telegram для уже загруженных медиафайлов (чтобы не загружать их повторно)"""
+
+    model_label = models.CharField(max_length=100, verbose_name="Модель")
+    object_id = models.CharField(max_length=64, verbose_name="ID объекта")
+    field_name = models.CharField(max_length=50, verbose_name="Поле")
+    file_name = models.CharField(max_length=255, verbose_name="Имя файла")
+    file_hash = models.CharField(max_length=64, verbose_name="SHA-256 файла")
+    file_id = models.CharField(max_length=255, verbose_name="Telegram file_id")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+
+    class Meta:
+        verbose_name = "Кэш файлов Telegram"
+        verbose_name_plural = "Кэш файлов Telegram"
+        unique_together = ['model_label', 'field_name', 'file_hash']
+        indexes = [models.Index(fields=['model_label', 'object_id', 'field_name'])]
+
+    def __str__(self):
+        return f"{self.model_label}.{self.field_name} #{self.object_id} ({self.file_name})"
+
+
+class CacheVersion(models.Model):
+    """Версия закэшированных в процессах данных (каталог, страницы).
+
+    Хранится в БД, чтобы изменение, сделанное в одном процессе (админка),
+    увидели все остальные (бот) независимо от того, общий ли у них Django cache.
+    """
+
+    key = models.CharField(max_length=100, unique=True, verbose_name="Ключ")
+    version = models.PositiveBigIntegerField(default=1, verbose_name="Версия")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Версия кэша"
+        verbose_name_plural = "Версии кэша"
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
@@ -0,0 +1,137 @@
+# multipart.py
+# Потоковое multipart/form-data тело запроса: файлы читаются кусками, а не целиком в память
+
+import os
+import uuid
+import mimetypes
+from typing import Dict, Iterator, List, Tuple
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _open_source(source) -> Tuple[object, str, int, bool]:
+    """Открыть источник файла: (файловый объект, имя, размер, нужно ли закрыть после отправки)"""
+    # Пустой FieldFile (поле без файла) ложен, а hasattr(source, 'size') на нём выбрасывает ValueError
+    if not source:
+        raise ValueError("No file to upload")
+
+    # Django FieldFile / File (у них есть storage-размер и собственный open)
+    if hasattr(source, 'open') and hasattr(source, 'size') and hasattr(source, 'name'):
+        closed = getattr(source, 'closed', True)
+        source.open('rb')
+        if not closed:
+            source.seek(0)
+        return source, os.path.basename(source.name or 'file'), source.size, closed
+
+    # Путь к файлу на диске
+    if isinstance(source, os.PathLike):
+        path = os.fspath(source)
+        return open(path, 'rb'), os.path.basename(path), os.path.getsize(path), True
+
+    # (имя, файловый объект) — как в requests
+    if isinstance(source, tuple):
+        name, source = source[0], source[1]
+    else:
+        name = os.path.basename(getattr(source, 'name', None) or 'file')
+
+    # Обычный файловый объект: размер = от текущей позиции до конца
+    if isinstance(source, bytes):
+        raise TypeError("Use a file object, FieldFile or path for streaming uploads")
+    position = source.tell()
+    source.seek(0, os.SEEK_END)
+    size = source.tell() - position
+    source.seek(position)
+    return source, name, size, False
+
+
+class MultipartStream:
+    """Файлоподобное multipart тело с известной длиной (Content-Length).
+
+    requests/urllib3 читают его блоками через read(), поэтому файл никогда
+    не оказывается в памяти целиком.
+    """
+
+    def __init__(self, fields: Dict = None, files: Dict = None):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        self._parts: List[Tuple[bytes, object, int]] = []   # (заголовок части, файл или None, размер)
+        self._to_close = []
+
+        for key, value in (fields or {}).items():
+            if value is None:
+                continue
+            header = (
+                f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{key}"\r\n\r\n'
+            ).encode() + str(value).encode() + b'\r\n'
+            self._parts.append((header, None, 0))
+
+        for key, source in (files or {}).items():
+            file_obj, name, size, should_close = _open_source(source)
+            if should_close:
+                self._to_close.append(file_obj)
+            mime_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            name = name.replace('"', '%22').replace('\r', '').replace('\n', '')
+            header = (
+                f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{key}"; filename="{name}"\r\n'
+                f'Content-Type: {mime_type}\r\n\r\n'
+            ).encode()
+            self._parts.append((header, file_obj, size))
+
+        self._closing = f'--{self.boundary}--\r\n'.encode()
+        self.length = sum(len(header) + size + (2 if file_obj is not None else 0)
+                          for header, file_obj, size in self._parts) + len(self._closing)
+        self.bytes_sent = 0
+        self._chunks = self._iter_chunks()
+        self._buffer = b''
+
+    def _iter_chunks(self) -> Iterator[bytes]:
+        for header, file_obj, size in self._parts:
+            yield header
+            if file_obj is not None:
+                remaining = size
+                while remaining > 0:
+                    chunk = file_obj.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise IOError("File ended before its declared size")
+                    remaining -= len(chunk)
+                    yield chunk
+                yield b'\r\n'
+        yield self._closing
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._chunks:
+            self.bytes_sent += len(chunk)
+            yield chunk
+
+    async def aiter_chunks(self):
+        """Асинхронный итератор по телу (для httpx.AsyncClient)"""
+        for chunk in self:
+            yield chunk
+
+    def read(self, size: int = -1) -> bytes:
+        """Прочитать до size байт тела (интерфейс файла для http.client)"""
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self.bytes_sent += len(data)
+        return data
+
+    def close(self):
+        """Закрыть файлы, которые открыл сам поток"""
+        for file_obj in self._to_close:
+            try:
+                file_obj.close()
+            except Exception:
+                pass
+        self._to_close = []
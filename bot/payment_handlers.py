@@ -4,6 +4,7 @@
 import os
 import logging
 from datetime import datetime
+from django.core.files import File
 from django.core.files.base import ContentFile
 from django.conf import settings
 from django.utils import timezone
@@ -14,11 +15,17 @@ from courses.models import Course, PaymentMethod
 from payments.models import Payment, PaymentNotification
 
 # Kóp tillilik ushın jańa importlar
-from .translations import get_text
+from .translations import get_text, texts_for
+from . import keyboards
+from .callback_codec import Action, encode
 from .utils import get_user_language
+from .catalog import get_catalog
 
 logger = logging.getLogger(__name__)
 
+# Chektiń maksimal kólemi
+MAX_RECEIPT_SIZE = 10 * 1024 * 1024
+
 def setup_payment_handlers(bot: BotManager):
     """Tólem обработчиклерин sazlaw"""
     
@@ -32,21 +39,21 @@ def setup_payment_handlers(bot: BotManager):
 def handle_buy_course(bot: BotManager, update: dict):
     """Kurs satıp alıwdı baslaw"""
     ctx = MessageContext(bot, update)
-    lang = get_user_language(ctx.chat_id)
+    lang = get_user_language(ctx)
     
     try:
-        course_id = int(ctx.callback_data.split('_')[1])
-        course = Course.objects.get(id=course_id)
+        course_id = ctx.callback.course_id
+        course = ctx.get_object(Course, course_id)
         course_name = getattr(course, f'name_{lang}', course.name_qr)
 
         if not course.is_available:
             ctx.edit_message(
                 get_text('course_not_available', lang),
-                KeyboardBuilder.inline_keyboard([[{'text': get_text('back_to_courses_button', lang), 'callback_data': "back_to_courses"}]])
+                keyboards.back_to_courses(lang)
             )
             return
         
-        telegram_user = TelegramUser.objects.get(chat_id=ctx.chat_id)
+        telegram_user = ctx.get_telegram_user()
         existing_payment = Payment.objects.filter(
             user=telegram_user, course=course, status__in=['approved', 'pending']
         ).first()
@@ -57,23 +64,25 @@ def handle_buy_course(bot: BotManager, update: dict):
             else:
                 message = get_text('payment_already_pending', lang).format(course_name=course_name, status=existing_payment.get_status_display())
             
-            ctx.edit_message(message, KeyboardBuilder.inline_keyboard([[{'text': get_text('back_to_courses_button', lang), 'callback_data': "back_to_courses"}]])
-            )
+            ctx.edit_message(message, keyboards.back_to_courses(lang))
             return
         
-        payment_methods = PaymentMethod.objects.filter(is_active=True).order_by('order')
+        payment_methods = get_catalog(lang).payment_methods
         
         if not payment_methods:
             ctx.edit_message(
                 get_text('no_payment_methods_available', lang),
-                KeyboardBuilder.inline_keyboard([[{'text': get_text('back_button', lang), 'callback_data': f"course_{course_id}"}]])
+                keyboards.back_to_course(lang, course_id)
             )
             return
         
-        if payment_methods.count() == 1:
-            fake_update = update.copy()
-            fake_update['callback_query'] = fake_update.get('callback_query', {})
-            fake_update['callback_query']['data'] = f"payment_method_{course_id}_{payment_methods.first().id}"
+        if len(payment_methods) == 1:
+            # Jalǵız usıl bolsa, onı tańlanǵan dep esaplaymız (asıl update ózgermeydi)
+            payment_method = payment_methods[0]
+            fake_update = dict(update, callback_query=dict(
+                update['callback_query'],
+                data=encode(Action.PAYMENT_METHOD, course_id, payment_method.id)
+            ))
             handle_payment_method_selection(bot, fake_update)
             return
 
@@ -81,10 +90,9 @@ def handle_buy_course(bot: BotManager, update: dict):
         
         buttons = []
         for method in payment_methods:
-            method_name = getattr(method, f'name_{lang}', method.name_qr)
-            buttons.append([{'text': f"💳 {method_name}", 'callback_data': f"payment_method_{course_id}_{method.id}"}])
+            buttons.append([{'text': f"💳 {method.name}", 'callback_data': encode(Action.PAYMENT_METHOD, course_id, method.id)}])
         
-        buttons.append([{'text': get_text('cancel_button', lang), 'callback_data': f"course_{course_id}"}])
+        buttons.append([{'text': get_text('cancel_button', lang), 'callback_data': encode(Action.COURSE, course_id)}])
         
         keyboard = KeyboardBuilder.inline_keyboard(buttons)
         ctx.edit_message(message, keyboard)
@@ -93,6 +101,7 @@ def handle_buy_course(bot: BotManager, update: dict):
         
     except Exception as e:
         logger.error(f"Error in buy course: {e}")
+        ctx.report_error(e)
         ctx.reply(get_text('error_buy_course', lang))
 
 # payment_handlers.py
@@ -100,70 +109,74 @@ def handle_buy_course(bot: BotManager, update: dict):
 def handle_payment_method_selection(bot: BotManager, update: dict):
     """Tólem usılın tańlawdı qayta islew"""
     ctx = MessageContext(bot, update)
-    lang = get_user_language(ctx.chat_id)
+    lang = get_user_language(ctx)
+    t = texts_for(lang)
     
     try:
-        parts = ctx.callback_data.split('_')
-        course_id = int(parts[2])
-        method_id = int(parts[3])
+        course_id, method_id = ctx.callback.course_id, ctx.callback.method_id
         
-        course = Course.objects.get(id=course_id)
-        payment_method = PaymentMethod.objects.get(id=method_id)
+        # Kurs hám tólem usılı katalog snapshotınan (bazaǵa soraw joq)
+        catalog = get_catalog(lang)
+        course = catalog.courses_by_id.get(course_id)
+        payment_method = catalog.payment_methods_by_id.get(method_id)
+
+        # *_by_id aktiv emeslerdi de saqlaydı: kurs óshirilgennen keyin kelgen eski túyme tólemdi baslamawı kerek
+        if course is None or not course.is_active:
+            ctx.edit_message(t.course_not_available, keyboards.back_to_courses(lang))
+            return
+        if payment_method is None or not payment_method.is_active:
+            ctx.edit_message(t.no_payment_methods_available, keyboards.back_to_course(lang, course_id))
+            return
         
-        course_name = course.get_name(lang)
-        method_name = payment_method.get_name(lang)
+        course_name = course.name
+        method_name = payment_method.name
 
         # --- ÓZGERISLER USı JERDE BASLANADı ---
 
         # 1. Rekvizitler tekstin bólek jıynaymız
         requisites_info = f"💳 {method_name}\n"
         if payment_method.card_number:
-            requisites_info += f"{get_text('payment_method_card_number', lang)} {payment_method.card_number}\n"
+            requisites_info += f"{t.payment_method_card_number} {payment_method.card_number}\n"
         if payment_method.cardholder_name:
-            requisites_info += f"{get_text('payment_method_cardholder', lang)} {payment_method.cardholder_name}\n"
+            requisites_info += f"{t.payment_method_cardholder} {payment_method.cardholder_name}\n"
         if payment_method.bank_name:
-            requisites_info += f"{get_text('payment_method_bank', lang)} {payment_method.bank_name}\n"
+            requisites_info += f"{t.payment_method_bank} {payment_method.bank_name}\n"
         
-        method_instructions = payment_method.get_instructions(lang)
+        method_instructions = payment_method.instructions
         if method_instructions:
-            requisites_info += f"{get_text('payment_method_instructions', lang)}\n{method_instructions}"
+            requisites_info += f"{t.payment_method_instructions}\n{method_instructions}"
 
         # 2. Ulıwma xabardı sol rekvizitler menen birge quramız
-        message = get_text('payment_details_title', lang).format(course_name=course_name)
-        message += get_text('amount_to_pay', lang).format(price=course.price)
-        message += get_text('payment_requisites', lang)
+        message = t.payment_details_title.format(course_name=course_name)
+        message += t.amount_to_pay.format(price=course.price)
+        message += t.payment_requisites
         
         # Eski funkciya shaqırıwı ornına jańa jıynalǵan tekstti qosamız
         message += requisites_info 
         
-        message += get_text('important_note', lang)
-        message += get_text('important_note_1', lang).format(price=course.price)
-        message += get_text('important_note_2', lang)
-        message += get_text('important_note_3', lang)
-        message += get_text('send_receipt_prompt', lang)
+        message += t.important_note
+        message += t.important_note_1.format(price=course.price)
+        message += t.important_note_2
+        message += t.important_note_3
+        message += t.send_receipt_prompt
         
         # --- ÓZGERISLER USı JERDE JUWMAQLANADı ---
 
-        buttons = [
-            [{'text': get_text('cancel_purchase_button', lang), 'callback_data': "cancel_payment"}],
-            [{'text': get_text('back_button', lang), 'callback_data': f"course_{course_id}"}]
-        ]
-        
-        keyboard = KeyboardBuilder.inline_keyboard(buttons)
-        
-        ctx.edit_message(message, keyboard)
+        ctx.edit_message(message, keyboards.payment_details(lang, course_id))
         ctx.set_state(BotStates.WAITING_RECEIPT)
         ctx.set_data('buying_course_id', course_id)
         ctx.set_data('payment_method_id', method_id)
         
     except Exception as e:
         logger.error(f"Error in payment method selection: {e}")
-        ctx.reply(get_text('error_payment_method_selection', lang))
+        ctx.report_error(e)
+        ctx.reply(t.error_payment_method_selection)
         
 def handle_photo_receipt(bot: BotManager, update: dict):
     """Chek fotosın qabıl etiw"""
     ctx = MessageContext(bot, update)
-    lang = get_user_language(ctx.chat_id)
+    lang = get_user_language(ctx)
+    t = texts_for(lang)
     
     if ctx.user_state != BotStates.WAITING_RECEIPT: return
     
@@ -172,58 +185,60 @@ def handle_photo_receipt(bot: BotManager, update: dict):
         method_id = ctx.user_data.get('payment_method_id')
         
         if not course_id or not method_id:
-            ctx.reply(get_text('error_purchase_data_lost', lang))
+            ctx.reply(t.error_purchase_data_lost)
             return
         
-        course = Course.objects.get(id=course_id)
-        payment_method = PaymentMethod.objects.get(id=method_id)
-        telegram_user = TelegramUser.objects.get(chat_id=ctx.chat_id)
+        course = ctx.get_object(Course, course_id)
+        payment_method = ctx.get_object(PaymentMethod, method_id)
+        telegram_user = ctx.get_telegram_user()
         
         photos = ctx.message.get('photo', [])
         if not photos:
-            ctx.reply(get_text('error_photo_not_found', lang))
+            ctx.reply(t.error_photo_not_found)
             return
         
         photo = max(photos, key=lambda p: p.get('file_size', 0))
         file_id = photo['file_id']
-        file_content = bot.download_file(file_id)
+        receipt_file = bot.download_file(file_id, max_bytes=MAX_RECEIPT_SIZE)
         
-        if not file_content:
-            ctx.reply(get_text('error_photo_download', lang))
+        if not receipt_file:
+            ctx.reply(t.error_photo_download)
             return
         
-        payment = create_payment_record(
-            telegram_user, course, payment_method, 
-            file_content, 'photo.jpg', ctx.message.get('caption', '')
-        )
+        with receipt_file:
+            payment = create_payment_record(
+                telegram_user, course, payment_method, 
+                receipt_file, 'photo.jpg', ctx.message.get('caption', '')
+            )
         
         if payment:
             course_name = getattr(course, f'name_{lang}', course.name_qr)
             method_name = getattr(payment_method, f'name_{lang}', payment_method.name_qr)
 
-            success_message = get_text('receipt_accepted_photo', lang)
-            success_message += f"{get_text('course_label', lang)} {course_name}\n"
-            success_message += f"{get_text('amount_label', lang)} {course.price} sum\n"
-            success_message += f"{get_text('payment_method_label', lang)} {method_name}\n"
-            success_message += get_text('payment_pending_admin_review', lang)
+            success_message = t.receipt_accepted_photo
+            success_message += f"{t.course_label} {course_name}\n"
+            success_message += f"{t.amount_label} {course.price} sum\n"
+            success_message += f"{t.payment_method_label} {method_name}\n"
+            success_message += t.payment_pending_admin_review
             
-            keyboard = KeyboardBuilder.inline_keyboard([[{'text': get_text('back_to_menu_button', lang), 'callback_data': "back_to_menu"}]])
-            ctx.reply(success_message, keyboard, parse_mode='HTML')
+            ctx.reply(success_message, keyboards.back_to_menu(lang), parse_mode='HTML')
             ctx.set_state(BotStates.MAIN_MENU)
             
-            ctx.user_data.pop('buying_course_id', None)
-            ctx.user_data.pop('payment_method_id', None)
+            ctx.pop_data('buying_course_id', None)
+            ctx.pop_data('payment_method_id', None)
         else:
-            ctx.reply(get_text('error_payment_save', lang))
+            ctx.reply(t.error_payment_save)
         
     except Exception as e:
         logger.error(f"Error processing photo receipt: {e}")
-        ctx.reply(get_text('error_processing_receipt', lang))
+        ctx.report_error(e)
+        ctx.reply(t.error_processing_receipt)
 
 def handle_document_receipt(bot: BotManager, update: dict):
     """Chek hújjetin qabıl etiw"""
     ctx = MessageContext(bot, update)
-    lang = get_user_language(ctx.chat_id)
+    lang = get_user_language(ctx)
+    t = texts_for(lang)
     
     if ctx.user_state != BotStates.WAITING_RECEIPT: return
     
@@ -232,89 +247,94 @@ def handle_document_receipt(bot: BotManager, update: dict):
         method_id = ctx.user_data.get('payment_method_id')
         
         if not course_id or not method_id:
-            ctx.reply(get_text('error_purchase_data_lost', lang))
+            ctx.reply(t.error_purchase_data_lost)
             return
         
-        course = Course.objects.get(id=course_id)
-        payment_method = PaymentMethod.objects.get(id=method_id)
-        telegram_user = TelegramUser.objects.get(chat_id=ctx.chat_id)
+        course = ctx.get_object(Course, course_id)
+        payment_method = ctx.get_object(PaymentMethod, method_id)
+        telegram_user = ctx.get_telegram_user()
         
         document = ctx.message.get('document')
         if not document:
-            ctx.reply(get_text('error_document_not_found', lang))
+            ctx.reply(t.error_document_not_found)
             return
         
         file_name = document.get('file_name', 'receipt')
-        if document.get('file_size', 0) > 10 * 1024 * 1024:
-            ctx.reply(get_text('error_file_too_large', lang))
+        if document.get('file_size', 0) > MAX_RECEIPT_SIZE:
+            ctx.reply(t.error_file_too_large)
             return
         
         if document.get('mime_type') not in ['application/pdf', 'image/jpeg', 'image/png', 'image/jpg']:
-            ctx.reply(get_text('error_unsupported_format', lang))
+            ctx.reply(t.error_unsupported_format)
             return
         
-        file_content = bot.download_file(document['file_id'])
-        if not file_content:
-            ctx.reply(get_text('error_file_download', lang))
+        receipt_file = bot.download_file(document['file_id'], max_bytes=MAX_RECEIPT_SIZE)
+        if not receipt_file:
+            ctx.reply(t.error_file_download)
             return
         
-        payment = create_payment_record(
-            telegram_user, course, payment_method, 
-            file_content, file_name, ctx.message.get('caption', '')
-        )
+        with receipt_file:
+            payment = create_payment_record(
+                telegram_user, course, payment_method, 
+                receipt_file, file_name, ctx.message.get('caption', '')
+            )
         
         if payment:
             course_name = getattr(course, f'name_{lang}', course.name_qr)
             method_name = getattr(payment_method, f'name_{lang}', payment_method.name_qr)
 
-            success_message = get_text('receipt_accepted_document', lang)
-            success_message += f"{get_text('course_label', lang)} {course_name}\n"
-            success_message += f"{get_text('amount_label', lang)} {course.price} sum\n"
-            success_message += f"{get_text('payment_method_label', lang)} {method_name}\n"
-            success_message += f"{get_text('file_label', lang)} {file_name}\n"
-            success_message += get_text('payment_pending_admin_review', lang)
+            success_message = t.receipt_accepted_document
+            success_message += f"{t.course_label} {course_name}\n"
+            success_message += f"{t.amount_label} {course.price} sum\n"
+            success_message += f"{t.payment_method_label} {method_name}\n"
+            success_message += f"{t.file_label} {file_name}\n"
+            success_message += t.payment_pending_admin_review
             
-            keyboard = KeyboardBuilder.inline_keyboard([[{'text': get_text('back_to_menu_button', lang), 'callback_data': "back_to_menu"}]])
-            ctx.reply(success_message, keyboard, parse_mode='HTML')
+            ctx.reply(success_message, keyboards.back_to_menu(lang), parse_mode='HTML')
             ctx.set_state(BotStates.MAIN_MENU)
             
-            ctx.user_data.pop('buying_course_id', None)
-            ctx.user_data.pop('payment_method_id', None)
+            ctx.pop_data('buying_course_id', None)
+            ctx.pop_data('payment_method_id', None)
         else:
-            ctx.reply(get_text('error_payment_save', lang))
+            ctx.reply(t.error_payment_save)
         
     except Exception as e:
         logger.error(f"Error processing document receipt: {e}")
-        ctx.reply(get_text('error_processing_document', lang))
+        ctx.report_error(e)
+        ctx.reply(t.error_processing_document)
 
 def handle_cancel_payment(bot: BotManager, update: dict):
     """Tólem processin biykar etiw"""
     ctx = MessageContext(bot, update)
-    lang = get_user_language(ctx.chat_id)
+    lang = get_user_language(ctx)
     
     ctx.edit_message(
         get_text('purchase_cancelled', lang),
-        KeyboardBuilder.inline_keyboard([
-            [{'text': get_text('back_to_courses_button', lang), 'callback_data': "back_to_courses"}],
-            [{'text': get_text('back_to_menu_button', lang), 'callback_data': "back_to_menu"}]
-        ])
+        keyboards.courses_and_menu(lang)
     )
     
     ctx.set_state(BotStates.MAIN_MENU)
-    ctx.user_data.pop('buying_course_id', None)
-    ctx.user_data.pop('payment_method_id', None)
+    ctx.pop_data('buying_course_id', None)
+    ctx.pop_data('payment_method_id', None)
 
 # --- JÁRDEMSHI FUNKCIYALAR (PAYDALANÍWSHÍǴA XABAR JIBERMEYDI) ---
 
 def create_payment_record(user: TelegramUser, course: Course, payment_method: PaymentMethod, 
-                         file_content: bytes, file_name: str, user_comment: str = '') -> Payment:
-    """Maǵlıwmatlar bazasında tólem jazıwın jaratıw"""
+                         file_content, file_name: str, user_comment: str = '') -> Payment:
+    """Maǵlıwmatlar bazasında tólem jazıwın jaratıw.
+    
+    file_content — ashıq fayl (mısalı, bot.download_file nátiyjesi) yamasa bytes.
+    Fayl storage-ǵa bóleklep jazıladı, yadqa tolıq oqılmaydı.
+    """
     try:
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         file_extension = os.path.splitext(file_name)[1] or '.jpg'
         unique_filename = f"receipt_{user.chat_id}_{timestamp}{file_extension}"
         
-        django_file = ContentFile(file_content, name=unique_filename)
+        if isinstance(file_content, bytes):
+            django_file = ContentFile(file_content, name=unique_filename)
+        else:
+            django_file = File(file_content, name=unique_filename)
         
         payment = Payment.objects.create(
             user=user,
@@ -327,7 +347,10 @@ def create_payment_record(user: TelegramUser, course: Course, payment_method: Pa
         )
         
         PaymentNotification.objects.create(payment=payment)
-        logger.info(f"Payment created: {payment.id} for user {user.chat_id}")
+        logger.info(
+            f"Payment created: {payment.id} for user {user.chat_id}"
+            + (f" (sha256 {file_content.sha256})" if getattr(file_content, 'sha256', None) else "")
+        )
         return payment
         
     except Exception as e:
@@ -359,16 +382,20 @@ def send_admin_notification(bot: BotManager, payment: Payment):
         message += f"Tólemdi adminkada tekseriń: /admin/payments/payment/{payment.id}/change/"
         
         buttons = [
-            [{'text': "✅ Tastıyıqlaw", 'callback_data': f"admin_approve_{payment.id}"},
-             {'text': "❌ Biykar etiw", 'callback_data': f"admin_reject_{payment.id}"}]
+            [{'text': "✅ Tastıyıqlaw", 'callback_data': encode(Action.ADMIN_APPROVE, payment.id)},
+             {'text': "❌ Biykar etiw", 'callback_data': encode(Action.ADMIN_REJECT, payment.id)}]
         ]
         
         keyboard = KeyboardBuilder.inline_keyboard(buttons)
         bot.send_message(admin_chat_id, message, keyboard, parse_mode='HTML')
         
         if payment.receipt_file:
-            # ... (chek jiberiw kodı ózgerissiz qaladı) ...
-            pass
+            # FieldFile tikkeley beriledi: fayl Telegram-ǵa bóleklep (stream) júkleniledi
+            caption = f"🧾 Tólem #{payment.id} cheki"
+            if payment.is_image:
+                bot.send_photo(admin_chat_id, payment.receipt_file, caption)
+            else:
+                bot.send_document(admin_chat_id, payment.receipt_file, caption)
         
         notification = payment.notification
         notification.admin_notified = True
@@ -380,60 +407,77 @@ def send_admin_notification(bot: BotManager, payment: Payment):
 
 # --- PAYDALANÍWSHÍǴA NÁTIYJE JIBERIW ---
 
-def send_payment_result_to_user(bot: BotManager, payment: Payment, approved: bool):
-    """Tólem nátiyjesin paydalanıwshıǵa jiberiw"""
-    lang = get_user_language(payment.user.chat_id)
+def build_payment_result_message(payment: Payment, approved: bool) -> dict:
+    """Tólem nátiyjesi xabarın send_message / send_many ushın parametrler retinde tayarlaw.
+    Bazaǵa hesh nárse jazbaydı: jiberilgeni mark_payment_result_sent() arqalı belgilenedi"""
+    lang = get_user_language(payment.user)
+    t = texts_for(lang)
     course_name = getattr(payment.course, f'name_{lang}', payment.course.name_qr)
     
-    try:
-        if approved:
-            message = get_text('payment_approved_title', lang)
-            message += f"{get_text('course_label', lang)} {course_name}\n"
-            message += f"{get_text('amount_label', lang)} {payment.amount} sum\n\n"
-            message += get_text('congratulations_on_purchase', lang)
-            message += get_text('group_link_message', lang).format(group_link=payment.course.group_link)
-            message += get_text('join_group_and_start', lang)
-            
-            keyboard = KeyboardBuilder.inline_keyboard([
-                [{'text': get_text('other_courses_button', lang), 'callback_data': "back_to_courses"}]
-            ])
-            
-            payment.link_sent = True
-            payment.save()
-            payment.notification.user_notified_approved = True
-            payment.notification.save()
-            
-        else: # Biykar etilgen bolsa
-            message = get_text('payment_rejected_title', lang)
-            message += f"{get_text('course_label', lang)} {course_name}\n"
-            message += f"{get_text('amount_label', lang)} {payment.amount} sum\n\n"
-            message += get_text('payment_rejected_body', lang)
-            
-            if payment.comment:
-                message += get_text('admin_comment_message', lang).format(comment=payment.comment)
-            
-            message += get_text('if_questions_contact_support', lang)
-            
-            keyboard = KeyboardBuilder.inline_keyboard([
-                [{'text': get_text('retry_payment_button', lang), 'callback_data': f"buy_{payment.course.id}"}],
-                [{'text': get_text('support_button', lang), 'callback_data': "support"}]
-            ])
-            
-            payment.notification.user_notified_rejected = True
-            payment.notification.save()
+    if approved:
+        message = t.payment_approved_title
+        message += f"{t.course_label} {course_name}\n"
+        message += f"{t.amount_label} {payment.amount} sum\n\n"
+        message += t.congratulations_on_purchase
+        message += t.group_link_message.format(group_link=payment.course.group_link)
+        message += t.join_group_and_start
         
-        bot.send_message(payment.user.chat_id, message, keyboard, parse_mode='HTML')
+        keyboard = keyboards.other_courses(lang)
+        
+    else: # Biykar etilgen bolsa
+        message = t.payment_rejected_title
+        message += f"{t.course_label} {course_name}\n"
+        message += f"{t.amount_label} {payment.amount} sum\n\n"
+        message += t.payment_rejected_body
+        
+        if payment.comment:
+            message += t.admin_comment_message.format(comment=payment.comment)
+        
+        message += t.if_questions_contact_support
+        
+        keyboard = keyboards.payment_rejected(lang, payment.course_id)
+    
+    return {
+        'chat_id': payment.user.chat_id,
+        'text': message,
+        'reply_markup': keyboard,
+        'parse_mode': 'HTML',
+        'key': payment.id,
+    }
+
+def mark_payment_result_sent(payment: Payment, approved: bool):
+    """Xabar haqıyqatında jetkerilgennen keyin ǵana link_sent hám user_notified_* belgilerin qoyıw"""
+    if approved:
+        payment.link_sent = True
+        payment.save(update_fields=['link_sent', 'updated_at'])
+    notification, _ = PaymentNotification.objects.get_or_create(payment=payment)
+    field = 'user_notified_approved' if approved else 'user_notified_rejected'
+    setattr(notification, field, True)
+    notification.save(update_fields=[field])
+
+def send_payment_result_to_user(bot: BotManager, payment: Payment, approved: bool) -> bool:
+    """Tólem nátiyjesin paydalanıwshıǵa jiberiw; True — xabar jetkerildi"""
+    try:
+        params = build_payment_result_message(payment, approved)
+        if bot.send_message(params['chat_id'], params['text'], params['reply_markup'], parse_mode='HTML') is None:
+            return False
+        mark_payment_result_sent(payment, approved)
         logger.info(f"Payment result sent to user {payment.user.chat_id}")
+        return True
         
     except Exception as e:
         logger.error(f"Error sending payment result to user: {e}")
+        return False
 
 # --- ADMIN USHÍN CALLBACK HANDLER (ÓZGERISSZ QALADÍ) ---
 def handle_confirm_payment(bot: BotManager, update: dict):
     """Tólem tastıyıqlanıwın admin tárepinen qayta islew (bir tilde)"""
     ctx = MessageContext(bot, update)
+    if ctx.callback is None:
+        ctx.edit_message("❌ Qátelik: Tólem tabılmadı yamasa ID nadurıs.")
+        return
     try:
-        payment_id = int(ctx.callback_data.split('_')[-1])
+        payment_id = ctx.callback.payment_id
         payment = Payment.objects.get(id=payment_id)
         
         if payment.status != 'pending':
@@ -454,8 +498,9 @@ def handle_confirm_payment(bot: BotManager, update: dict):
         ctx.edit_message(success_message, parse_mode='HTML')
         logger.info(f"Payment {payment.id} approved by admin {ctx.chat_id}")
         
-    except (ValueError, Payment.DoesNotExist) as e:
+    except Payment.DoesNotExist:
         ctx.edit_message("❌ Qátelik: Tólem tabılmadı yamasa ID nadurıs.")
     except Exception as e:
         logger.error(f"Error confirming payment: {e}")
+        ctx.report_error(e)
         ctx.edit_message("❌ Tólemdi tastıyıqlawda qátelik júz berdi.")
\ No newline at end of file
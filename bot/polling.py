@@ -0,0 +1,121 @@
+# polling.py
+# Long polling с предвыборкой: следующий getUpdates уже ждёт ответа,
+# пока предыдущая пачка updates раздаётся обработчикам
+
+import time
+import queue
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from .telegram_api import TelegramAPI
+
+logger = logging.getLogger(__name__)
+
+# Пауза после ошибки getUpdates растёт от минимальной до максимальной
+ERROR_BACKOFF_MIN = 1.0
+ERROR_BACKOFF_MAX = 30.0
+
+
+class UpdatePoller:
+    """Итератор по пачкам updates, получаемым long polling в отдельном потоке.
+
+    Пустые ответы (long poll истёк без updates) наружу не отдаются, а пауза делается
+    только после ошибок — в обычном режиме запрос getUpdates висит на сервере всегда.
+
+    timeout         — long poll timeout (сек), который передаётся в getUpdates
+    allowed_updates — типы updates, которые нужны боту (остальные Telegram не присылает)
+    prefetch        — сколько полученных, но ещё не розданных пачек можно держать
+    """
+
+    def __init__(self, api: TelegramAPI, timeout: int = 30, limit: int = 100,
+                 allowed_updates: Optional[List[str]] = None, offset: int = None, prefetch: int = 1):
+        self.api = api
+        self.timeout = timeout
+        self.limit = limit
+        self.allowed_updates = allowed_updates
+        self.offset = offset
+        self._batches = queue.Queue(maxsize=prefetch)
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Статистика
+        self.polls_total = 0
+        self.empty_polls = 0
+        self.updates_total = 0
+        self.errors_total = 0
+        self.last_poll_duration = 0.0
+
+    def start(self) -> 'UpdatePoller':
+        """Запустить поток, выполняющий getUpdates"""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._fetch_loop, name='update-poller', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Остановить polling (текущий getUpdates дорабатывает в фоне)"""
+        self._stopped.set()
+
+    @property
+    def running(self) -> bool:
+        return not self._stopped.is_set()
+
+    def _fetch_loop(self):
+        backoff = ERROR_BACKOFF_MIN
+        while not self._stopped.is_set():
+            started = time.monotonic()
+            try:
+                updates = self.api.get_updates(
+                    offset=self.offset,
+                    limit=self.limit,
+                    timeout=self.timeout,
+                    allowed_updates=self.allowed_updates
+                )
+            except Exception as e:
+                self.errors_total += 1
+                logger.error(f"Polling error: {e}, retrying in {backoff:.0f}s")
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, ERROR_BACKOFF_MAX)
+                continue
+
+            backoff = ERROR_BACKOFF_MIN
+            self.polls_total += 1
+            self.last_poll_duration = time.monotonic() - started
+            if not updates:
+                self.empty_polls += 1
+                continue
+
+            self.updates_total += len(updates)
+            # Следующий запрос подтверждает эту пачку и сразу уходит на сервер
+            self.offset = updates[-1]['update_id'] + 1
+            self._put(updates)
+
+    def _put(self, updates: List[Dict]):
+        """Отдать пачку потребителю; ждём, если он не успевает (prefetch заполнен)"""
+        while not self._stopped.is_set():
+            try:
+                self._batches.put(updates, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def __iter__(self) -> Iterator[List[Dict]]:
+        if self._thread is None:
+            self.start()
+        while not self._stopped.is_set() or not self._batches.empty():
+            try:
+                yield self._batches.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def get_stats(self) -> Dict:
+        return {
+            'polls_total': self.polls_total,
+            'empty_polls': self.empty_polls,
+            'updates_total': self.updates_total,
+            'errors_total': self.errors_total,
+            'last_poll_duration': round(self.last_poll_duration, 3),
+            'offset': self.offset,
+            'prefetched_batches': self._batches.qsize(),
+        }
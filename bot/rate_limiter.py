@@ -0,0 +1,189 @@
+# rate_limiter.py
+# Ограничитель исходящих запросов к Telegram API (token bucket: глобальный + на каждый чат)
+
+import time
+import asyncio
+import threading
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """Token bucket с резервированием: токены могут уходить в минус, дефицит = время ожидания"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def reserve(self, now: float) -> float:
+        """Забрать один токен и вернуть, сколько секунд нужно подождать до его появления"""
+        self._refill(now)
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def refund(self):
+        """Вернуть ранее зарезервированный токен"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def is_idle(self, now: float) -> bool:
+        """Ведро полностью наполнено и его можно выбросить"""
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """Глобальный лимит (~30 msg/s) плюс лимит на каждый чат (~1 msg/s) с очередью ожидания"""
+
+    def __init__(self, global_rate: float = 30.0, global_burst: float = 30.0,
+                 chat_rate: float = 1.0, chat_burst: float = 3.0, max_chat_buckets: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chat_buckets = max_chat_buckets
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+        # Статистика
+        self.queue_depth = 0        # Сколько запросов сейчас ждут своей очереди
+        self.max_queue_depth = 0
+        self.acquired_total = 0
+        self.delayed_total = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.retry_after_total = 0  # Сколько раз получили 429 и "припарковали" запрос
+        self.retry_after_time_total = 0.0
+
+    def _prune_chat_buckets(self, now: float):
+        """Удалить простаивающие вёдра, чтобы словарь не рос бесконечно"""
+        for chat_id in [cid for cid, bucket in self.chat_buckets.items() if bucket.is_idle(now)]:
+            del self.chat_buckets[chat_id]
+
+    def reserve(self, chat_id: Optional[int] = None, max_wait: float = None) -> Optional[float]:
+        """Зарезервировать слот для одного запроса и вернуть время ожидания в секундах.
+
+        Если ожидание превысило бы max_wait, резерв отменяется и возвращается None.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = self.global_bucket.reserve(now)
+
+            bucket = None
+            if chat_id is not None:
+                bucket = self.chat_buckets.get(chat_id)
+                if bucket is None:
+                    if len(self.chat_buckets) >= self.max_chat_buckets:
+                        self._prune_chat_buckets(now)
+                    bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+                wait = max(wait, bucket.reserve(now))
+
+            if max_wait is not None and wait > max_wait:
+                self.global_bucket.refund()
+                if bucket is not None:
+                    bucket.refund()
+                return None
+
+            self.acquired_total += 1
+            if wait > 0:
+                self.delayed_total += 1
+                self.wait_time_total += wait
+                self.wait_time_max = max(self.wait_time_max, wait)
+            return wait
+
+    def _enter_queue(self):
+        with self._lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def _leave_queue(self):
+        with self._lock:
+            self.queue_depth -= 1
+
+    def _record_retry_after(self, retry_after: float):
+        with self._lock:
+            self.retry_after_total += 1
+            self.retry_after_time_total += retry_after
+
+    def acquire(self, chat_id: Optional[int] = None, max_wait: float = None) -> bool:
+        """Дождаться разрешения на отправку (блокирующая версия).
+
+        Возвращает False, если пришлось бы ждать дольше max_wait.
+        """
+        wait = self.reserve(chat_id, max_wait)
+        if wait is None:
+            return False
+        if wait > 0:
+            self._enter_queue()
+            try:
+                time.sleep(wait)
+            finally:
+                self._leave_queue()
+        return True
+
+    async def acquire_async(self, chat_id: Optional[int] = None, max_wait: float = None) -> bool:
+        """Дождаться разрешения на отправку (асинхронная версия)"""
+        wait = self.reserve(chat_id, max_wait)
+        if wait is None:
+            return False
+        if wait > 0:
+            self._enter_queue()
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._leave_queue()
+        return True
+
+    def park(self, retry_after: float):
+        """Припарковать только текущий запрос на retry_after секунд после ответа 429"""
+        self._record_retry_after(retry_after)
+        self._enter_queue()
+        try:
+            time.sleep(retry_after)
+        finally:
+            self._leave_queue()
+
+    async def park_async(self, retry_after: float):
+        """Асинхронная версия park()"""
+        self._record_retry_after(retry_after)
+        self._enter_queue()
+        try:
+            await asyncio.sleep(retry_after)
+        finally:
+            self._leave_queue()
+
+    def get_stats(self) -> Dict:
+        """Статистика очереди и ожиданий"""
+        with self._lock:
+            return {
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'acquired_total': self.acquired_total,
+                'delayed_total': self.delayed_total,
+                'wait_time_total': round(self.wait_time_total, 3),
+                'wait_time_max': round(self.wait_time_max, 3),
+                'wait_time_avg': round(self.wait_time_total / self.delayed_total, 3) if self.delayed_total else 0.0,
+                'retry_after_total': self.retry_after_total,
+                'retry_after_time_total': round(self.retry_after_time_total, 3),
+                'tracked_chats': len(self.chat_buckets),
+            }
+
+
+# Лимиты Telegram действуют на токен бота, а не на экземпляр клиента,
+# поэтому все клиенты одного процесса делят один ограничитель
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(token: str) -> RateLimiter:
+    """Получить общий ограничитель для токена бота"""
+    with _limiters_lock:
+        if token not in _limiters:
+            _limiters[token] = RateLimiter()
+        return _limiters[token]
@@ -0,0 +1,86 @@
+# routing.py
+# Маршрутизация callback_data: префиксное дерево с выбором самого длинного совпадения
+
+from typing import Callable, Dict, Optional, Tuple
+
+ARG_SEPARATOR = '_'
+
+
+def parse_callback_args(rest: str) -> Tuple:
+    """'12_3_qr' -> (12, 3, 'qr'): части после префикса, числа приводятся к int"""
+    rest = rest.lstrip(ARG_SEPARATOR)
+    if not rest:
+        return ()
+    # isdigit() истинно и для '²', '٣' и т.п., а int() их не принимает — только ASCII цифры
+    return tuple(int(part) if part.isascii() and part.isdigit() else part for part in rest.split(ARG_SEPARATOR))
+
+
+class CallbackMatch:
+    """Результат поиска: обработчик, совпавший префикс и аргументы из остатка строки"""
+
+    __slots__ = ('handler', 'prefix', 'args')
+
+    def __init__(self, handler: Callable, prefix: str, args: Tuple):
+        self.handler = handler
+        self.prefix = prefix
+        self.args = args
+
+    def __repr__(self):
+        return f"CallbackMatch(prefix={self.prefix!r}, args={self.args!r})"
+
+
+class _Node:
+    __slots__ = ('children', 'handler', 'prefix')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.handler: Optional[Callable] = None
+        self.prefix: Optional[str] = None
+
+
+class CallbackRouter:
+    """Префиксное дерево обработчиков callback.
+
+    Поиск идёт по символам callback_data (O(длины строки)) и выбирает самый длинный
+    зарегистрированный префикс, независимо от порядка регистрации:
+    'payment_method_' победит 'payment_' для 'payment_method_3_1'.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._count = 0
+
+    def add(self, prefix: str, handler: Callable):
+        """Зарегистрировать обработчик для префикса (повторная регистрация заменяет старый)"""
+        node = self._root
+        for char in prefix:
+            node = node.children.setdefault(char, _Node())
+        if node.handler is None:
+            self._count += 1
+        node.handler = handler
+        node.prefix = prefix
+
+    def resolve(self, data: str) -> Optional[CallbackMatch]:
+        """Найти обработчик для callback_data; None, если ни один префикс не подошёл"""
+        node = self._root
+        best = node if node.handler else None
+        for char in data:
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.handler is not None:
+                best = node
+        if best is None:
+            return None
+        return CallbackMatch(best.handler, best.prefix, parse_callback_args(data[len(best.prefix):]))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, prefix: str) -> bool:
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return False
+        return node.handler is not None
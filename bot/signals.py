@@ -0,0 +1,62 @@
+# bot/signals.py
+# Сигналы для инвалидации кэшей бота
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from .media_cache import CACHED_MEDIA_FIELDS, invalidate_media_cache
+from .models import TelegramUser, InfoPage
+from .utils import invalidate_user_language
+from .catalog import invalidate_catalog
+from .info_pages import info_pages
+
+
+def media_owner_saved(sender, instance, **kwargs):
+    """Файл в модели мог смениться — старые file_id больше не нужны"""
+    invalidate_media_cache(instance)
+
+
+def media_owner_deleted(sender, instance, **kwargs):
+    invalidate_media_cache(instance, keep_current=False)
+
+
+for model_label in CACHED_MEDIA_FIELDS:
+    post_save.connect(media_owner_saved, sender=model_label, dispatch_uid=f'media_cache_save_{model_label}')
+    post_delete.connect(media_owner_deleted, sender=model_label, dispatch_uid=f'media_cache_delete_{model_label}')
+
+
+def telegram_user_changed(sender, instance, update_fields=None, **kwargs):
+    """Язык пользователя мог смениться — убираем его из кэша языков после коммита"""
+    if update_fields is not None and 'language' not in update_fields:
+        return
+    chat_id = instance.chat_id
+    transaction.on_commit(lambda: invalidate_user_language(chat_id))
+
+
+def telegram_user_deleted(sender, instance, **kwargs):
+    chat_id = instance.chat_id
+    transaction.on_commit(lambda: invalidate_user_language(chat_id))
+
+
+post_save.connect(telegram_user_changed, sender=TelegramUser, dispatch_uid='language_cache_save')
+post_delete.connect(telegram_user_deleted, sender=TelegramUser, dispatch_uid='language_cache_delete')
+
+
+def catalog_changed(sender, instance, **kwargs):
+    """Курсы или способы оплаты изменились — снимок каталога пересобирается после коммита"""
+    transaction.on_commit(invalidate_catalog)
+
+
+for model_label in ('courses.Course', 'courses.PaymentMethod'):
+    post_save.connect(catalog_changed, sender=model_label, dispatch_uid=f'catalog_save_{model_label}')
+    post_delete.connect(catalog_changed, sender=model_label, dispatch_uid=f'catalog_delete_{model_label}')
+
+
+def info_page_changed(sender, instance, **kwargs):
+    """Текст страницы изменился — сбрасываем её в кэше после коммита"""
+    key = instance.key
+    transaction.on_commit(lambda: info_pages.invalidate(key))
+
+
+post_save.connect(info_page_changed, sender=InfoPage, dispatch_uid='info_page_save')
+post_delete.connect(info_page_changed, sender=InfoPage, dispatch_uid='info_page_delete')
@@ -0,0 +1,263 @@
+# state_store.py
+# Хранилище состояния диалога (state + data) пользователей бота.
+# Бэкенды: в памяти процесса (LRU + TTL), база данных (модель UserState), Django cache (Redis и т.п.)
+
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+
+from django.core.cache import caches
+from django.db import IntegrityError
+from django.utils import timezone
+
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE = 'start'
+
+# Записи, загруженные в рамках текущего update: {(id хранилища, chat_id): StateRecord}
+_session: ContextVar[Optional[Dict]] = ContextVar('state_session', default=None)
+
+
+class StateRecord:
+    """Состояние одного пользователя. Изменения отслеживаются по снимку при загрузке"""
+
+    __slots__ = ('chat_id', 'state', 'data', '_snapshot')
+
+    def __init__(self, chat_id: int, state: str = DEFAULT_STATE, data: Dict = None):
+        self.chat_id = chat_id
+        self.state = state
+        self.data = data if data is not None else {}
+        self._snapshot = self._dump()
+
+    def _dump(self) -> Tuple[str, str]:
+        return self.state, json.dumps(self.data, sort_keys=True, default=str)
+
+    @property
+    def changed(self) -> bool:
+        return self._dump() != self._snapshot
+
+    def mark_saved(self):
+        self._snapshot = self._dump()
+
+
+class StateStore(ABC):
+    """Интерфейс хранилища.
+
+    load() возвращает StateRecord; внутри session() (один update) повторные load()
+    того же чата отдают тот же объект, а изменения пишутся один раз при выходе из сессии.
+    Вне сессии save() пишет сразу.
+    """
+
+    name = 'base'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.writes = 0
+        self.skipped_writes = 0     # сохранения без изменений / объединённые в одну запись
+
+    # --- Реализуется бэкендом ---
+
+    @abstractmethod
+    def _read(self, chat_id: int) -> Optional[Tuple[str, Dict]]:
+        """(state, data) пользователя или None, если записи нет"""
+
+    @abstractmethod
+    def _write(self, chat_id: int, state: str, data: Dict):
+        """Сохранить state и data пользователя"""
+
+    @abstractmethod
+    def _delete(self, chat_id: int):
+        """Удалить запись пользователя"""
+
+    # --- Общая логика ---
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def load(self, chat_id: int) -> StateRecord:
+        """Загрузить состояние пользователя"""
+        session = _session.get()
+        key = (id(self), chat_id)
+        if session is not None and key in session:
+            return session[key]
+
+        self._count('reads')
+        stored = self._read(chat_id)
+        record = StateRecord(chat_id, *stored) if stored else StateRecord(chat_id)
+        if session is not None:
+            session[key] = record
+        return record
+
+    def save(self, record: StateRecord):
+        """Сохранить изменения (в сессии — отложенно, до её конца)"""
+        session = _session.get()
+        if session is not None:
+            session[(id(self), record.chat_id)] = record
+            return
+        self._save(record)
+
+    def _save(self, record: StateRecord):
+        if not record.changed:
+            self._count('skipped_writes')
+            return
+        try:
+            self._write(record.chat_id, record.state, record.data)
+            record.mark_saved()
+            self._count('writes')
+        except Exception as e:
+            logger.error(f"Error saving state for {record.chat_id}: {e}")
+
+    def clear(self, chat_id: int):
+        """Удалить состояние пользователя"""
+        session = _session.get()
+        if session is not None:
+            session.pop((id(self), chat_id), None)
+        self._delete(chat_id)
+
+    @contextmanager
+    def session(self):
+        """Единица работы на один update: чтения кэшируются, записи объединяются"""
+        if _session.get() is not None:
+            # Вложенная сессия использует внешнюю
+            yield
+            return
+        token = _session.set({})
+        try:
+            yield
+        finally:
+            records = _session.get()
+            _session.reset(token)
+            for (store_id, _), record in records.items():
+                if store_id == id(self):
+                    self._save(record)
+
+    def get_stats(self) -> Dict:
+        return {
+            'backend': self.name,
+            'reads': self.reads,
+            'writes': self.writes,
+            'skipped_writes': self.skipped_writes,
+        }
+
+
+class LocMemStateStore(StateStore):
+    """Состояние в памяти процесса: LRU с TTL, память ограничена max_entries.
+
+    Подходит только для одного процесса (polling); с несколькими webhook воркерами
+    используйте 'db' или 'cache'.
+    """
+
+    name = 'locmem'
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 24 * 3600):
+        super().__init__()
+        self._cache = LRUCache(max_size=max_entries, ttl=ttl)
+
+    def _read(self, chat_id):
+        stored = self._cache.get(chat_id)
+        if stored is None:
+            return None
+        state, data = stored
+        return state, json.loads(data)
+
+    def _write(self, chat_id, state, data):
+        # Храним копию, чтобы изменения вне save() не попадали в хранилище
+        self._cache.set(chat_id, (state, json.dumps(data, default=str)))
+
+    def _delete(self, chat_id):
+        self._cache.delete(chat_id)
+
+    def get_stats(self) -> Dict:
+        return {**super().get_stats(), **self._cache.get_stats()}
+
+
+class DatabaseStateStore(StateStore):
+    """Состояние в модели UserState (общая для всех процессов).
+
+    Запись — не больше одной на update и только если состояние изменилось.
+    Пока пользователь не зарегистрирован (нет TelegramUser), состояние не сохраняется.
+    """
+
+    name = 'db'
+
+    def _read(self, chat_id):
+        from .models import UserState
+        return UserState.objects.filter(user__chat_id=chat_id).values_list(
+            'current_state', 'state_data'
+        ).first()
+
+    def _write(self, chat_id, state, data):
+        from .models import TelegramUser, UserState
+        updated = UserState.objects.filter(user__chat_id=chat_id).update(
+            current_state=state, state_data=data, updated_at=timezone.now()
+        )
+        if updated:
+            return
+        user_id = TelegramUser.objects.filter(chat_id=chat_id).values_list('id', flat=True).first()
+        if user_id is None:
+            logger.debug(f"State for unknown user {chat_id} not persisted")
+            return
+        try:
+            UserState.objects.create(user_id=user_id, current_state=state, state_data=data)
+        except IntegrityError:
+            # Параллельный процесс успел создать запись
+            UserState.objects.filter(user_id=user_id).update(
+                current_state=state, state_data=data, updated_at=timezone.now()
+            )
+
+    def _delete(self, chat_id):
+        from .models import UserState
+        UserState.objects.filter(user__chat_id=chat_id).delete()
+
+
+class CacheStateStore(StateStore):
+    """Состояние в Django cache (key-value): LocMem в одном процессе или Redis для нескольких"""
+
+    name = 'cache'
+    key_prefix = 'bot:state:'
+
+    def __init__(self, alias: str = 'default', ttl: float = 24 * 3600):
+        super().__init__()
+        self.alias = alias
+        self.ttl = ttl
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _read(self, chat_id):
+        return self.cache.get(f"{self.key_prefix}{chat_id}")
+
+    def _write(self, chat_id, state, data):
+        self.cache.set(f"{self.key_prefix}{chat_id}", (state, data), self.ttl)
+
+    def _delete(self, chat_id):
+        self.cache.delete(f"{self.key_prefix}{chat_id}")
+
+
+STATE_STORES = {
+    'locmem': LocMemStateStore,
+    'db': DatabaseStateStore,
+    'cache': CacheStateStore,
+}
+
+
+def create_state_store(backend: str = None, **options: Any) -> StateStore:
+    """Создать хранилище по имени бэкенда (по умолчанию — settings.TELEGRAM_STATE_STORE)"""
+    from django.conf import settings
+    backend = backend or getattr(settings, 'TELEGRAM_STATE_STORE', 'db')
+    if backend not in STATE_STORES:
+        raise ValueError(f"Unknown state store backend: {backend}")
+    if backend in ('locmem', 'cache') and 'ttl' not in options:
+        options['ttl'] = getattr(settings, 'TELEGRAM_STATE_TTL', 24 * 3600)
+    if backend == 'locmem' and 'max_entries' not in options:
+        options['max_entries'] = getattr(settings, 'TELEGRAM_STATE_MAX_ENTRIES', 10000)
+    return STATE_STORES[backend](**options)
@@ -1,57 +1,316 @@
 # telegram_api.py
 # Простой клиент для работы с Telegram Bot API через HTTP
 
+import time
+import queue
+import asyncio
+import weakref
+import hashlib
+import threading
 import requests
+import httpx
 import json
 import logging
-from typing import Dict, List, Optional, Any
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Any, Tuple, Iterable, Iterator
+from django.db import connections
+from .rate_limiter import RateLimiter, get_rate_limiter
+from .multipart import MultipartStream
+from .instrumentation import RequestMetrics, get_request_metrics
 
 logger = logging.getLogger(__name__)
 
+# Методы, на которые распространяются лимиты Telegram на отправку сообщений
+RATE_LIMITED_METHODS = {'sendMessage', 'sendPhoto', 'sendDocument', 'editMessageText'}
+
+# Адрес Bot API; можно заменить на локальный сервер (bot/fake_telegram.py или telegram-bot-api)
+DEFAULT_API_URL = 'https://api.telegram.org'
+
+# Таймауты (connect, read) в секундах по методам API
+DEFAULT_TIMEOUT = (5, 15)
+METHOD_TIMEOUTS = {
+    'answerCallbackQuery': (3, 5),
+    'deleteMessage': (3, 10),
+    'getUpdates': (5, 10),      # к read добавляется timeout самого long polling
+    'sendPhoto': (5, 60),
+    'sendDocument': (5, 60),
+}
+FILE_DOWNLOAD_TIMEOUT = (5, 60)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Крайний срок обработки текущего update (time.monotonic()), None — без ограничения
+_deadline: ContextVar[Optional[float]] = ContextVar('telegram_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Бюджет времени на обработку update исчерпан"""
+
+
+class FileTooLargeError(Exception):
+    """Скачиваемый файл превысил допустимый размер"""
+
+
+@contextmanager
+def update_deadline(seconds: Optional[float]):
+    """Ограничить все вызовы Telegram API внутри блока общим бюджетом времени"""
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        # Вложенный дедлайн не может продлить внешний
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Сколько секунд осталось до дедлайна текущего update"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def _resolve_timeout(timeout: Tuple[float, float], method: str) -> Tuple[float, float]:
+    """Урезать таймауты до оставшегося бюджета или сразу упасть, если он исчерпан"""
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise DeadlineExceeded(f"Deadline exceeded before {method}")
+    return (min(timeout[0], remaining), min(timeout[1], remaining))
+
+
+class TelegramAPIError(Exception):
+    """Ошибка, которую вернул Telegram (ok=false)"""
+    
+    def __init__(self, description: str, error_code: int = None, retry_after: float = None):
+        super().__init__(f"Telegram API error: {description}")
+        self.description = description
+        self.error_code = error_code
+        self.retry_after = retry_after
+    
+    @classmethod
+    def from_result(cls, result: Dict) -> 'TelegramAPIError':
+        parameters = result.get('parameters') or {}
+        return cls(
+            result.get('description', 'Unknown error'),
+            error_code=result.get('error_code'),
+            retry_after=parameters.get('retry_after')
+        )
+
+
+class SendResult:
+    """Результат отправки одного сообщения из send_many"""
+    
+    OK = 'ok'
+    BLOCKED = 'blocked'             # 403: пользователь заблокировал бота / удалён
+    RATE_LIMITED = 'rate_limited'   # 429 после всех повторов
+    ERROR = 'error'
+    
+    __slots__ = ('message', 'status', 'result', 'error')
+    
+    def __init__(self, message: Dict, status: str, result: Any = None, error: Exception = None):
+        self.message = message
+        self.status = status
+        self.result = result
+        self.error = error
+    
+    @property
+    def ok(self) -> bool:
+        return self.status == self.OK
+    
+    @property
+    def chat_id(self):
+        return self.message.get('chat_id') if isinstance(self.message, dict) else None
+    
+    def __repr__(self):
+        return f"SendResult(chat_id={self.chat_id}, status={self.status})"
+
+
+def _parse_result(result: Dict):
+    """Вернуть поле result или выбросить TelegramAPIError"""
+    if not result.get('ok'):
+        error = TelegramAPIError.from_result(result)
+        if error.retry_after is not None:
+            logger.warning(f"Telegram API rate limit, retry after {error.retry_after}s")
+        else:
+            logger.error(f"Telegram API error: {error.description}")
+        raise error
+    return result.get('result')
+
+
+def _content_length(response) -> int:
+    """Размер тела ответа по заголовку, не читая (и не буферизуя) само тело"""
+    try:
+        return int(response.headers.get('Content-Length') or 0)
+    except ValueError:
+        return 0
+
+
+def _download_error(response) -> Optional[int]:
+    """HTTP статус неудачного скачивания файла как код ошибки для метрик"""
+    if response is not None and response.status_code >= 400:
+        return response.status_code
+    return None
+
+
+def _record_request(metrics: RequestMetrics, method: str, params: Optional[Dict], files: Optional[Dict],
+                    started: float, request_bytes: int, response, error_code: Optional[int],
+                    response_bytes: Optional[int] = None):
+    """Записать метрики одного HTTP запроса (и, выборочно, его параметры в debug-лог).
+    response_bytes не задан — берётся из Content-Length"""
+    duration = time.monotonic() - started
+    http_status = response.status_code if response is not None else None
+    if response_bytes is None:
+        response_bytes = _content_length(response) if response is not None else 0
+    metrics.record(method, duration, request_bytes, response_bytes, http_status, error_code, upload=bool(files))
+    if metrics.should_log():
+        metrics.log_request(method, params, files, duration, http_status, error_code)
+
+
+def _rewind_files(files: Dict):
+    """Перемотать файловые объекты перед повторной отправкой"""
+    for file_obj in (files or {}).values():
+        if hasattr(file_obj, 'seek') and not getattr(file_obj, 'closed', False):
+            file_obj.seek(0)
+
+
+def serialize_markup(reply_markup) -> str:
+    """JSON клавиатуры; уже сериализованная строка (см. bot.keyboards) отправляется как есть"""
+    if isinstance(reply_markup, str):
+        return reply_markup
+    return json.dumps(reply_markup)
+
+
+def _is_upload(value) -> bool:
+    """Файл для загрузки, а не URL/file_id"""
+    return not isinstance(value, str)
+
+
 class TelegramAPI:
     """Простой клиент для Telegram Bot API"""
     
-    def __init__(self, token: str):
+    def __init__(self, token: str, rate_limiter: RateLimiter = None, max_retries: int = 3,
+                 timeouts: Dict[str, Tuple[float, float]] = None, api_url: str = None,
+                 metrics: RequestMetrics = None):
         self.token = token
-        self.base_url = f"https://api.telegram.org/bot{token}"
+        self.api_url = (api_url or DEFAULT_API_URL).rstrip('/')
+        self.base_url = f"{self.api_url}/bot{token}"
+        self.file_url = f"{self.api_url}/file/bot{token}"
         self.session = requests.Session()
-        self.session.timeout = 30
+        # Пул соединений побольше, чтобы send_many мог слать параллельно
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.rate_limiter = rate_limiter or get_rate_limiter(token)
+        self.metrics = metrics or get_request_metrics(token)
+        self.max_retries = max_retries
+        self.timeouts = {**METHOD_TIMEOUTS, **(timeouts or {})}
+    
+    def _get_timeout(self, method: str, params: Dict = None) -> Tuple[float, float]:
+        """Таймаут (connect, read) для метода с учётом дедлайна update"""
+        connect, read = self.timeouts.get(method, DEFAULT_TIMEOUT)
+        if method == 'getUpdates':
+            read += (params or {}).get('timeout', 0)
+        return _resolve_timeout((connect, read), method)
     
     def _make_request(self, method: str, params: Dict = None, files: Dict = None) -> Dict:
-        """Выполнить HTTP запрос к Telegram API"""
+        """Выполнить HTTP запрос к Telegram API (с учётом лимитов и 429 retry_after)"""
+        limited = method in RATE_LIMITED_METHODS
+        chat_id = (params or {}).get('chat_id') if limited else None
+        attempt = 0
+        
+        while True:
+            remaining = remaining_time()
+            if remaining is not None and remaining <= 0:
+                raise DeadlineExceeded(f"Deadline exceeded before {method}")
+            if limited and not self.rate_limiter.acquire(chat_id, max_wait=remaining):
+                raise DeadlineExceeded(f"Deadline exceeded while waiting for rate limit ({method})")
+            try:
+                return self._send_request(method, params, files)
+            except TelegramAPIError as e:
+                if e.retry_after is None or attempt >= self.max_retries:
+                    raise
+                remaining = remaining_time()
+                if remaining is not None and e.retry_after >= remaining:
+                    raise
+                attempt += 1
+                # Ждёт только этот запрос, остальные продолжают работу
+                self.rate_limiter.park(e.retry_after)
+                _rewind_files(files)
+    
+    def _send_request(self, method: str, params: Dict = None, files: Dict = None) -> Dict:
+        """Один HTTP запрос к Telegram API"""
         url = f"{self.base_url}/{method}"
-        print(params)
-        print(files)
+        timeout = self._get_timeout(method, params)
+        started = time.monotonic()
+        request_bytes = 0
+        response = None
+        error_code = None
         
         try:
             if files:
-                # Для загрузки файлов используем multipart/form-data
-                response = self.session.post(url, data=params, files=files)
+                # multipart/form-data отдаём потоком: файл читается кусками
+                response, request_bytes = self._upload(method, url, params, files, timeout)
             else:
                 # Для обычных запросов используем JSON
-                response = self.session.post(url, json=params)
+                data = json.dumps(params).encode() if params is not None else None
+                request_bytes = len(data) if data else 0
+                response = self.session.post(
+                    url, data=data, timeout=timeout,
+                    headers={'Content-Type': 'application/json'}
+                )
             
-            response.raise_for_status()
-            result = response.json()
+            try:
+                result = response.json()
+            except ValueError:
+                response.raise_for_status()
+                raise TelegramAPIError('Invalid JSON response', error_code=response.status_code)
             
-            if not result.get('ok'):
-                error_msg = result.get('description', 'Unknown error')
-                logger.error(f"Telegram API error: {error_msg}")
-                raise Exception(f"Telegram API error: {error_msg}")
-            return result.get('result')
+            return _parse_result(result)
             
         except requests.exceptions.RequestException as e:
             logger.error(f"HTTP request error: {e}")
             raise Exception(f"HTTP request error: {e}")
+        except TelegramAPIError as e:
+            error_code = e.error_code
+            raise
         except Exception as e:
             logger.error(f"Telegram API request failed: {e}")
             raise
+        finally:
+            _record_request(self.metrics, method, params, files, started, request_bytes, response, error_code)
+    
+    def _upload(self, method: str, url: str, params: Dict, files: Dict, timeout) -> Tuple[requests.Response, int]:
+        """Отправить multipart запрос потоком; возвращает ответ и размер тела (в метрики — через _record_request)"""
+        body = MultipartStream(params, files)
+        started = time.monotonic()
+        try:
+            response = self.session.post(
+                url, data=body, timeout=timeout,
+                headers={'Content-Type': body.content_type}
+            )
+        finally:
+            body.close()
+        duration = time.monotonic() - started
+        logger.info(f"Uploaded {body.length} bytes via {method} in {duration:.2f}s")
+        return response, body.length
     
     def get_me(self) -> Dict:
         """Получить информацию о боте"""
         return self._make_request('getMe')
     
-    def get_updates(self, offset: int = None, limit: int = 100, timeout: int = 0) -> List[Dict]:
+    def get_updates(self, offset: int = None, limit: int = 100, timeout: int = 0,
+                    allowed_updates: List[str] = None) -> List[Dict]:
         """Получить обновления (для polling)"""
         params = {
             'limit': limit,
@@ -59,6 +318,8 @@ class TelegramAPI:
         }
         if offset:
             params['offset'] = offset
+        if allowed_updates is not None:
+            params['allowed_updates'] = allowed_updates
             
         return self._make_request('getUpdates', params)
     
@@ -75,14 +336,14 @@ class TelegramAPI:
     
     def send_message(self, chat_id: int, text: str, reply_markup: Dict = None, 
                     parse_mode: str = None) -> Dict:
-        """Отправить текстовое сообщение"""
+        """Отправить текстовое сообщение (reply_markup — dict или готовая JSON строка)"""
         params = {
             'chat_id': chat_id,
             'text': text
         }
         
         if reply_markup:
-            params['reply_markup'] = json.dumps(reply_markup)
+            params['reply_markup'] = serialize_markup(reply_markup)
         
         if parse_mode:
             params['parse_mode'] = parse_mode
@@ -100,14 +361,14 @@ class TelegramAPI:
             params['caption'] = caption
             
         if reply_markup:
-            params['reply_markup'] = json.dumps(reply_markup)
+            params['reply_markup'] = serialize_markup(reply_markup)
         
         files = None
-        if isinstance(photo, str):
+        if not _is_upload(photo):
             # Если это URL или file_id
             params['photo'] = photo
         else:
-            # Если это файл
+            # Файл, FieldFile или путь (Path) — загружается потоком
             files = {'photo': photo}
             
         return self._make_request('sendPhoto', params, files)
@@ -122,11 +383,11 @@ class TelegramAPI:
             params['caption'] = caption
         
         files = None
-        if isinstance(document, str):
+        if not _is_upload(document):
             # Если это URL или file_id
             params['document'] = document
         else:
-            # Если это файл
+            # Файл, FieldFile или путь (Path) — загружается потоком
             files = {'document': document}
             
         return self._make_request('sendDocument', params, files)
@@ -142,7 +403,7 @@ class TelegramAPI:
         }
         
         if reply_markup:
-            params['reply_markup'] = json.dumps(reply_markup)
+            params['reply_markup'] = serialize_markup(reply_markup)
             
         if parse_mode:
             params['parse_mode'] = parse_mode
@@ -182,15 +443,514 @@ class TelegramAPI:
     
     def download_file(self, file_path: str) -> bytes:
         """Скачать файл"""
-        url = f"https://api.telegram.org/file/bot{self.token}/{file_path}"
+        url = f"{self.file_url}/{file_path}"
+        
+        timeout = _resolve_timeout(self.timeouts.get('file', FILE_DOWNLOAD_TIMEOUT), 'download_file')
+        started = time.monotonic()
+        response = None
         
         try:
-            response = self.session.get(url)
+            response = self.session.get(url, timeout=timeout)
             response.raise_for_status()
             return response.content
         except requests.exceptions.RequestException as e:
             logger.error(f"File download error: {e}")
             raise Exception(f"File download error: {e}")
+        finally:
+            _record_request(self.metrics, 'download_file', {'file_path': file_path}, None, started, 0,
+                            response, _download_error(response))
+    
+    def download_file_to(self, file_path: str, destination, max_bytes: int = None) -> Tuple[int, str]:
+        """Скачать файл потоком в destination (файловый объект), не держа его в памяти.
+        
+        Возвращает (размер в байтах, sha256). Если файл больше max_bytes — FileTooLargeError.
+        """
+        url = f"{self.file_url}/{file_path}"
+        timeout = _resolve_timeout(self.timeouts.get('file', FILE_DOWNLOAD_TIMEOUT), 'download_file')
+        started = time.monotonic()
+        response = None
+        size = 0
+        
+        try:
+            with self.session.get(url, timeout=timeout, stream=True) as response:
+                response.raise_for_status()
+                
+                content_length = response.headers.get('Content-Length')
+                if max_bytes and content_length and int(content_length) > max_bytes:
+                    raise FileTooLargeError(f"File is {content_length} bytes, limit is {max_bytes}")
+                
+                digest = hashlib.sha256()
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if max_bytes and size > max_bytes:
+                        raise FileTooLargeError(f"File exceeds limit of {max_bytes} bytes")
+                    digest.update(chunk)
+                    destination.write(chunk)
+                
+                return size, digest.hexdigest()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"File download error: {e}")
+            raise Exception(f"File download error: {e}")
+        finally:
+            # Фактически прочитанные байты, а не Content-Length (скачивание могло оборваться)
+            _record_request(self.metrics, 'download_file', {'file_path': file_path}, None, started, 0,
+                            response, _download_error(response), response_bytes=size)
+
+    def _deliver(self, message: Dict) -> SendResult:
+        """Отправить одно сообщение из send_many и классифицировать результат"""
+        params = {k: v for k, v in message.items() if k != 'key'}
+        try:
+            if 'photo' in params:
+                photo = params.pop('photo')
+                if hasattr(photo, 'send_photo'):
+                    # CachedMedia: загрузка один раз, дальше по file_id
+                    result = photo.send_photo(self, **params)
+                else:
+                    result = self.send_photo(photo=photo, **params)
+            elif 'document' in params:
+                result = self.send_document(**params)
+            else:
+                result = self.send_message(**params)
+            return SendResult(message, SendResult.OK, result=result)
+        except TelegramAPIError as e:
+            if e.error_code == 403:
+                status = SendResult.BLOCKED
+            elif e.retry_after is not None:
+                status = SendResult.RATE_LIMITED
+            else:
+                status = SendResult.ERROR
+            return SendResult(message, status, error=e)
+        except Exception as e:
+            return SendResult(message, SendResult.ERROR, error=e)
+    
+    def send_many(self, messages: Iterable[Dict], max_workers: int = 8,
+                  max_pending: int = 1000) -> Iterator[SendResult]:
+        """Массовая отправка: разные чаты параллельно, внутри одного чата — строго по порядку.
+        
+        messages — словари с параметрами send_message / send_photo / send_document
+        (chat_id обязателен; 'key' можно использовать для своих пометок).
+        Результаты (SendResult) возвращаются по мере готовности.
+        """
+        results = queue.Queue()
+        lanes: Dict[Any, deque] = {}    # chat_id -> очередь сообщений этого чата
+        lanes_lock = threading.Lock()
+        pending = threading.Semaphore(max_pending)
+        stopped = threading.Event()
+        produced = []                   # сюда продюсер кладёт итоговое число сообщений
+        
+        def run_lane(chat_id):
+            try:
+                while True:
+                    with lanes_lock:
+                        lane = lanes[chat_id]
+                        if not lane or stopped.is_set():
+                            del lanes[chat_id]
+                            return
+                        message = lane.popleft()
+                    results.put(self._deliver(message))
+            finally:
+                # CachedMedia ходит в БД из потоков пула; потоки живут только до конца send_many
+                connections.close_all()
+        
+        def produce(executor: ThreadPoolExecutor):
+            count = 0
+            try:
+                for message in messages:
+                    # backpressure: не больше max_pending сообщений в работе
+                    while not pending.acquire(timeout=0.5):
+                        if stopped.is_set():
+                            return
+                    if stopped.is_set():
+                        return
+                    try:
+                        chat_id = message['chat_id']
+                        hash(chat_id)
+                    except Exception as e:
+                        # Битое сообщение не останавливает рассылку: сразу отдаём его как ошибку
+                        count += 1
+                        results.put(SendResult(message, SendResult.ERROR, error=e))
+                        continue
+                    with lanes_lock:
+                        if chat_id in lanes:
+                            lanes[chat_id].append(message)
+                            count += 1
+                            continue
+                        lanes[chat_id] = deque([message])
+                        count += 1
+                    try:
+                        executor.submit(run_lane, chat_id)
+                    except Exception as e:
+                        # Очередь чата не запустилась — её сообщения тоже возвращаются как ошибки
+                        with lanes_lock:
+                            orphaned = lanes.pop(chat_id)
+                        for orphan in orphaned:
+                            results.put(SendResult(orphan, SendResult.ERROR, error=e))
+            except Exception as e:
+                logger.error(f"send_many producer failed: {e}")
+            finally:
+                produced.append(count)
+                results.put(None)
+        
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='send_many')
+        producer = threading.Thread(target=produce, args=(executor,), daemon=True)
+        producer.start()
+        delivered = 0
+        try:
+            while not produced or delivered < produced[0]:
+                item = results.get()
+                if item is None:
+                    continue
+                delivered += 1
+                pending.release()
+                yield item
+        finally:
+            # Если вызывающий перестал читать результаты — не отправляем остальное
+            stopped.set()
+            producer.join()
+            executor.shutdown(wait=True)
+
+# httpx.AsyncClient привязан к event loop, в котором открыты его соединения,
+# поэтому общий пул — один на пару (event loop, токен). Пулы закрытых loop уходят вместе с ними.
+_async_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]' = \
+    weakref.WeakKeyDictionary()
+_async_clients_lock = threading.Lock()
+
+def get_async_client(token: str, max_connections: int = 200,
+                     max_keepalive_connections: int = 50) -> httpx.AsyncClient:
+    """Получить общий пул keep-alive соединений для токена в текущем event loop"""
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(token)
+        if client is None or client.is_closed:
+            client = clients[token] = httpx.AsyncClient(
+                timeout=httpx.Timeout(DEFAULT_TIMEOUT[1], connect=DEFAULT_TIMEOUT[0]),
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections
+                )
+            )
+        return client
+
+async def close_async_client(token: str):
+    """Закрыть общий пул токена в текущем event loop"""
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        client = _async_clients.get(loop, {}).pop(token, None)
+    if client is not None:
+        await client.aclose()
+
+class AsyncTelegramAPI:
+    """Асинхронный клиент для Telegram Bot API (тот же набор методов, что и у TelegramAPI)"""
+    
+    def __init__(self, token: str, max_connections: int = 200, max_keepalive_connections: int = 50,
+                 rate_limiter: RateLimiter = None, max_retries: int = 3,
+                 timeouts: Dict[str, Tuple[float, float]] = None, api_url: str = None,
+                 metrics: RequestMetrics = None):
+        self.token = token
+        self.api_url = (api_url or DEFAULT_API_URL).rstrip('/')
+        self.base_url = f"{self.api_url}/bot{token}"
+        self.file_url = f"{self.api_url}/file/bot{token}"
+        # Пул соединений общий для всех клиентов токена в одном event loop (см. get_async_client);
+        # лимиты берутся у того клиента, который создал пул первым
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.rate_limiter = rate_limiter or get_rate_limiter(token)
+        self.metrics = metrics or get_request_metrics(token)
+        self.max_retries = max_retries
+        self.timeouts = {**METHOD_TIMEOUTS, **(timeouts or {})}
+    
+    def _get_timeout(self, method: str, params: Dict = None) -> httpx.Timeout:
+        """Таймаут для метода с учётом дедлайна update"""
+        connect, read = self.timeouts.get(method, DEFAULT_TIMEOUT)
+        if method == 'getUpdates':
+            read += (params or {}).get('timeout', 0)
+        connect, read = _resolve_timeout((connect, read), method)
+        return httpx.Timeout(read, connect=connect, pool=connect)
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return get_async_client(self.token, self.max_connections, self.max_keepalive_connections)
+    
+    async def close(self):
+        """Закрыть общий пул соединений токена в текущем event loop.
+        
+        Пул делят все клиенты этого токена; следующий запрос любого из них откроет новый.
+        """
+        await close_async_client(self.token)
+    
+    async def _make_request(self, method: str, params: Dict = None, files: Dict = None) -> Dict:
+        """Выполнить HTTP запрос к Telegram API (с учётом лимитов и 429 retry_after)"""
+        limited = method in RATE_LIMITED_METHODS
+        chat_id = (params or {}).get('chat_id') if limited else None
+        attempt = 0
+        
+        while True:
+            remaining = remaining_time()
+            if remaining is not None and remaining <= 0:
+                raise DeadlineExceeded(f"Deadline exceeded before {method}")
+            if limited and not await self.rate_limiter.acquire_async(chat_id, max_wait=remaining):
+                raise DeadlineExceeded(f"Deadline exceeded while waiting for rate limit ({method})")
+            try:
+                return await self._send_request(method, params, files)
+            except TelegramAPIError as e:
+                if e.retry_after is None or attempt >= self.max_retries:
+                    raise
+                remaining = remaining_time()
+                if remaining is not None and e.retry_after >= remaining:
+                    raise
+                attempt += 1
+                await self.rate_limiter.park_async(e.retry_after)
+                _rewind_files(files)
+    
+    async def _send_request(self, method: str, params: Dict = None, files: Dict = None) -> Dict:
+        """Один HTTP запрос к Telegram API"""
+        url = f"{self.base_url}/{method}"
+        timeout = self._get_timeout(method, params)
+        started = time.monotonic()
+        request_bytes = 0
+        response = None
+        error_code = None
+        
+        try:
+            if files:
+                # multipart/form-data отдаём потоком: файл читается кусками
+                response, request_bytes = await self._upload(method, url, params, files, timeout)
+            else:
+                # Для обычных запросов используем JSON
+                data = json.dumps(params).encode() if params is not None else None
+                request_bytes = len(data) if data else 0
+                response = await self.client.post(
+                    url, content=data, timeout=timeout,
+                    headers={'Content-Type': 'application/json'}
+                )
+            
+            try:
+                result = response.json()
+            except ValueError:
+                response.raise_for_status()
+                raise TelegramAPIError('Invalid JSON response', error_code=response.status_code)
+            
+            return _parse_result(result)
+            
+        except httpx.HTTPError as e:
+            logger.error(f"HTTP request error: {e}")
+            raise Exception(f"HTTP request error: {e}")
+        except TelegramAPIError as e:
+            error_code = e.error_code
+            raise
+        except Exception as e:
+            logger.error(f"Telegram API request failed: {e}")
+            raise
+        finally:
+            _record_request(self.metrics, method, params, files, started, request_bytes, response, error_code)
+    
+    async def _upload(self, method: str, url: str, params: Dict, files: Dict, timeout) -> Tuple[httpx.Response, int]:
+        """Отправить multipart запрос потоком; возвращает ответ и размер тела (в метрики — через _record_request)"""
+        body = MultipartStream(params, files)
+        started = time.monotonic()
+        try:
+            response = await self.client.post(
+                url, content=body.aiter_chunks(), timeout=timeout,
+                headers={'Content-Type': body.content_type, 'Content-Length': str(body.length)}
+            )
+        finally:
+            body.close()
+        duration = time.monotonic() - started
+        logger.info(f"Uploaded {body.length} bytes via {method} in {duration:.2f}s")
+        return response, body.length
+    
+    async def get_me(self) -> Dict:
+        """Получить информацию о боте"""
+        return await self._make_request('getMe')
+    
+    async def get_updates(self, offset: int = None, limit: int = 100, timeout: int = 0,
+                          allowed_updates: List[str] = None) -> List[Dict]:
+        """Получить обновления (для polling)"""
+        params = {
+            'limit': limit,
+            'timeout': timeout
+        }
+        if offset:
+            params['offset'] = offset
+        if allowed_updates is not None:
+            params['allowed_updates'] = allowed_updates
+            
+        return await self._make_request('getUpdates', params)
+    
+    async def set_webhook(self, url: str) -> bool:
+        """Установить webhook"""
+        result = await self._make_request('setWebhook', {'url': url})
+        return result is True
+    
+    async def delete_webhook(self) -> bool:
+        """Удалить webhook"""
+        result = await self._make_request('deleteWebhook')
+        return result is True
+    
+    async def send_message(self, chat_id: int, text: str, reply_markup: Dict = None, 
+                          parse_mode: str = None) -> Dict:
+        """Отправить текстовое сообщение"""
+        params = {
+            'chat_id': chat_id,
+            'text': text
+        }
+        
+        if reply_markup:
+            params['reply_markup'] = serialize_markup(reply_markup)
+        
+        if parse_mode:
+            params['parse_mode'] = parse_mode
+            
+        return await self._make_request('sendMessage', params)
+    
+    async def send_photo(self, chat_id: int, photo, caption: str = None, 
+                        reply_markup: Dict = None) -> Dict:
+        """Отправить фото"""
+        params = {
+            'chat_id': chat_id
+        }
+        
+        if caption:
+            params['caption'] = caption
+            
+        if reply_markup:
+            params['reply_markup'] = serialize_markup(reply_markup)
+        
+        files = None
+        if not _is_upload(photo):
+            # Если это URL или file_id
+            params['photo'] = photo
+        else:
+            # Файл, FieldFile или путь (Path) — загружается потоком
+            files = {'photo': photo}
+            
+        return await self._make_request('sendPhoto', params, files)
+    
+    async def send_document(self, chat_id: int, document, caption: str = None) -> Dict:
+        """Отправить документ"""
+        params = {
+            'chat_id': chat_id
+        }
+        
+        if caption:
+            params['caption'] = caption
+        
+        files = None
+        if not _is_upload(document):
+            # Если это URL или file_id
+            params['document'] = document
+        else:
+            # Файл, FieldFile или путь (Path) — загружается потоком
+            files = {'document': document}
+            
+        return await self._make_request('sendDocument', params, files)
+    
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str, 
+                               reply_markup: Dict = None, parse_mode: str = None) -> Dict:
+        """Редактировать текст сообщения"""
+        params = {
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'text': text,
+            'parse_mode': 'HTML'
+        }
+        
+        if reply_markup:
+            params['reply_markup'] = serialize_markup(reply_markup)
+            
+        if parse_mode:
+            params['parse_mode'] = parse_mode
+            
+        return await self._make_request('editMessageText', params)
+    
+    async def delete_message(self, chat_id: int, message_id: int) -> bool:
+        """Удалить сообщение"""
+        params = {
+            'chat_id': chat_id,
+            'message_id': message_id
+        }
+        
+        result = await self._make_request('deleteMessage', params)
+        return result is True
+    
+    async def answer_callback_query(self, callback_query_id: str, text: str = None, 
+                                   show_alert: bool = False) -> bool:
+        """Ответить на callback query"""
+        params = {
+            'callback_query_id': callback_query_id
+        }
+        
+        if text:
+            params['text'] = text
+            
+        if show_alert:
+            params['show_alert'] = show_alert
+            
+        result = await self._make_request('answerCallbackQuery', params)
+        return result is True
+    
+    async def get_file(self, file_id: str) -> Dict:
+        """Получить информацию о файле"""
+        return await self._make_request('getFile', {'file_id': file_id})
+    
+    async def download_file(self, file_path: str) -> bytes:
+        """Скачать файл"""
+        url = f"{self.file_url}/{file_path}"
+        
+        connect, read = _resolve_timeout(self.timeouts.get('file', FILE_DOWNLOAD_TIMEOUT), 'download_file')
+        started = time.monotonic()
+        response = None
+        
+        try:
+            response = await self.client.get(url, timeout=httpx.Timeout(read, connect=connect, pool=connect))
+            response.raise_for_status()
+            return response.content
+        except httpx.HTTPError as e:
+            logger.error(f"File download error: {e}")
+            raise Exception(f"File download error: {e}")
+        finally:
+            _record_request(self.metrics, 'download_file', {'file_path': file_path}, None, started, 0,
+                            response, _download_error(response))
+    
+    async def download_file_to(self, file_path: str, destination, max_bytes: int = None) -> Tuple[int, str]:
+        """Скачать файл потоком в destination, вернуть (размер, sha256)"""
+        url = f"{self.file_url}/{file_path}"
+        connect, read = _resolve_timeout(self.timeouts.get('file', FILE_DOWNLOAD_TIMEOUT), 'download_file')
+        started = time.monotonic()
+        response = None
+        size = 0
+        
+        try:
+            timeout = httpx.Timeout(read, connect=connect, pool=connect)
+            async with self.client.stream('GET', url, timeout=timeout) as response:
+                response.raise_for_status()
+                
+                content_length = response.headers.get('Content-Length')
+                if max_bytes and content_length and int(content_length) > max_bytes:
+                    raise FileTooLargeError(f"File is {content_length} bytes, limit is {max_bytes}")
+                
+                digest = hashlib.sha256()
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if max_bytes and size > max_bytes:
+                        raise FileTooLargeError(f"File exceeds limit of {max_bytes} bytes")
+                    digest.update(chunk)
+                    destination.write(chunk)
+                
+                return size, digest.hexdigest()
+        except httpx.HTTPError as e:
+            logger.error(f"File download error: {e}")
+            raise Exception(f"File download error: {e}")
+        finally:
+            _record_request(self.metrics, 'download_file', {'file_path': file_path}, None, started, 0,
+                            response, _download_error(response), response_bytes=size)
 
 class KeyboardBuilder:
     @staticmethod
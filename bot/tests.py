@@ -1,3 +1,991 @@
-from django.test import TestCase
+import asyncio
+import base64
+import copy
+import datetime
+import hashlib
+import io
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from courses.models import Course, PaymentMethod
+
+from .bot_handlers_simple import setup_bot_handlers
+from .bot_manager import BotManager, BotStates, MessageContext
+from .cache import SharedVersion
+from .checks import check_translation_usage, find_translation_errors
+from .callback_codec import (
+    ACTIONS, CODEC_VERSION, LANGUAGE, MAX_CALLBACK_DATA, Action, CallbackData, decode, encode,
+)
+from .catalog import VERSION_CACHE_KEY, Catalog, invalidate_catalog
+from .dedupe import UpdateDeduplicator
+from .dispatcher import UpdateDispatcher
+from .fake_telegram import FakeTelegramServer
+from . import keyboards
+from .activity import ActivityTracker
+from .info_pages import VERSION_CACHE_KEY as INFO_PAGES_VERSION_KEY, InfoPageCache
+from .instrumentation import HandlerMetrics, RequestMetrics
+from .middleware import HandlerMetricsMiddleware, MiddlewarePipeline, report_handled_error
+from .media_cache import CachedMedia
+from .models import InfoPage, TelegramFileCache, TelegramUser
+from .multipart import MultipartStream
+from .polling import UpdatePoller
+from .rate_limiter import RateLimiter, TokenBucket
+from .routing import CallbackRouter, parse_callback_args
+from .state_store import LocMemStateStore, StateStore
+from .telegram_api import (
+    AsyncTelegramAPI, DeadlineExceeded, FileTooLargeError, SendResult, TelegramAPI, TelegramAPIError, remaining_time, update_deadline,
+)
+from .translations import TranslationError, compile_messages, get_text, texts_for
+from .utils import _language_cache, get_cached_language, invalidate_user_language
+
+
+def make_course(**fields) -> Course:
+    values = {
+        'name_qr': 'Kurs', 'name_uz': 'Kurs UZ', 'description_qr': 'd', 'description_uz': 'd',
+        'price': 100, 'group_link': 'https://t.me/+group',
+    }
+    values.update(fields)
+    return Course.objects.create(**values)
+
+
+def callback_update(update_id: int, chat_id: int, data: str) -> dict:
+    return {'update_id': update_id, 'callback_query': {
+        'id': str(update_id), 'from': {'id': chat_id}, 'data': data,
+        'message': {'message_id': 1, 'chat': {'id': chat_id}},
+    }}
+
+
+class BotFlowMixin:
+    """Бот с обработчиками, который ходит в FakeTelegramServer"""
+
+    def start_bot(self, token: str) -> BotManager:
+        self.server = FakeTelegramServer().start()
+        self.addCleanup(self.server.stop)
+        bot = BotManager(token, state_store=LocMemStateStore())
+        bot.api = TelegramAPI(token, api_url=self.server.url)
+        setup_bot_handlers(bot)
+        return bot
+
+    def last_text(self) -> str:
+        return self.server.sent_messages()[-1]['text']
+
+
+def collect(iterator, timeout: float = 10.0):
+    """Вычитать результаты в отдельном потоке; None — если итератор завис"""
+    results = []
+    worker = threading.Thread(target=lambda: results.extend(iterator), daemon=True)
+    worker.start()
+    worker.join(timeout)
+    return None if worker.is_alive() else results
+
+
+class SendManyTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = FakeTelegramServer().start()
+        self.addCleanup(self.server.stop)
+        self.api = TelegramAPI('test-send-many', api_url=self.server.url,
+                               rate_limiter=RateLimiter(global_rate=1000, global_burst=1000))
+
+    def test_delivers_per_chat_in_order(self):
+        messages = [{'chat_id': chat_id % 3, 'text': str(index)} for index, chat_id in enumerate(range(9))]
+        results = collect(self.api.send_many(messages))
+
+        self.assertEqual(len(results), 9)
+        self.assertTrue(all(result.ok for result in results))
+        for chat_id in range(3):
+            texts = [message['text'] for message in self.server.sent_messages(chat_id)]
+            self.assertEqual(texts, sorted(texts, key=int))
+
+    def test_message_without_chat_id_is_reported_not_hung(self):
+        messages = [{'chat_id': 1, 'text': 'a'}, {'text': 'no chat'}, None, {'chat_id': 2, 'text': 'b'}]
+        results = collect(self.api.send_many(messages))
+
+        self.assertIsNotNone(results, "send_many hung on a malformed message")
+        statuses = sorted(result.status for result in results)
+        self.assertEqual(statuses, [SendResult.ERROR, SendResult.ERROR, SendResult.OK, SendResult.OK])
+        self.assertEqual(len(self.server.sent_messages()), 2)
+
+    def test_failing_message_source_does_not_hang(self):
+        def messages():
+            yield {'chat_id': 1, 'text': 'a'}
+            raise RuntimeError("source broke")
+
+        results = collect(self.api.send_many(messages()))
+
+        self.assertIsNotNone(results, "send_many hung after the producer failed")
+        self.assertEqual([result.status for result in results], [SendResult.OK])
+
+
+class TransferMetricsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = FakeTelegramServer().start()
+        self.addCleanup(self.server.stop)
+        self.metrics = RequestMetrics()
+        self.api = TelegramAPI('test-upload', api_url=self.server.url, metrics=self.metrics,
+                               rate_limiter=RateLimiter(global_rate=1000, global_burst=1000))
+
+    def test_upload_is_recorded_in_metrics(self):
+        self.api.send_photo(1, io.BytesIO(b'x' * 5000))
+        self.api.send_message(1, 'text')
+
+        methods = self.metrics.get_stats()['methods']
+        self.assertEqual(methods['sendPhoto']['uploads'], 1)
+        self.assertGreater(methods['sendPhoto']['upload_bytes'], 5000)
+        self.assertEqual(methods['sendMessage']['uploads'], 0)
+
+    def test_downloads_are_recorded_in_metrics(self):
+        file_path = self.api.get_file(self.server.add_file(b'y' * 3000))['file_path']
+
+        self.assertEqual(self.api.download_file(file_path), b'y' * 3000)
+        self.assertEqual(self.api.download_file_to(file_path, io.BytesIO())[0], 3000)
+        with self.assertRaises(Exception):
+            self.api.download_file('missing/file.bin')
+
+        stats = self.metrics.get_stats()['methods']['download_file']
+        self.assertEqual(stats['calls'], 3)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['http_statuses'], {200: 2, 404: 1})
+        self.assertGreaterEqual(stats['response_bytes'], 6000)
+
+    def test_response_size_comes_from_content_length(self):
+        self.api.send_message(1, 'text')
+        stats = self.metrics.get_stats()['methods']['sendMessage']
+        self.assertGreater(stats['response_bytes'], 0)
+
+    def test_empty_field_file_is_rejected(self):
+        empty = Course().preview_image
+        with self.assertRaisesMessage(ValueError, "No file to upload"):
+            MultipartStream({'chat_id': 1}, {'photo': empty})
+
+
+class DeadlineTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = FakeTelegramServer(method_latency={'sendMessage': 1.0}).start()
+        self.addCleanup(self.server.stop)
+        self.api = TelegramAPI('test-deadline', api_url=self.server.url,
+                               rate_limiter=RateLimiter(global_rate=1000, global_burst=1000))
+
+    def test_nested_deadline_cannot_extend_outer(self):
+        self.assertIsNone(remaining_time())
+        with update_deadline(1):
+            with update_deadline(60):
+                self.assertLessEqual(remaining_time(), 1)
+            with update_deadline(0.5):
+                self.assertLessEqual(remaining_time(), 0.5)
+        self.assertIsNone(remaining_time())
+
+    def test_timeouts_per_method_are_clipped_to_deadline(self):
+        self.assertEqual(self.api._get_timeout('answerCallbackQuery'), (3, 5))
+        self.assertEqual(self.api._get_timeout('getUpdates', {'timeout': 30}), (5, 40))
+        with update_deadline(2):
+            connect, read = self.api._get_timeout('sendDocument')
+        self.assertLessEqual(connect, 2)
+        self.assertLessEqual(read, 2)
+
+    def test_slow_request_stops_at_deadline(self):
+        started = time.monotonic()
+        with update_deadline(0.2):
+            with self.assertRaises(Exception):
+                self.api.send_message(1, 'slow')
+            self.assertLess(time.monotonic() - started, 0.9)
+            with self.assertRaises(DeadlineExceeded):
+                self.api.send_message(1, 'after the deadline')
+
+    def test_retry_after_beyond_deadline_is_not_waited(self):
+        self.server.inject('answerCallbackQuery', 429, retry_after=30)
+        started = time.monotonic()
+        with update_deadline(2), self.assertRaises(TelegramAPIError):
+            self.api.answer_callback_query('1')
+        self.assertLess(time.monotonic() - started, 1)
+
+
+class DownloadTests(SimpleTestCase):
+
+    DATA = bytes(range(256)) * 1000
+
+    def setUp(self):
+        self.server = FakeTelegramServer().start()
+        self.addCleanup(self.server.stop)
+        self.bot = BotManager('test-download', state_store=LocMemStateStore())
+        self.bot.api = TelegramAPI('test-download', api_url=self.server.url)
+        self.file_id = self.server.add_file(self.DATA, 'receipt.jpg')
+
+    def test_download_to_temp_file_with_hash(self):
+        downloaded = self.bot.download_file(self.file_id, max_bytes=len(self.DATA))
+        self.addCleanup(downloaded.close)
+
+        self.assertEqual(downloaded.size, len(self.DATA))
+        self.assertEqual(downloaded.sha256, hashlib.sha256(self.DATA).hexdigest())
+        self.assertEqual(downloaded.read(), self.DATA)
+        self.assertTrue(downloaded.name.endswith('.jpg'))
+
+    def test_file_over_limit_is_refused(self):
+        self.assertIsNone(self.bot.download_file(self.file_id, max_bytes=1000))
+
+    def test_stream_stops_at_limit(self):
+        file_path = self.bot.api.get_file(self.file_id)['file_path']
+        destination = io.BytesIO()
+        with self.assertRaises(FileTooLargeError):
+            self.bot.api.download_file_to(file_path, destination, max_bytes=1000)
+        self.assertLessEqual(len(destination.getvalue()), 1000)
+
+
+class MediaCacheTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media_root.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+        self.server = FakeTelegramServer().start()
+        self.addCleanup(self.server.stop)
+        self.api = TelegramAPI('test-media-cache', api_url=self.server.url,
+                               rate_limiter=RateLimiter(global_rate=1000, global_burst=1000))
+        self.course = make_course(preview_image=SimpleUploadedFile('a.jpg', b'first image'))
+
+    def uploads(self):
+        return [call for call in self.server.calls('sendPhoto') if call.files]
+
+    def test_file_is_uploaded_once(self):
+        CachedMedia(self.course, 'preview_image').send_photo(self.api, 1)
+        CachedMedia(self.course, 'preview_image').send_photo(self.api, 2)
+
+        self.assertEqual(len(self.uploads()), 1)
+        self.assertEqual(len(self.server.calls('sendPhoto')), 2)
+
+    def test_changed_image_drops_old_file_id(self):
+        CachedMedia(self.course, 'preview_image').send_photo(self.api, 1)
+        old_name = self.course.preview_image.name
+
+        self.course.preview_image = SimpleUploadedFile('b.jpg', b'second image')
+        self.course.save()
+
+        self.assertFalse(TelegramFileCache.objects.filter(file_name=old_name).exists())
+        CachedMedia(self.course, 'preview_image').send_photo(self.api, 1)
+        self.assertEqual(len(self.uploads()), 2)
+
+    def test_saving_without_file_change_keeps_file_id(self):
+        CachedMedia(self.course, 'preview_image').send_photo(self.api, 1)
+        self.course.price = 50
+        self.course.save()
+        self.assertEqual(TelegramFileCache.objects.count(), 1)
+
+    def test_deleted_object_drops_file_ids(self):
+        CachedMedia(self.course, 'preview_image').send_photo(self.api, 1)
+        self.course.delete()
+        self.assertFalse(TelegramFileCache.objects.exists())
+
+    def test_rejected_file_id_is_uploaded_again(self):
+        media = CachedMedia(self.course, 'preview_image')
+        TelegramFileCache.objects.create(
+            model_label='courses.Course', object_id=str(self.course.pk), field_name='preview_image',
+            file_name=self.course.preview_image.name, file_hash=media.file_hash, file_id='expired',
+        )
+
+        media.send_photo(self.api, 1)
+
+        self.assertEqual(len(self.uploads()), 1)
+        self.assertNotEqual(TelegramFileCache.objects.get().file_id, 'expired')
+
+
+class KeyboardRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        keyboards.clear_keyboard_cache()
+        self.addCleanup(keyboards.clear_keyboard_cache)
+
+    def test_markup_is_built_once(self):
+        self.assertIs(keyboards.payment_details('qr', 5), keyboards.payment_details('qr', 5))
+        self.assertNotEqual(keyboards.payment_details('qr', 5), keyboards.payment_details('uz', 5))
+
+    def test_overflow_evicts_least_recently_used(self):
+        main_menu = keyboards.main_menu('qr')
+        for course_id in range(keyboards.MAX_CACHED_KEYBOARDS + 100):
+            keyboards.back_to_course('qr', course_id)
+            keyboards.main_menu('qr')
+
+        stats = keyboards.get_keyboard_cache_stats()
+        self.assertEqual(stats['size'], keyboards.MAX_CACHED_KEYBOARDS)
+        self.assertEqual(stats['evictions'], 101)
+        # Часто используемая клавиатура пережила переполнение, старые — вытеснены
+        self.assertIs(keyboards.main_menu('qr'), main_menu)
+        self.assertNotIn(('back_to_course', 'qr', (0,)), keyboards._registry)
+        self.assertIn(('back_to_course', 'qr', (keyboards.MAX_CACHED_KEYBOARDS + 99,)), keyboards._registry)
+
+
+class ActivityTrackerTests(TestCase):
+
+    def setUp(self):
+        self.users = [TelegramUser.objects.create(chat_id=7400 + index) for index in range(3)]
+        self.now = timezone.now().replace(microsecond=0)
+
+    def last_activity(self, user):
+        return TelegramUser.objects.values_list('last_activity', flat=True).get(pk=user.pk)
+
+    def test_flush_writes_latest_marks_in_one_query(self):
+        tracker = ActivityTracker(flush_size=100)
+        later = self.now + datetime.timedelta(minutes=5)
+        tracker.record(self.users[0].pk, later)
+        tracker.record(self.users[0].pk, self.now)          # более старая отметка не перекрывает новую
+        tracker.record(self.users[1].pk, self.now)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(tracker.flush(), 2)
+
+        self.assertEqual(self.last_activity(self.users[0]), later)
+        self.assertEqual(self.last_activity(self.users[1]), self.now)
+        with self.assertNumQueries(0):
+            self.assertEqual(tracker.flush(), 0)
+
+    def test_full_buffer_is_flushed_immediately(self):
+        tracker = ActivityTracker(flush_size=3)
+        for user in self.users[:2]:
+            tracker.record(user.pk, self.now)
+        self.assertEqual(tracker.get_stats()['pending'], 2)
+
+        tracker.record(self.users[2].pk, self.now)
+
+        self.assertEqual(tracker.get_stats()['pending'], 0)
+        self.assertEqual(tracker.rows_written_total, 3)
+        self.assertEqual(self.last_activity(self.users[2]), self.now)
+
+    def test_failed_flush_keeps_marks(self):
+        tracker = ActivityTracker(flush_size=100)
+        tracker.record(self.users[0].pk, self.now)
+
+        with mock.patch('bot.models.TelegramUser.objects.bulk_update', side_effect=RuntimeError("db down")):
+            self.assertEqual(tracker.flush(), 0)
+        self.assertEqual(tracker.errors_total, 1)
+
+        self.assertEqual(tracker.flush(), 1)
+        self.assertEqual(self.last_activity(self.users[0]), self.now)
+
+
+class TranslationTests(SimpleTestCase):
+
+    def test_compile_reports_every_problem(self):
+        with self.assertRaises(TranslationError) as raised:
+            compile_messages({
+                'ok': {'qr': 'Kurs: {name}', 'uz': 'Kurs: {name}'},
+                'missing': {'qr': 'Bar'},
+                'mismatch': {'qr': '{price} sum', 'uz': '{amount} so\'m'},
+                'broken': {'qr': 'Kurs: {name', 'uz': 'Kurs: {name}'},
+            })
+        message = str(raised.exception)
+        self.assertIn('missing: no translation for uz', message)
+        self.assertIn('mismatch: placeholders differ', message)
+        self.assertIn('broken: invalid template', message)
+        self.assertNotIn('ok:', message)
+
+    def test_compile_builds_tables_and_fields(self):
+        tables, fields = compile_messages({'hello': {'qr': 'Sálem, {name}', 'uz': 'Salom, {name}'}})
+        self.assertEqual(tables['uz']['hello'], 'Salom, {name}')
+        self.assertEqual(fields['hello'], frozenset({'name'}))
+
+    def test_lookup_falls_back_to_default_language(self):
+        self.assertEqual(get_text('course_not_available', 'en'), get_text('course_not_available', 'qr'))
+        self.assertIs(texts_for('en'), texts_for('qr'))
+
+    def test_source_check_finds_bad_keys_and_format_arguments(self):
+        source = (
+            "t = texts_for(lang)\n"
+            "get_text('no_such_key', lang)\n"
+            "t.no_such_attribute\n"
+            "t.group_link_message.format(link=url)\n"
+            "get_text('group_link_message', lang).format(group_link=url)\n"
+            "t.group_link_message.format(**params)\n"
+        )
+        problems = find_translation_errors(source)
+        self.assertEqual([lineno for lineno, _ in problems], [2, 3, 4])
+        self.assertIn("missing group_link", problems[2][1])
+
+    def test_repository_uses_translations_correctly(self):
+        self.assertEqual(check_translation_usage(None), [])
+
+
+class MiddlewarePipelineTests(SimpleTestCase):
+
+    def setUp(self):
+        self.metrics = HandlerMetrics()
+        self.pipeline = MiddlewarePipeline([HandlerMetricsMiddleware(self.metrics)])
+
+    def stats(self, name):
+        return self.metrics.get_stats()['handlers'][name]
+
+    def test_raised_error_is_counted_and_propagated(self):
+        def broken(bot, update):
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            self.pipeline.run(None, broken, {})
+        self.assertEqual(self.stats('broken')['errors'], 1)
+
+    def test_handled_error_is_counted(self):
+        def careful(bot, update):
+            report_handled_error(ValueError("caught"))
+            return 'replied'
+
+        update = {}
+        self.assertEqual(self.pipeline.run(None, careful, update), 'replied')
+        self.assertEqual(self.stats('careful')['errors'], 1)
+        self.assertEqual(update, {})
+
+    def test_nested_handler_error_is_not_charged_to_outer(self):
+        def inner(bot, update):
+            report_handled_error(ValueError("caught"))
+
+        def outer(bot, update):
+            self.pipeline.run(bot, inner, update)
+
+        self.pipeline.run(None, outer, {})
+        self.assertEqual(self.stats('inner')['errors'], 1)
+        self.assertEqual(self.stats('outer')['errors'], 0)
+        self.assertEqual(self.stats('outer')['calls'], 1)
+
+
+class LanguageCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = TelegramUser.objects.create(chat_id=7001, language='qr')
+        invalidate_user_language(self.user.chat_id)
+
+    def test_shared_entry_expires(self):
+        with mock.patch('bot.utils.cache.add') as cache_add:
+            get_cached_language(self.user.chat_id)
+        timeout = cache_add.call_args.args[2]
+        self.assertIsNotNone(timeout)
+        self.assertGreater(timeout, 0)
+
+    def test_write_racing_with_invalidation_is_not_served(self):
+        add = cache.add
+
+        def change_then_add(*args):
+            # Язык сменили и кэш сбросили, пока этот читатель ходил в БД
+            TelegramUser.objects.filter(pk=self.user.pk).update(language='uz')
+            invalidate_user_language(self.user.chat_id)
+            return add(*args)
+
+        with mock.patch('bot.utils.cache.add', side_effect=change_then_add):
+            self.assertEqual(get_cached_language(self.user.chat_id), 'qr')
+
+        # Другой процесс (пустой локальный кэш) не должен получить записанный гонкой старый язык
+        _language_cache.delete(self.user.chat_id)
+        self.assertEqual(get_cached_language(self.user.chat_id), 'uz')
+        _language_cache.delete(self.user.chat_id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_language(self.user.chat_id), 'uz')
+
+    def test_invalidated_after_commit(self):
+        self.assertEqual(get_cached_language(self.user.chat_id), 'qr')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.user.language = 'uz'
+            self.user.save(update_fields=['language'])
+            # До коммита кэш не трогаем: иначе его снова заполнит старое значение из БД
+            self.assertEqual(get_cached_language(self.user.chat_id), 'qr')
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(get_cached_language(self.user.chat_id), 'uz')
+
+
+class AsyncClientPoolTests(SimpleTestCase):
+
+    def test_instances_share_pool_per_token_and_loop(self):
+        async def clients():
+            first, second = AsyncTelegramAPI('pool-a'), AsyncTelegramAPI('pool-a')
+            other = AsyncTelegramAPI('pool-b')
+            try:
+                return first.client, second.client, other.client
+            finally:
+                await first.close()
+                await other.close()
+
+        first, second, other = asyncio.run(clients())
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        self.assertTrue(first.is_closed)
+
+        # В другом event loop — свой пул
+        again, _, _ = asyncio.run(clients())
+        self.assertIsNot(again, first)
+
+    def test_server_round_trip(self):
+        server = FakeTelegramServer().start()
+        self.addCleanup(server.stop)
+
+        async def send():
+            async with AsyncTelegramAPI('pool-c', api_url=server.url) as api:
+                await asyncio.gather(*(api.send_message(chat_id, 'hi') for chat_id in range(5)))
+
+        asyncio.run(send())
+        self.assertEqual(len(server.sent_messages()), 5)
+
+
+class UpdatePollerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = FakeTelegramServer().start()
+        self.addCleanup(self.server.stop)
+        self.api = TelegramAPI('test-poller', api_url=self.server.url)
+
+    def start_poller(self) -> UpdatePoller:
+        poller = UpdatePoller(self.api, timeout=1).start()
+        self.addCleanup(poller.stop)
+        return poller
+
+    def wait_for(self, condition, timeout: float = 5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "condition not reached")
+            time.sleep(0.01)
+
+    def test_next_poll_is_in_flight_while_batch_is_processed(self):
+        first = self.server.push_message(1, 'a')
+        poller = self.start_poller()
+        batches = iter(poller)
+
+        self.assertEqual([update['update_id'] for update in next(batches)], [first['update_id']])
+        # Пачка ещё «обрабатывается», а следующий getUpdates уже подтвердил её и ждёт новые
+        self.wait_for(lambda: any(call.params.get('offset') == first['update_id'] + 1
+                                  for call in self.server.calls('getUpdates')))
+        second = self.server.push_message(1, 'b')
+        self.assertEqual([update['update_id'] for update in next(batches)], [second['update_id']])
+        self.assertEqual(poller.get_stats()['updates_total'], 2)
+
+    def test_error_backs_off_and_recovers(self):
+        get_updates = self.api.get_updates
+        failures = iter([ConnectionError("network down")])
+
+        def flaky_get_updates(**kwargs):
+            error = next(failures, None)
+            if error:
+                raise error
+            return get_updates(**kwargs)
+
+        update = self.server.push_message(1, 'a')
+        with mock.patch.object(self.api, 'get_updates', side_effect=flaky_get_updates), \
+                mock.patch('bot.polling.ERROR_BACKOFF_MIN', 0.05):
+            poller = self.start_poller()
+            batch = next(iter(poller))
+
+        self.assertEqual([item['update_id'] for item in batch], [update['update_id']])
+        self.assertEqual(poller.errors_total, 1)
+
+    def test_empty_polls_are_not_yielded(self):
+        poller = self.start_poller()
+        self.wait_for(lambda: poller.empty_polls >= 1)
+        self.assertEqual(poller.get_stats()['prefetched_batches'], 0)
+
+
+class StartDispatcherTests(SimpleTestCase):
+
+    def test_concurrent_start_creates_one_dispatcher(self):
+        bot = BotManager('test-start-dispatcher', state_store=LocMemStateStore())
+        barrier = threading.Barrier(8)
+        started = []
+
+        def start():
+            barrier.wait()
+            started.append(bot.start_dispatcher())
+
+        with mock.patch('bot.bot_manager.atexit.register') as register:
+            threads = [threading.Thread(target=start) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.addCleanup(bot.stop_dispatcher)
+
+        self.assertEqual(len({id(dispatcher) for dispatcher in started}), 1)
+        register.assert_called_once_with(bot.stop_dispatcher)
+
+
+class StateStoreTests(SimpleTestCase):
+
+    def test_incomplete_backend_fails_on_creation(self):
+        class ReadOnlyStore(StateStore):
+            def _read(self, chat_id):
+                return None
+
+        with self.assertRaises(TypeError):
+            ReadOnlyStore()
+
+    def test_session_coalesces_writes(self):
+        store = LocMemStateStore()
+        with store.session():
+            record = store.load(1)
+            record.state = 'main_menu'
+            store.save(record)
+            self.assertIs(store.load(1), record)
+            record.data['course_id'] = 5
+            store.save(record)
+        self.assertEqual(store.writes, 1)
+
+        loaded = store.load(1)
+        self.assertEqual((loaded.state, loaded.data), ('main_menu', {'course_id': 5}))
+
+
+class CallbackCodecTests(SimpleTestCase):
+
+    SAMPLE_ARGS = {int: 2 ** 40, LANGUAGE: 'uz'}
+
+    def test_round_trip_every_action(self):
+        for action, (_, fields) in ACTIONS.items():
+            args = tuple(self.SAMPLE_ARGS[kind] for _, kind in fields)
+            token = encode(action, *args)
+            self.assertLessEqual(len(token), MAX_CALLBACK_DATA)
+            self.assertEqual(decode(token), CallbackData(action, args), action.name)
+
+    def test_named_fields(self):
+        callback = decode(encode(Action.PAYMENT_METHOD, 3, 1))
+        self.assertEqual((callback.course_id, callback.method_id), (3, 1))
+        self.assertEqual(callback.route, 'payment_method_')
+
+    def test_legacy_strings(self):
+        self.assertEqual(decode('payment_method_3_1'), CallbackData(Action.PAYMENT_METHOD, (3, 1)))
+        self.assertEqual(decode('set_lang_qr'), CallbackData(Action.SET_LANG, ('qr',)))
+        self.assertIsNone(decode('set_lang_en'))
+        self.assertIsNone(decode('course_abc'))
+
+    def test_rejects_other_versions_and_garbage(self):
+        def token(*raw):
+            return '~' + base64.urlsafe_b64encode(bytes(raw)).rstrip(b'=').decode()
+
+        self.assertIsNotNone(decode(token(CODEC_VERSION, Action.COURSE, 5)))
+        self.assertIsNone(decode(token(CODEC_VERSION + 1, Action.COURSE, 5)))
+        self.assertIsNone(decode(token(CODEC_VERSION, Action.COURSE, 5, 0)))     # лишние байты
+        self.assertIsNone(decode(token(CODEC_VERSION, Action.COURSE)))           # нет аргумента
+        self.assertIsNone(decode(token(CODEC_VERSION, 200)))                     # неизвестное действие
+        self.assertIsNone(decode('~!!'))
+        self.assertIsNone(decode(''))
+
+    def test_encode_validates_arguments(self):
+        with self.assertRaises(ValueError):
+            encode(Action.COURSE)
+        with self.assertRaises(ValueError):
+            encode(Action.COURSE, -1)
+
+
+class CallbackRouterTests(SimpleTestCase):
+
+    def test_longest_prefix_wins_regardless_of_order(self):
+        router = CallbackRouter()
+        router.add('payment_method_', 'method')
+        router.add('payment_', 'payment')
+        router.add('pay', 'pay')
+
+        self.assertEqual(router.resolve('payment_method_3_1').handler, 'method')
+        self.assertEqual(router.resolve('payment_method_3_1').args, (3, 1))
+        self.assertEqual(router.resolve('payment_7').handler, 'payment')
+        self.assertEqual(router.resolve('payx').handler, 'pay')
+        self.assertIsNone(router.resolve('pa'))
+        self.assertIsNone(router.resolve('other'))
+
+    def test_args_and_registration(self):
+        router = CallbackRouter()
+        router.add('set_lang_', 'old')
+        router.add('set_lang_', 'new')
+
+        match = router.resolve('set_lang_qr')
+        self.assertEqual((match.handler, match.prefix, match.args), ('new', 'set_lang_', ('qr',)))
+        self.assertEqual(len(router), 1)
+        self.assertIn('set_lang_', router)
+        self.assertNotIn('set_', router)
+
+    def test_non_ascii_digits_stay_strings(self):
+        self.assertEqual(parse_callback_args('_2²_٣_7'), ('2²', '٣', 7))
+        router = CallbackRouter()
+        router.add('course_', 'course')
+        self.assertEqual(router.resolve('course_²').args, ('²',))
+
+
+class UpdateDeduplicatorTests(SimpleTestCase):
+
+    def test_duplicates_inside_window(self):
+        dedupe = UpdateDeduplicator(window=8)
+        self.assertFalse(dedupe.is_duplicate(5))
+        self.assertTrue(dedupe.is_duplicate(5))
+        self.assertFalse(dedupe.is_duplicate(3))        # пришёл позже, но внутри окна
+        self.assertTrue(dedupe.is_duplicate(3))
+
+    def test_window_slides_and_evicts(self):
+        dedupe = UpdateDeduplicator(window=8)
+        for update_id in range(1, 9):
+            self.assertFalse(dedupe.is_duplicate(update_id))
+        # 12 занимает ячейки 9..12 — те же, что 1..4; старые отметки должны быть стёрты
+        self.assertFalse(dedupe.is_duplicate(12))
+        for update_id in (9, 10, 11):
+            self.assertFalse(dedupe.is_duplicate(update_id))
+        self.assertTrue(dedupe.is_duplicate(5))          # ещё внутри окна (5..12)
+
+    def test_far_jump_and_reset(self):
+        dedupe = UpdateDeduplicator(window=8)
+        dedupe.is_duplicate(100)
+        self.assertFalse(dedupe.is_duplicate(1000))      # окно очищается целиком
+        self.assertFalse(dedupe.is_duplicate(100))       # ниже окна — новая последовательность
+        self.assertEqual(dedupe.get_stats()['resets_total'], 1)
+
+    def test_forget(self):
+        dedupe = UpdateDeduplicator(window=8)
+        dedupe.is_duplicate(5)
+        dedupe.forget(5)
+        self.assertFalse(dedupe.is_duplicate(5))
+
+
+def chat_update(update_id: int, chat_id: int) -> dict:
+    return {'update_id': update_id, 'message': {'chat': {'id': chat_id}, 'text': str(update_id)}}
+
+
+class UpdateDispatcherTests(SimpleTestCase):
+
+    def test_per_chat_order_is_preserved(self):
+        seen = {}
+        lock = threading.Lock()
+
+        def handler(update):
+            chat_id = update['message']['chat']['id']
+            with lock:
+                seen.setdefault(chat_id, []).append(update['update_id'])
+
+        dispatcher = UpdateDispatcher(handler, workers=4, queue_size=100).start()
+        self.addCleanup(dispatcher.stop)
+        for update_id in range(60):
+            self.assertTrue(dispatcher.submit(chat_update(update_id, update_id % 3)))
+        dispatcher.join()
+
+        for chat_id in range(3):
+            self.assertEqual(seen[chat_id], list(range(chat_id, 60, 3)))
+        self.assertEqual(dispatcher.processed_total, 60)
+
+    def test_rejects_when_full(self):
+        release = threading.Event()
+        dispatcher = UpdateDispatcher(lambda update: release.wait(5), workers=1, queue_size=2).start()
+        self.addCleanup(dispatcher.stop)
+        self.addCleanup(release.set)
+
+        self.assertTrue(dispatcher.submit(chat_update(1, 1)))
+        self.assertTrue(dispatcher.submit(chat_update(2, 2)))
+        self.assertFalse(dispatcher.submit(chat_update(3, 3), timeout=0.05))
+        self.assertEqual(dispatcher.rejected_total, 1)
+
+        release.set()
+        dispatcher.join()
+        self.assertTrue(dispatcher.submit(chat_update(4, 3), timeout=1))
+
+    def test_handler_error_does_not_stop_lane(self):
+        handled = []
+
+        def handler(update):
+            if update['update_id'] == 1:
+                raise ValueError("boom")
+            handled.append(update['update_id'])
+
+        dispatcher = UpdateDispatcher(handler, workers=2).start()
+        self.addCleanup(dispatcher.stop)
+        dispatcher.submit(chat_update(1, 1))
+        dispatcher.submit(chat_update(2, 1))
+        dispatcher.join()
+
+        self.assertEqual(handled, [2])
+        self.assertEqual(dispatcher.failed_total, 1)
+
+
+class RateLimiterTests(SimpleTestCase):
+
+    def test_bucket_refills_up_to_capacity(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        start = bucket.updated_at
+        self.assertEqual(bucket.reserve(start), 0.0)
+        self.assertEqual(bucket.reserve(start), 0.0)
+        self.assertAlmostEqual(bucket.reserve(start), 0.1)      # дефицит в один токен
+
+        self.assertEqual(bucket.reserve(start + 0.3), 0.0)      # -1 + 3 токена, но не больше 2
+        self.assertAlmostEqual(bucket.tokens, 1.0)
+        self.assertTrue(bucket.is_idle(start + 10))
+        self.assertEqual(bucket.tokens, 2)
+
+    def test_max_wait_refunds_reservation(self):
+        limiter = RateLimiter(global_rate=100, global_burst=100, chat_rate=1, chat_burst=1)
+        self.assertEqual(limiter.reserve(5), 0.0)
+        self.assertIsNone(limiter.reserve(5, max_wait=0.1))
+        wait = limiter.reserve(5)
+        self.assertGreater(wait, 0.5)
+        self.assertLessEqual(wait, 1.0)
+        self.assertEqual(limiter.reserve(6), 0.0)               # другой чат не ждёт
+
+
+class CatalogTests(TestCase):
+
+    def setUp(self):
+        self.course = make_course()
+        self.method = PaymentMethod.objects.create(name_qr='Karta', name_uz='Karta', card_number='8600')
+
+    def test_change_from_another_process_is_picked_up(self):
+        catalog = Catalog(check_interval=0)
+        self.assertEqual(catalog.get('qr').courses_by_id[self.course.id].price, 100)
+
+        # Другой процесс (админка): строка в БД и версия в БД, без сигналов в этом процессе
+        Course.objects.filter(pk=self.course.pk).update(price=70)
+        PaymentMethod.objects.filter(pk=self.method.pk).update(card_number='9860')
+        SharedVersion(VERSION_CACHE_KEY).bump()
+
+        languages = catalog.get('qr')
+        self.assertEqual(languages.courses_by_id[self.course.id].price, 70)
+        self.assertEqual(languages.payment_methods_by_id[self.method.id].card_number, '9860')
+
+    def test_snapshot_is_not_older_than_max_age(self):
+        catalog = Catalog(check_interval=3600, max_age=0)
+        catalog.get('qr')
+        Course.objects.filter(pk=self.course.pk).update(price=70)
+        self.assertEqual(catalog.get('qr').courses_by_id[self.course.id].price, 70)
+
+    def test_inactive_courses_are_not_listed(self):
+        catalog = Catalog(check_interval=0)
+        Course.objects.filter(pk=self.course.pk).update(is_active=False)
+        SharedVersion(VERSION_CACHE_KEY).bump()
+
+        languages = catalog.get('qr')
+        self.assertEqual(languages.courses, ())
+        self.assertFalse(languages.courses_by_id[self.course.id].is_active)
+
+
+class InfoPageCacheTests(TestCase):
+
+    def setUp(self):
+        self.page = InfoPage.objects.create(key='about', content_qr='Biz haqqında', content_uz='Biz haqimizda')
+
+    def test_change_from_another_process_is_picked_up(self):
+        pages = InfoPageCache(check_interval=0)
+        self.assertEqual(pages.get('about', 'uz'), 'Biz haqimizda')
+
+        InfoPage.objects.filter(pk=self.page.pk).update(content_uz='Yangi')
+        SharedVersion(INFO_PAGES_VERSION_KEY).bump()
+
+        self.assertEqual(pages.get('about', 'uz'), 'Yangi')
+
+    def test_page_is_not_older_than_max_age(self):
+        pages = InfoPageCache(check_interval=3600, max_age=0)
+        pages.get('about', 'qr')
+        InfoPage.objects.filter(pk=self.page.pk).update(content_qr='Jańa')
+        self.assertEqual(pages.get('about', 'qr'), 'Jańa')
+
+    def test_load_racing_with_invalidate_is_not_stored(self):
+        pages = InfoPageCache(check_interval=3600)
+        pages.get('about', 'qr')
+        load = pages._load
+
+        def load_then_change(key):
+            page = load(key)
+            # Страницу изменили, пока шло чтение: прочитанное уже устарело
+            InfoPage.objects.filter(pk=self.page.pk).update(content_qr='Jańa')
+            pages.invalidate(key)
+            return page
+
+        pages.invalidate('about')
+        with mock.patch.object(pages, '_load', side_effect=load_then_change):
+            self.assertEqual(pages.get('about', 'qr'), 'Biz haqqında')
+        self.assertEqual(pages.get('about', 'qr'), 'Jańa')
+
+    def test_missing_page_is_cached(self):
+        pages = InfoPageCache(check_interval=3600)
+        self.assertIsNone(pages.get('support', 'qr'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(pages.get('support', 'qr'))
+
+
+class PurchaseFlowTests(BotFlowMixin, TestCase):
+
+    def setUp(self):
+        self.bot = self.start_bot('test-purchase-flow')
+        self.user = TelegramUser.objects.create(chat_id=7100, language='qr', phone='1')
+        self.course = make_course()
+        self.method = PaymentMethod.objects.create(name_qr='Karta', name_uz='Karta', card_number='8600')
+        invalidate_catalog()
+
+    def select_method(self):
+        self.bot.process_update(callback_update(
+            1, self.user.chat_id, encode(Action.PAYMENT_METHOD, self.course.id, self.method.id)))
+
+    def test_active_course_opens_payment_details(self):
+        self.select_method()
+        self.assertIn('8600', self.last_text())
+        self.assertEqual(self.bot.get_user_state(self.user.chat_id), BotStates.WAITING_RECEIPT)
+
+    def test_stale_button_of_deactivated_course_does_not_start_purchase(self):
+        Course.objects.filter(pk=self.course.pk).update(is_active=False)
+        invalidate_catalog()
+
+        self.select_method()
+        self.assertEqual(self.last_text(), get_text('course_not_available', 'qr'))
+        self.assertNotEqual(self.bot.get_user_state(self.user.chat_id), BotStates.WAITING_RECEIPT)
+
+    def test_deactivated_payment_method_is_refused(self):
+        PaymentMethod.objects.filter(pk=self.method.pk).update(is_active=False)
+        invalidate_catalog()
+
+        self.select_method()
+        self.assertEqual(self.last_text(), get_text('no_payment_methods_available', 'qr'))
+
+
+class UpdateScopeTests(BotFlowMixin, TestCase):
+
+    def setUp(self):
+        self.bot = self.start_bot('test-update-scope')
+        self.user = TelegramUser.objects.create(chat_id=7300, language='qr', phone='1')
+
+    def test_update_payload_is_not_modified(self):
+        update = callback_update(1, self.user.chat_id, encode(Action.SET_LANG, 'uz'))
+        original = copy.deepcopy(update)
+
+        self.bot.process_update(update)
+
+        self.assertEqual(update, original)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.language, 'uz')
+
+    def test_contexts_of_one_update_share_loaded_models(self):
+        seen = []
+
+        def handler(bot, update):
+            first = MessageContext(bot, update)
+            first.telegram_user
+            with self.assertNumQueries(0):
+                seen.append(MessageContext(bot, update).telegram_user)
+
+        self.bot.add_command_handler('scope', handler)
+        update = {'update_id': 1, 'message': {
+            'chat': {'id': self.user.chat_id}, 'from': {'id': self.user.chat_id}, 'text': '/scope',
+        }}
+        self.bot.process_update(update)
+
+        self.assertEqual(seen, [self.user])
+        self.assertEqual(set(update), {'update_id', 'message'})
+
+
+class ConfirmPaymentTests(BotFlowMixin, TestCase):
+
+    def setUp(self):
+        self.bot = self.start_bot('test-confirm-payment')
+
+    def test_unknown_payment(self):
+        self.bot.process_update(callback_update(1, 7200, encode(Action.CONFIRM_PAYMENT, 999)))
+        self.assertIn('Tólem tabılmadı', self.last_text())
+
+    def test_malformed_callback(self):
+        self.bot.process_update(callback_update(1, 7200, 'confirm_payment_x'))
+        self.assertIn('Tólem tabılmadı', self.last_text())
+
+    def test_unexpected_error_is_reported(self):
+        with mock.patch('bot.payment_handlers.Payment.objects.get', side_effect=AttributeError("bug")):
+            self.bot.process_update(callback_update(1, 7200, encode(Action.CONFIRM_PAYMENT, 1)))
+        self.assertIn('tastıyıqlawda qátelik', self.last_text())
@@ -1,5 +1,12 @@
 # bot/translations.py
 
+import string
+import logging
+from types import MappingProxyType, SimpleNamespace
+from typing import Dict, FrozenSet
+
+logger = logging.getLogger(__name__)
+
 MESSAGES = {
     # Til tańlaw
     'welcome_prompt_language': {
@@ -398,18 +405,80 @@ MESSAGES = {
     },
 }
 
+# --- KOMPILYACIYA ---
+# MESSAGES import waqtında hár til ushın tegis kestelerge kompilyaciyalanadı.
+# Awdarması joq kilt yamasa tillerde hár qıylı placeholder bolsa, bot iske túspeydi
+# (TranslationError). Kodtaǵı kiltler hám .format() argumentleri bot.checks-te tekseriledi.
+
+LANGUAGES = ('qr', 'uz')
+DEFAULT_LANGUAGE = 'qr'
+
+_formatter = string.Formatter()
+
+
+class TranslationError(Exception):
+    """MESSAGES-te awdarma jetispeydi yamasa placeholderler sáykes emes"""
+
+
+def template_fields(template: str) -> FrozenSet[str]:
+    """Shablondaǵı placeholder atları: 'Kurs: {course_name}' -> {'course_name'}"""
+    fields = set()
+    for _, field_name, _, _ in _formatter.parse(template):
+        if field_name is not None:
+            fields.add(field_name.split('.')[0].split('[')[0])
+    return frozenset(fields)
+
+
+def compile_messages(messages: Dict[str, Dict[str, str]]):
+    """MESSAGES -> ({til: {kilt: tekst}}, {kilt: placeholderler}); qáteler bolsa TranslationError"""
+    errors = []
+    fields: Dict[str, FrozenSet[str]] = {}
+    for key, variants in messages.items():
+        missing = [lang for lang in LANGUAGES if not variants.get(lang)]
+        if missing:
+            errors.append(f"{key}: no translation for {', '.join(missing)}")
+            continue
+        try:
+            by_lang = {lang: template_fields(variants[lang]) for lang in LANGUAGES}
+        except ValueError as e:
+            errors.append(f"{key}: invalid template ({e})")
+            continue
+        if len(set(by_lang.values())) > 1:
+            detail = '; '.join(f"{lang}={sorted(names)}" for lang, names in by_lang.items())
+            errors.append(f"{key}: placeholders differ between languages ({detail})")
+            continue
+        fields[key] = by_lang[DEFAULT_LANGUAGE]
+
+    if errors:
+        raise TranslationError("Invalid translations:\n" + "\n".join(errors))
+
+    tables = {
+        lang: MappingProxyType({key: messages[key][lang] for key in fields})
+        for lang in LANGUAGES
+    }
+    return MappingProxyType(tables), MappingProxyType(fields)
+
+
+# Tegis kesteler: TABLES[til][kilt] -> tekst; FIELDS[kilt] -> placeholderler
+TABLES, FIELDS = compile_messages(MESSAGES)
+_DEFAULT_TABLE = TABLES[DEFAULT_LANGUAGE]
+
+# Hár til ushın atributlar arqalı qatnaw: texts_for('uz').course_label
+_NAMESPACES = {lang: SimpleNamespace(**table) for lang, table in TABLES.items()}
+
+
+def texts_for(lang_code: str) -> SimpleNamespace:
+    """Bir tildiń barlıq tekstleri atributlar retinde (kóp tekst paydalanatuǵın handlerler ushın)"""
+    return _NAMESPACES.get(lang_code) or _NAMESPACES[DEFAULT_LANGUAGE]
+
+
 def get_text(key, lang_code='qr'):
     """
-    Kilt hám til kodi arqalı tekstti alıw. Eger awdarma tabılmasa, qaraqalpaqsha versiyasın qaytaradı.
+    Kilt hám til kodi arqalı tekstti alıw. Nadurıs til kodi berilse, qaraqalpaqsha versiyasın qaytaradı.
     """
-    # Eger nadurıs til kodi berilse, standart tilge ótiw
-    if lang_code not in ['qr', 'uz']:
-        lang_code = 'qr'
-        
-    message_set = MESSAGES.get(key)
-    if message_set:
-        # Dáslep paydalanıwshı tilindegi tekstti, eger ol joq bolsa standart (qr) tildegi tekstti qaytarıw
-        return message_set.get(lang_code, message_set.get('qr', f"NO_TRANSLATION_FOUND_FOR_LANG:{lang_code}"))
-    
-    # Eger kilt ulıwma tabılmasa
-    return f"KEY_NOT_FOUND: {key}"
\ No newline at end of file
+    text = TABLES.get(lang_code, _DEFAULT_TABLE).get(key)
+    if text is None:
+        # Kodtaǵı kiltler bot.checks-te tekseriledi, bul jaǵday tek dinamikalıq kilt ushın múmkin
+        logger.error(f"Translation key not found: {key}")
+        return f"KEY_NOT_FOUND: {key}"
+    return text
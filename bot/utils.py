@@ -1,14 +1,100 @@
 # bot/utils.py
 # Ulıwma járdemshi funkciyalar ushın
 
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import LRUCache
 from .models import TelegramUser
 
-def get_user_language(chat_id: int) -> str:
-    """Paydalanıwshınıń til kodın bazadan alıw"""
-    try:
-        user = TelegramUser.objects.get(chat_id=chat_id)
-        # Eger paydalanıwshı til tańlamaǵan bolsa, standart til 'qr' boladı
-        return user.language or 'qr'
-    except TelegramUser.DoesNotExist:
-        # Eger paydalanıwshı bazada joq bolsa (bul jaǵday kem ushırasadı), standart til qaytarıladı
-        return 'qr'
\ No newline at end of file
+DEFAULT_LANGUAGE = 'qr'
+
+# chat_id -> til kodı ('' — paydalanıwshı joq yamasa til tańlamaǵan).
+# Process ishindegi kesh qısqa TTL menen jasaydı: basqa worker tildi ózgertse,
+# bul process eń kóbi TTL sekundtan soń jańa mánisti Django cache-ten aladı.
+_language_cache = LRUCache(
+    max_size=getattr(settings, 'TELEGRAM_LANGUAGE_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'TELEGRAM_LANGUAGE_CACHE_TTL', 60),
+)
+# Django cache-tegi jazba máńgilik emes: eski til qáteden jazılıp qalsa da, TTL-den soń jańalanadı
+_SHARED_TTL = getattr(settings, 'TELEGRAM_LANGUAGE_SHARED_CACHE_TTL', 3600)
+_MISSING = object()
+_shared_stats = {'shared_hits': 0, 'db_queries': 0, 'stale_entries': 0}
+_stats_lock = threading.Lock()
+
+
+def _language_cache_key(chat_id: int) -> str:
+    return f"bot:lang:{chat_id}"
+
+
+def _generation_key(chat_id: int) -> str:
+    return f"bot:lang:gen:{chat_id}"
+
+
+def _count(name: str):
+    with _stats_lock:
+        _shared_stats[name] += 1
+
+
+def get_cached_language(chat_id: int) -> str:
+    """chat_id boyınsha til kodı: process keshi -> Django cache -> baza.
+
+    Django cache-te (generation, til) saqlanadı. invalidate_user_language() generation-dı
+    jańalaydı, sonıń ushın bazanı invalidaciyadan aldın oqıp, keyin jazıp úlgergen
+    eski mánis keyingi oqıwda esapqa alınbaydı (_SHARED_TTL boyı qatıp qalmaydı).
+    """
+    language = _language_cache.get(chat_id, _MISSING)
+    if language is not _MISSING:
+        return language or DEFAULT_LANGUAGE
+
+    key, generation_key = _language_cache_key(chat_id), _generation_key(chat_id)
+    shared = cache.get_many([key, generation_key])
+    # Bazanı oqıwdan aldınǵı generation: oqıw waqtında til ózgerse, jazba eski bolıp qaladı
+    generation = shared.get(generation_key)
+    entry = shared.get(key)
+    if isinstance(entry, tuple) and entry[0] == generation:
+        _count('shared_hits')
+        language = entry[1]
+    else:
+        _count('db_queries')
+        language = TelegramUser.objects.filter(chat_id=chat_id).values_list('language', flat=True).first() or ''
+        if entry is None:
+            # Jazba joq bolsa ǵana qosamız: parallel oqıwshı basqa mánisti jazıp úlgerse, tiymeymiz
+            cache.add(key, (generation, language), _SHARED_TTL)
+        else:
+            _count('stale_entries')
+            cache.set(key, (generation, language), _SHARED_TTL)
+    _language_cache.set(chat_id, language)
+    return language or DEFAULT_LANGUAGE
+
+
+def invalidate_user_language(chat_id: int):
+    """Til keshinen paydalanıwshını óshiriw (TelegramUser saqlanǵanda signal shaqıradı)"""
+    _language_cache.delete(chat_id)
+    # Jańa generation: usı waqıtqa shekem baslanǵan oqıwlardıń jazbaları eskirgen bolıp esaplanadı
+    cache.set(_generation_key(chat_id), time.time_ns(), _SHARED_TTL * 2)
+    cache.delete(_language_cache_key(chat_id))
+
+
+def get_language_cache_stats() -> dict:
+    with _stats_lock:
+        shared_stats = dict(_shared_stats)
+    return {**_language_cache.get_stats(), **shared_stats}
+
+
+def get_user_language(user) -> str:
+    """Paydalanıwshınıń til kodın alıw.
+
+    user — MessageContext, TelegramUser yamasa chat_id (chat_id bolsa, mánis keshten alınadı).
+    """
+    if isinstance(user, TelegramUser):
+        return user.language or DEFAULT_LANGUAGE
+    if hasattr(user, 'lang'):
+        return user.lang
+    # Eger paydalanıwshı bazada joq bolsa yamasa til tańlamaǵan bolsa, standart til 'qr' boladı
+    if user is None:
+        return DEFAULT_LANGUAGE
+    return get_cached_language(user)
@@ -1,6 +1,7 @@
 # bot/views.py
 
 import json
+import threading
 import logging
 from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -8,37 +9,67 @@ from django.views.decorators.http import require_POST
 from django.conf import settings
 from .bot_manager import BotManager
 from .bot_handlers_simple import setup_bot_handlers
+from .activity import get_activity_tracker
+from .keyboards import get_keyboard_cache_stats
+from .utils import get_language_cache_stats
+from .catalog import catalog
+from .info_pages import info_pages
 
 logger = logging.getLogger('bot')
 
 # Глобальная переменная для хранения экземпляра бота
 _bot_instance = None
+_bot_instance_lock = threading.Lock()
 
 def get_bot_instance():
     """Получить экземпляр бота (singleton)"""
     global _bot_instance
     if _bot_instance is None:
-        _bot_instance = BotManager(settings.TELEGRAM_BOT_TOKEN)
-        setup_bot_handlers(_bot_instance)
-        logger.info("Bot instance created and configured")
+        with _bot_instance_lock:
+            if _bot_instance is None:
+                bot = BotManager(settings.TELEGRAM_BOT_TOKEN)
+                setup_bot_handlers(bot)
+                _bot_instance = bot
+                logger.info("Bot instance created and configured")
     return _bot_instance
 
+def get_bot_instance_for_webhook():
+    """Экземпляр бота с запущенным пулом обработчиков updates"""
+    bot = get_bot_instance()
+    bot.start_dispatcher()
+    return bot
+
+def is_valid_update(update_data) -> bool:
+    """Минимальная проверка формата update от Telegram"""
+    return (
+        isinstance(update_data, dict)
+        and isinstance(update_data.get('update_id'), int)
+        and len(update_data) > 1
+    )
+
 @csrf_exempt
 @require_POST
 def webhook(request):
     """
-    Обработчик webhook для Telegram бота
+    Обработчик webhook для Telegram бота.
+    Update ставится в очередь и обрабатывается в фоне, Telegram сразу получает 200.
     """
     try:
         # Получаем данные от Telegram
         update_data = json.loads(request.body)
+        if not is_valid_update(update_data):
+            logger.error("Invalid update in webhook request")
+            return HttpResponse("Bad Request", status=400)
+        
         logger.info(f"Webhook received update from user: {update_data.get('message', {}).get('from', {}).get('id', 'unknown')}")
         
         # Получаем экземпляр бота
-        bot = get_bot_instance()
+        bot = get_bot_instance_for_webhook()
         
-        # Обрабатываем обновление
-        bot.process_update(update_data)
+        # Очередь заполнена — Telegram повторит доставку позже
+        if not bot.enqueue_update(update_data, timeout=getattr(settings, 'TELEGRAM_WEBHOOK_QUEUE_TIMEOUT', 0)):
+            logger.warning(f"Update queue is full, update {update_data['update_id']} rejected")
+            return HttpResponse("Service Unavailable", status=503, headers={'Retry-After': '1'})
         
         return HttpResponse("OK")
     
@@ -178,10 +209,20 @@ def bot_status(request):
                 "total_users": total_users,
                 "active_users": active_users,
                 "total_courses": total_courses,
-                "active_courses": active_courses,
-                "user_states_in_memory": len(bot.user_states),
-                "user_data_in_memory": len(bot.user_data)
-            }
+                "active_courses": active_courses
+            },
+            "state_store": bot.state_store.get_stats(),
+            "activity": get_activity_tracker().get_stats(),
+            "language_cache": get_language_cache_stats(),
+            "keyboards": get_keyboard_cache_stats(),
+            "catalog": catalog.get_stats(),
+            "info_pages": info_pages.get_stats(),
+            "telegram_api": bot.api.metrics.get_stats(),
+            "handlers": bot.handler_metrics.get_stats(),
+            "rate_limiter": bot.api.rate_limiter.get_stats(),
+            "dispatcher": bot.dispatcher.get_stats() if bot.dispatcher else None,
+            "dedupe": bot.deduplicator.get_stats(),
+            "poller": bot.poller.get_stats() if bot.poller else None
         })
         
     except Exception as e:
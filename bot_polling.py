@@ -1,12 +1,13 @@
-import requests
-import time
 import os
+import logging
 import django
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'course_bot_project.settings') 
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'course_bot_project.settings')
 django.setup()
 
 
+from django.core.checks import Tags, run_checks
+
 from bot.bot_manager import BotManager
 from bot.bot_handlers_simple import setup_bot_handlers
 
@@ -14,8 +15,8 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
-API_URL = f'https://api.telegram.org/bot{BOT_TOKEN}'
-OFFSET = None
+
+logger = logging.getLogger('bot')
 
 _bot_instance = None
 
@@ -27,24 +28,13 @@ def get_bot_instance():
         setup_bot_handlers(_bot_instance)
     return _bot_instance
 
-bot = get_bot_instance()   
-
-while True:
-    try:
-        params = {'timeout': 30}
-        if OFFSET:
-            params['offset'] = OFFSET
-    
-        response = requests.get(f'{API_URL}/getUpdates', params=params, timeout=35)
-        result = response.json()
-    
-        if result.get("ok"):
-            updates = result.get("result", [])      
-            for update in updates:
-                bot.process_update(update)
-                OFFSET = update['update_id'] + 1        
-        else:
-            print("Error:", result)
-    except requests.exceptions.RequestException as e:
-        print("Connection error:", e)
+# Те же проверки, что и в manage.py check: ошибка не даёт запустить бота, предупреждение — в лог
+for message in run_checks(tags=[Tags.caches, Tags.translation]):
+    if message.is_serious():
+        raise SystemExit(str(message))
+    logger.warning(str(message))
+
+bot = get_bot_instance()
 
+# Long polling с предвыборкой и параллельной обработкой — см. BotManager.start_polling
+bot.start_polling()
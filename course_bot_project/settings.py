@@ -116,6 +116,49 @@ TELEGRAM_BOT_TOKEN = config('TELEGRAM_BOT_TOKEN', default='')
 TELEGRAM_WEBHOOK_URL = f'{BASE_URL}/bot/webhook/'
 TELEGRAM_ADMIN_CHAT_ID = config('TELEGRAM_ADMIN_CHAT_ID', default='')
 TELEGRAM_CHANNEL_ID = config('TELEGRAM_CHANNEL_ID', default='-1002876330626')
+# Адрес Bot API (для нагрузочных тестов можно указать локальный fake сервер)
+TELEGRAM_API_URL = config('TELEGRAM_API_URL', default='https://api.telegram.org')
+# Бюджет времени (сек) на обработку одного update: после него все вызовы API падают сразу
+TELEGRAM_UPDATE_DEADLINE = config('TELEGRAM_UPDATE_DEADLINE', default=30.0, cast=float)
+# Сколько updates обрабатывается параллельно и сколько может ждать в очереди
+TELEGRAM_WORKERS = config('TELEGRAM_WORKERS', default=8, cast=int)
+TELEGRAM_QUEUE_SIZE = config('TELEGRAM_QUEUE_SIZE', default=1000, cast=int)
+# Сколько webhook ждёт места в очереди, прежде чем ответить 503 (Telegram повторит доставку)
+TELEGRAM_WEBHOOK_QUEUE_TIMEOUT = config('TELEGRAM_WEBHOOK_QUEUE_TIMEOUT', default=0.0, cast=float)
+# Сколько последних update_id помнить, чтобы отсеивать повторные доставки (1 бит на id)
+TELEGRAM_DEDUPE_WINDOW = config('TELEGRAM_DEDUPE_WINDOW', default=100000, cast=int)
+# Long poll timeout для getUpdates (сек)
+TELEGRAM_POLL_TIMEOUT = config('TELEGRAM_POLL_TIMEOUT', default=30, cast=int)
+# Доля запросов к Bot API, параметры которых пишутся в лог на уровне DEBUG (0 — выключено)
+TELEGRAM_DEBUG_SAMPLE_RATE = config('TELEGRAM_DEBUG_SAMPLE_RATE', default=0.0, cast=float)
+# Где хранится состояние диалогов: 'db' (UserState), 'cache' (CACHES['default']) или 'locmem' (один процесс)
+TELEGRAM_STATE_STORE = config('TELEGRAM_STATE_STORE', default='db')
+TELEGRAM_STATE_TTL = config('TELEGRAM_STATE_TTL', default=24 * 3600, cast=int)
+TELEGRAM_STATE_MAX_ENTRIES = config('TELEGRAM_STATE_MAX_ENTRIES', default=10000, cast=int)
+# last_activity пишется пачкой: раз в N секунд или когда накопилось M пользователей
+TELEGRAM_ACTIVITY_FLUSH_INTERVAL = config('TELEGRAM_ACTIVITY_FLUSH_INTERVAL', default=10.0, cast=float)
+TELEGRAM_ACTIVITY_FLUSH_SIZE = config('TELEGRAM_ACTIVITY_FLUSH_SIZE', default=500, cast=int)
+# Кэш языков пользователей в процессе (общий уровень — CACHES['default']);
+# TTL — сколько другой процесс может видеть старый язык после смены
+TELEGRAM_LANGUAGE_CACHE_SIZE = config('TELEGRAM_LANGUAGE_CACHE_SIZE', default=10000, cast=int)
+TELEGRAM_LANGUAGE_CACHE_TTL = config('TELEGRAM_LANGUAGE_CACHE_TTL', default=60, cast=int)
+# Срок жизни записи в общем кэше: ограничивает, сколько живёт язык, записанный гонкой с инвалидацией
+TELEGRAM_LANGUAGE_SHARED_CACHE_TTL = config('TELEGRAM_LANGUAGE_SHARED_CACHE_TTL', default=3600, cast=int)
+# Как часто (сек) проверять по версии в БД, не изменил ли другой процесс каталог курсов
+TELEGRAM_CATALOG_CHECK_INTERVAL = config('TELEGRAM_CATALOG_CHECK_INTERVAL', default=5.0, cast=float)
+# Максимальный возраст снимка каталога (сек) — на случай правок в обход сигналов
+TELEGRAM_CATALOG_MAX_AGE = config('TELEGRAM_CATALOG_MAX_AGE', default=300.0, cast=float)
+
+# Кэш: Redis, если задан REDIS_CACHE_URL (общий для всех воркеров), иначе память процесса
+REDIS_CACHE_URL = config('REDIS_CACHE_URL', default='')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_CACHE_URL,
+    } if REDIS_CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
 
 
 
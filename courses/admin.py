@@ -1,7 +1,9 @@
 # ===== courses/admin.py =====
 
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
+from bot.catalog import invalidate_catalog
 from .models import Course, PaymentMethod
 
 @admin.register(Course)
@@ -46,16 +48,22 @@ class CourseAdmin(admin.ModelAdmin):
     
     def activate_courses(self, request, queryset):
         count = queryset.update(is_active=True)
+        # update() не шлёт post_save — снимок каталога бота сбрасываем сами
+        transaction.on_commit(invalidate_catalog)
         self.message_user(request, f"Активировано {count} курсов.")
     activate_courses.short_description = "Активировать выбранные курсы"
     
     def deactivate_courses(self, request, queryset):
         count = queryset.update(is_active=False)
+        # update() не шлёт post_save — снимок каталога бота сбрасываем сами
+        transaction.on_commit(invalidate_catalog)
         self.message_user(request, f"Деактивировано {count} курсов.")
     deactivate_courses.short_description = "Деактивировать выбранные курсы"
     
     def feature_courses(self, request, queryset):
         count = queryset.update(is_featured=True)
+        # update() не шлёт post_save — снимок каталога бота сбрасываем сами
+        transaction.on_commit(invalidate_catalog)
         self.message_user(request, f"{count} курсов отмечены как рекомендуемые.")
     feature_courses.short_description = "Отметить как рекомендуемые"
 
@@ -0,0 +1,60 @@
+# courses/management/commands/reconcile_course_counts.py
+"""
+Django management команда для сверки Course.approved_count с реальным числом
+подтверждённых платежей (исправляет расхождения, например после правок в БД вручную)
+
+Использование:
+python manage.py reconcile_course_counts
+python manage.py reconcile_course_counts --dry-run
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from courses.models import Course
+from payments.models import Payment
+
+
+class Command(BaseCommand):
+    help = 'Recalculate Course.approved_count from approved payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, не исправляя их'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        fixed = 0
+
+        courses = (
+            Course.objects
+            .annotate(actual=Count('payments', filter=Q(payments__status='approved')))
+            .only('id', 'name_qr', 'approved_count')
+        )
+        # Пересчёт одним UPDATE на курс: платёж, подтверждённый во время сверки, не потеряется
+        actual_count = Coalesce(Subquery(
+            Payment.objects.filter(course=OuterRef('pk'), status='approved')
+            .order_by().values('course').annotate(total=Count('id')).values('total'),
+            output_field=IntegerField()
+        ), Value(0))
+
+        for course in courses:
+            if course.approved_count == course.actual:
+                continue
+            fixed += 1
+            self.stdout.write(
+                f"⚠️ {course.name_qr} (#{course.id}): {course.approved_count} -> {course.actual}"
+            )
+            if not dry_run:
+                Course.objects.filter(pk=course.pk).update(approved_count=actual_count)
+
+        if not fixed:
+            self.stdout.write(self.style.SUCCESS("✅ All course counters are correct"))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(f"Found {fixed} mismatched courses (dry run, nothing changed)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✅ Fixed {fixed} courses"))
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:37
+
+from django.db import migrations, models
+
+
+def fill_approved_count(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Payment = apps.get_model('payments', 'Payment')
+    counts = (
+        Payment.objects.filter(status='approved')
+        .values('course_id').annotate(total=models.Count('id'))
+    )
+    for row in counts:
+        Course.objects.filter(pk=row['course_id']).update(approved_count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_alter_course_options_alter_paymentmethod_options_and_more'),
+        ('payments', '0003_alter_payment_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='approved_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Ведётся автоматически при смене статуса платежей (см. reconcile_course_counts)', verbose_name='Подтверждённых оплат'),
+        ),
+        migrations.RunPython(fill_approved_count, migrations.RunPython.noop),
+    ]
@@ -27,6 +27,10 @@ class Course(models.Model):
     is_featured = models.BooleanField(default=False, verbose_name="Рекомендуемый")
     max_students = models.PositiveIntegerField(blank=True, null=True, verbose_name="Максимум студентов")
     order = models.PositiveIntegerField(default=0, verbose_name="Порядок сортировки")
+    approved_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Подтверждённых оплат",
+        help_text="Ведётся автоматически при смене статуса платежей (см. reconcile_course_counts)"
+    )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
@@ -38,6 +42,26 @@ class Course(models.Model):
     def __str__(self):
         return self.name_qr
 
+    def save(self, *args, **kwargs):
+        # approved_count меняется только через adjust_approved_count(): при сохранении
+        # существующего курса колонка перезаписывается своим же значением из БД (F),
+        # а не устаревшим значением из объекта; update_fields вызывающего не трогаем
+        update_fields = kwargs.get('update_fields')
+        keep_count = bool(self.pk) and not self._state.adding and (
+            update_fields is None or 'approved_count' in update_fields
+        )
+        if keep_count:
+            self.approved_count = models.F('approved_count')
+        super().save(*args, **kwargs)
+        if keep_count:
+            self.refresh_from_db(fields=['approved_count'])
+
+    @classmethod
+    def adjust_approved_count(cls, course_id: int, delta: int):
+        """Атомарно изменить счётчик подтверждённых оплат курса"""
+        if delta:
+            cls.objects.filter(pk=course_id).update(approved_count=models.F('approved_count') + delta)
+
     def get_name(self, lang_code: str):
         return getattr(self, f'name_{lang_code}', self.name_qr)
 
@@ -46,8 +70,8 @@ class Course(models.Model):
 
     @property
     def current_students_count(self):
-        # Bu funkciya iskerligine tásir etpeydi, ózgerissiz qaladı
-        return self.payments.filter(status='approved').count()
+        # Denormalizaciyalanǵan esaplaǵısh: COUNT sorawı joq
+        return self.approved_count
 
     @property
     def is_available(self):
@@ -1,3 +1,45 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.admin.sites import AdminSite
+from django.test import RequestFactory, TestCase
+
+from bot.catalog import Catalog
+
+from .admin import CourseAdmin
+from .models import Course
+
+
+def make_course(**fields) -> Course:
+    values = {
+        'name_qr': 'Kurs', 'name_uz': 'Kurs UZ', 'description_qr': 'd', 'description_uz': 'd',
+        'price': 100, 'group_link': 'https://t.me/+group',
+    }
+    values.update(fields)
+    return Course.objects.create(**values)
+
+
+class CourseAdminActionTests(TestCase):
+
+    def setUp(self):
+        self.admin = CourseAdmin(Course, AdminSite())
+        self.request = RequestFactory().post('/')
+        self.course = make_course()
+
+    def test_bulk_deactivate_refreshes_catalog(self):
+        catalog = Catalog(check_interval=0)
+        self.assertEqual(len(catalog.get('qr').courses), 1)
+
+        with mock.patch.object(self.admin, 'message_user'), self.captureOnCommitCallbacks(execute=True):
+            self.admin.deactivate_courses(self.request, Course.objects.all())
+
+        self.assertEqual(catalog.get('qr').courses, ())
+
+    def test_bulk_activate_refreshes_catalog(self):
+        Course.objects.update(is_active=False)
+        catalog = Catalog(check_interval=0)
+        self.assertEqual(catalog.get('qr').courses, ())
+
+        with mock.patch.object(self.admin, 'message_user'), self.captureOnCommitCallbacks(execute=True):
+            self.admin.activate_courses(self.request, Course.objects.all())
+
+        self.assertEqual([course.id for course in catalog.get('qr').courses], [self.course.id])
@@ -187,32 +187,34 @@ class PaymentAdmin(admin.ModelAdmin):
         if payment.status != 'approved':
             messages.error(request, "Можно отправлять ссылки только для одобренных платежей")
         else:
-            # Отправляем ссылку
-            self.send_bot_notification(payment, approved=True, force_send_link=True)
-            payment.link_sent = True
-            payment.save()
-            messages.success(request, f"Ссылка отправлена пользователю {payment.user.full_name}")
+            # Отправляем ссылку (link_sent ставится только после успешной отправки)
+            if self.send_bot_notification(payment, approved=True, force_send_link=True):
+                messages.success(request, f"Ссылка отправлена пользователю {payment.user.full_name}")
+            else:
+                messages.error(request, f"Не удалось отправить ссылку пользователю {payment.user.full_name}")
         
         return redirect('admin:payments_payment_changelist')
     
     def send_bot_notification(self, payment, approved, force_send_link=False):
-        """Отправить уведомление через бота"""
+        """Отправить уведомление через бота; True — сообщение доставлено"""
         try:
             from bot.bot_manager import BotManager
             from bot.payment_handlers import send_payment_result_to_user
             
             if not settings.TELEGRAM_BOT_TOKEN:
-                return
+                return False
             
             bot = BotManager(settings.TELEGRAM_BOT_TOKEN)
             
             if force_send_link or not (payment.notification.user_notified_approved if approved else payment.notification.user_notified_rejected):
-                send_payment_result_to_user(bot, payment, approved)
+                return send_payment_result_to_user(bot, payment, approved)
+            return False
                 
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
             logger.error(f"Error sending bot notification: {e}")
+            return False
     
     def send_test_notification(self, request):
         """Тестовое уведомление"""
@@ -242,33 +244,75 @@ class PaymentAdmin(admin.ModelAdmin):
     def approve_payments(self, request, queryset):
         """Массовое одобрение платежей"""
         count = 0
+        payments = []
         for payment in queryset.filter(status='pending'):
             payment.approve(admin_user=request.user)
-            self.send_bot_notification(payment, approved=True)
+            payments.append(payment)
             count += 1
         
-        self.message_user(request, f"Одобрено {count} платежей.")
+        sent = self.send_bulk_notifications(payments, approved=True)
+        self.message_user(request, f"Одобрено {count} платежей, уведомлено {sent} пользователей.")
     approve_payments.short_description = "✅ Одобрить выбранные платежи"
     
     def reject_payments(self, request, queryset):
         """Массовое отклонение платежей"""
         count = 0
+        payments = []
         for payment in queryset.filter(status='pending'):
             payment.reject(admin_user=request.user)
-            self.send_bot_notification(payment, approved=False)
+            payments.append(payment)
             count += 1
         
-        self.message_user(request, f"Отклонено {count} платежей.")
+        sent = self.send_bulk_notifications(payments, approved=False)
+        self.message_user(request, f"Отклонено {count} платежей, уведомлено {sent} пользователей.")
     reject_payments.short_description = "❌ Отклонить выбранные платежи"
     
+    def send_bulk_notifications(self, payments, approved):
+        """Отправить уведомления сразу по нескольким платежам одним send_many"""
+        import logging
+        logger = logging.getLogger(__name__)
+        
+        if not payments or not settings.TELEGRAM_BOT_TOKEN:
+            return 0
+        
+        try:
+            from bot.bot_manager import BotManager
+            from bot.payment_handlers import build_payment_result_message, mark_payment_result_sent
+            
+            bot = BotManager(settings.TELEGRAM_BOT_TOKEN)
+            by_id = {payment.id: payment for payment in payments}
+            
+            messages = []
+            for payment in payments:
+                try:
+                    notified = (payment.notification.user_notified_approved if approved
+                                else payment.notification.user_notified_rejected)
+                    if not notified:
+                        messages.append(build_payment_result_message(payment, approved))
+                except Exception as e:
+                    logger.error(f"Error preparing bot notification for payment #{payment.id}: {e}")
+            
+            sent = 0
+            for result in bot.api.send_many(messages):
+                if result.ok:
+                    # Флаги уведомления — только для чатов, куда сообщение реально дошло
+                    mark_payment_result_sent(by_id[result.message['key']], approved)
+                    sent += 1
+                else:
+                    logger.error(f"Error sending bot notification for payment #{result.message['key']}: "
+                                 f"{result.status} {result.error}")
+            return sent
+            
+        except Exception as e:
+            logger.error(f"Error sending bulk bot notifications: {e}")
+            return 0
+    
     def send_links(self, request, queryset):
         """Массовая отправка ссылок"""
         count = 0
         for payment in queryset.filter(status='approved', link_sent=False):
-            self.send_bot_notification(payment, approved=True, force_send_link=True)
-            payment.link_sent = True
-            payment.save()
-            count += 1
+            if self.send_bot_notification(payment, approved=True, force_send_link=True):
+                count += 1
         
         self.message_user(request, f"Отправлено {count} ссылок.")
     send_links.short_description = "🔗 Отправить ссылки на группы"
@@ -1,7 +1,7 @@
 # payments/models.py
 
 import os
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 from decimal import Decimal
@@ -105,6 +105,29 @@ class Payment(models.Model):
     def __str__(self):
         return f"{self.user} - {self.course.name} ({self.get_status_display()})"
 
+    def save(self, *args, **kwargs):
+        """Сохранить платёж и поправить Course.approved_count в той же транзакции"""
+        with transaction.atomic():
+            # Дельта считается по строке в БД до и после сохранения (под блокировкой строки),
+            # а не по полям объекта: save(update_fields=...) может не записать status/course
+            previous = None
+            if self.pk and not self._state.adding:
+                previous = self._counted_course()
+            super().save(*args, **kwargs)
+            current = self._counted_course()
+            if previous != current:
+                if previous:
+                    Course.adjust_approved_count(previous, -1)
+                if current:
+                    Course.adjust_approved_count(current, 1)
+
+    def _counted_course(self):
+        """ID курса, в approved_count которого сейчас учтена строка платежа в БД, иначе None"""
+        row = Payment.objects.select_for_update().filter(pk=self.pk).values_list(
+            'course_id', 'status'
+        ).first()
+        return row[0] if row and row[1] == 'approved' else None
+
     def approve(self, admin_user=None):
         """Подтвердить платеж"""
         self.status = 'approved'
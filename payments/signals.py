@@ -0,0 +1,22 @@
+# payments/signals.py
+# Поддержка Course.approved_count при удалении платежей (в том числе через queryset.delete)
+
+from django.db.models.signals import post_delete, pre_delete
+
+from courses.models import Course
+from .models import Payment
+
+
+def payment_deleting(sender, instance, **kwargs):
+    # Статус берём из строки в БД (под блокировкой), а не из возможно устаревшего объекта
+    instance._counted_course_id = instance._counted_course()
+
+
+def payment_deleted(sender, instance, **kwargs):
+    course_id = getattr(instance, '_counted_course_id', None)
+    if course_id:
+        Course.adjust_approved_count(course_id, -1)
+
+
+pre_delete.connect(payment_deleting, sender=Payment, dispatch_uid='payment_approved_count_pre_delete')
+post_delete.connect(payment_deleted, sender=Payment, dispatch_uid='payment_approved_count_delete')
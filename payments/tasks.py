@@ -3,6 +3,7 @@ from celery import shared_task
 from .models import Advertisement, TelegramUser
 from django.conf import settings
 from bot.bot_manager import BotManager
+from bot.media_cache import CachedMedia
 from django.utils import timezone
 
 @shared_task
@@ -23,26 +24,26 @@ def send_advertisement_task(ad_id):
             }]]
         }
 
+    # Rasm Telegram-ga bir marta yuklanadi, keyin file_id orqali yuboriladi
+    image = CachedMedia(ad, 'image') if ad.image else None
+
+    # Generator alohida oqimda o'qiladi, shuning uchun chat_id lar oldindan olinadi
+    chat_ids = list(users.values_list('chat_id', flat=True))
+
+    def messages():
+        for chat_id in chat_ids:
+            if image:
+                yield {'chat_id': chat_id, 'photo': image, 'caption': ad.text, 'reply_markup': reply_markup}
+            else:
+                yield {'chat_id': chat_id, 'text': ad.text, 'reply_markup': reply_markup}
+
     n = 0
     k = 0
 
-    for user in users:
-        try:
-            if ad.image:
-                bot.send_photo(
-                    chat_id=user.chat_id,
-                    photo=f'{settings.BASE_URL}{ad.image.url}',
-                    caption=ad.text,
-                    reply_markup=reply_markup
-                )
-            else:
-                bot.send_message(
-                    chat_id=user.chat_id,
-                    text=ad.text,
-                    reply_markup=reply_markup
-                )
+    for result in bot.api.send_many(messages()):
+        if result.ok:
             n += 1
-        except:
+        else:
             k += 1
 
     ad.is_sent = True
@@ -1,3 +1,165 @@
-from django.test import TestCase
+from importlib import import_module
+from io import StringIO
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.admin.sites import AdminSite
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from bot.fake_telegram import FakeTelegramServer
+from bot.models import TelegramUser
+from bot.payment_handlers import build_payment_result_message
+from courses.models import Course
+from courses.tests import make_course
+
+from .admin import PaymentAdmin
+from .models import Payment, PaymentNotification
+
+fill_approved_count = import_module('courses.migrations.0005_course_approved_count').fill_approved_count
+
+
+class ApprovedCountTests(TestCase):
+
+    def setUp(self):
+        self.course = make_course()
+        self.user = TelegramUser.objects.create(chat_id=1001, first_name='Test')
+
+    def make_payment(self, **fields) -> Payment:
+        values = {'user': self.user, 'course': self.course, 'amount': 100, 'receipt_file': 'receipts/r.jpg'}
+        values.update(fields)
+        return Payment.objects.create(**values)
+
+    def count(self, course=None) -> int:
+        return Course.objects.values_list('approved_count', flat=True).get(pk=(course or self.course).pk)
+
+    def test_status_transitions(self):
+        payment = self.make_payment()
+        self.assertEqual(self.count(), 0)
+
+        payment.approve()
+        self.assertEqual(self.count(), 1)
+        payment.approve()
+        self.assertEqual(self.count(), 1)
+
+        payment.reject()
+        self.assertEqual(self.count(), 0)
+
+    def test_created_approved(self):
+        self.make_payment(status='approved')
+        self.assertEqual(self.count(), 1)
+
+    def test_course_change_moves_count(self):
+        other = make_course(name_qr='Basqa')
+        payment = self.make_payment(status='approved')
+
+        payment.course = other
+        payment.save()
+
+        self.assertEqual((self.count(), self.count(other)), (0, 1))
+
+    def test_delta_follows_database_row(self):
+        payment = self.make_payment()
+        payment.status = 'approved'
+        payment.link_sent = True
+        payment.save(update_fields=['link_sent'])
+        self.assertEqual(self.count(), 0)
+
+        stale = Payment.objects.get(pk=payment.pk)
+        payment.approve()
+        stale.comment = 'eski obyekt'
+        stale.save(update_fields=['comment'])
+        self.assertEqual(self.count(), 1)
+
+    def test_delete(self):
+        approved = self.make_payment(status='approved')
+        self.make_payment(status='approved')
+        self.make_payment()
+
+        approved.delete()
+        self.assertEqual(self.count(), 1)
+
+        Payment.objects.all().delete()
+        self.assertEqual(self.count(), 0)
+
+    def test_delete_stale_instance(self):
+        stale = self.make_payment()
+        Payment.objects.get(pk=stale.pk).approve()
+
+        stale.delete()
+
+        self.assertEqual(self.count(), 0)
+
+    def test_course_save_keeps_counter(self):
+        stale = Course.objects.get(pk=self.course.pk)
+        self.make_payment(status='approved')
+
+        stale.name_qr = 'Jańa atı'
+        stale.save()
+
+        self.assertEqual(stale.approved_count, 1)
+        self.assertEqual(self.count(), 1)
+
+    def test_migration_backfill(self):
+        self.make_payment(status='approved')
+        self.make_payment(status='approved')
+        self.make_payment(status='rejected')
+        Course.objects.update(approved_count=0)
+
+        fill_approved_count(apps, None)
+
+        self.assertEqual(self.count(), 2)
+
+    def test_reconcile_command(self):
+        self.make_payment(status='approved')
+        Course.objects.update(approved_count=5)
+
+        out = StringIO()
+        call_command('reconcile_course_counts', '--dry-run', stdout=out)
+        self.assertIn('5 -> 1', out.getvalue())
+        self.assertEqual(self.count(), 5)
+
+        call_command('reconcile_course_counts', stdout=StringIO())
+        self.assertEqual(self.count(), 1)
+
+        out = StringIO()
+        call_command('reconcile_course_counts', stdout=out)
+        self.assertIn('All course counters are correct', out.getvalue())
+
+
+class PaymentResultNotificationTests(TestCase):
+
+    def setUp(self):
+        self.server = FakeTelegramServer().start()
+        self.addCleanup(self.server.stop)
+        settings_override = override_settings(TELEGRAM_BOT_TOKEN='test-payment-result', TELEGRAM_API_URL=self.server.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        course = make_course()
+        self.payments = []
+        for chat_id in (2001, 2002):
+            user = TelegramUser.objects.create(chat_id=chat_id, first_name='Test', language='qr')
+            payment = Payment.objects.create(
+                user=user, course=course, amount=100, receipt_file='receipts/r.jpg', status='approved'
+            )
+            PaymentNotification.objects.create(payment=payment)
+            self.payments.append(payment)
+
+    def flags(self, payment):
+        payment = Payment.objects.select_related('notification').get(pk=payment.pk)
+        return payment.link_sent, payment.notification.user_notified_approved
+
+    def test_building_the_message_changes_nothing(self):
+        params = build_payment_result_message(self.payments[0], approved=True)
+
+        self.assertEqual(params['chat_id'], 2001)
+        self.assertEqual(self.flags(self.payments[0]), (False, False))
+
+    def test_bulk_notification_marks_only_delivered_chats(self):
+        self.server.block_chat(2002)
+
+        sent = PaymentAdmin(Payment, AdminSite()).send_bulk_notifications(self.payments, approved=True)
+
+        self.assertEqual(sent, 1)
+        self.assertEqual(self.flags(self.payments[0]), (True, True))
+        self.assertEqual(self.flags(self.payments[1]), (False, False))
@@ -62,7 +62,7 @@ def main():
         print("❌ Для остановки нажмите Ctrl+C")
         print("-" * 50)
         
-        bot.start_polling(interval=1.0)
+        bot.start_polling()
         
     except KeyboardInterrupt:
         print("\n⏹️  Остановка бота...")